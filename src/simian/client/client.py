@@ -22,11 +22,15 @@
 
 
 import datetime
+import email.utils
+import hashlib
 import httplib
+import json
 import logging
 import mimetools
 import os
 import platform
+import random
 import subprocess
 import sys
 import tempfile
@@ -58,7 +62,17 @@ else:
 
 
 DEFAULT_HTTP_ATTEMPTS = 4
-DEFAULT_RETRY_HTTP_STATUS_CODES = frozenset([500, 502, 503, 504])
+DEFAULT_RETRY_HTTP_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+# Statuses whose Retry-After header, if any, is honored.
+RETRY_AFTER_HTTP_STATUS_CODES = frozenset([429, 503])
+# Retries wait a random time up to BACKOFF_BASE_SECS, doubling with every
+# attempt up to BACKOFF_MAX_SECS, so clients don't retry in lockstep.
+BACKOFF_BASE_SECS = 5
+BACKOFF_MAX_SECS = 120
+# Requests asked to Retry-After longer than this are not retried.
+MAX_RETRY_AFTER_SECS = 600
+# Max number of retries of all requests made by a client instance.
+DEFAULT_RETRY_BUDGET = 10
 SERVER_HOSTNAME = settings.SERVER_HOSTNAME
 SERVER_PORT = settings.SERVER_PORT
 AUTH_DOMAIN = settings.AUTH_DOMAIN
@@ -406,6 +420,32 @@ class HTTPSMultiBodyConnection(MultiBodyConnection, httplib.HTTPSConnection):
 
 
 
+def GetRetryAfter(headers, now=None):
+  """Returns the seconds to wait given by a Retry-After response header.
+
+  Args:
+    headers: dict of response headers, or None.
+    now: float, optional, supply an alternative time.time() value.
+  Returns:
+    int seconds, or None if there is no valid Retry-After header.
+  """
+  value = None
+  for k, v in (headers or {}).iteritems():
+    if k.lower() == 'retry-after':
+      value = v.strip()
+  if not value:
+    return None
+  if value.isdigit():
+    return int(value)
+  # Retry-After may also be an HTTP date.
+  parsed = email.utils.parsedate_tz(value)
+  if parsed is None:
+    return None
+  if now is None:
+    now = time.time()
+  return max(0, int(email.utils.mktime_tz(parsed) - now))
+
+
 class HttpsClient(object):
   """Connect to a http or https service.
 
@@ -417,6 +457,7 @@ class HttpsClient(object):
     self._LoadHost(hostname, port, proxy)
     self._progress_callback = None
     self._ca_cert_chain = None
+    self._retry_budget = DEFAULT_RETRY_BUDGET
 
   def SetProgressCallback(self, fn):
     self._progress_callback = fn
@@ -639,6 +680,43 @@ class HttpsClient(object):
     except IOError as e:
       raise HTTPError(str(e))
 
+  def _GetRetryDelay(self, attempt, attempt_times, response=None):
+    """Returns the seconds to wait before retrying a request.
+
+    Delays use exponential backoff with full jitter, or the Retry-After of the
+    response if there is one. Every retry uses up one of the retry budget of
+    this client, so a client gives up quickly while a server is down.
+
+    Args:
+      attempt: int, number of attempts made so far.
+      attempt_times: int, max number of attempts.
+      response: Response instance of the last attempt, or None if it failed
+          with a connection level error.
+    Returns:
+      float seconds, or None if the request should not be retried.
+    """
+    if attempt >= attempt_times:
+      return None
+    if self._retry_budget <= 0:
+      logging.warning('Retry budget exhausted, not retrying.')
+      return None
+
+    retry_after = None
+    if response is not None and (
+        response.status in RETRY_AFTER_HTTP_STATUS_CODES):
+      retry_after = GetRetryAfter(response.headers)
+      if retry_after is not None and retry_after > MAX_RETRY_AFTER_SECS:
+        logging.warning(
+            'Retry-After %ds is too long, not retrying.', retry_after)
+        return None
+
+    self._retry_budget -= 1
+    if retry_after is not None:
+      # spread out clients told to retry at the same time.
+      return retry_after + random.uniform(0, BACKOFF_BASE_SECS)
+    return random.uniform(
+        0, min(BACKOFF_MAX_SECS, BACKOFF_BASE_SECS * 2 ** (attempt - 1)))
+
   def Do(
       self, method, url,
       body=None, headers=None, output_filename=None,
@@ -674,8 +752,7 @@ class HttpsClient(object):
       output_file = None
 
     n = 0
-    while n < attempt_times:
-      time.sleep(n * 5)
+    while True:
       n += 1
       logging.debug('Do(%s, %s) try #%d', method, url, n)
       try:
@@ -683,12 +760,17 @@ class HttpsClient(object):
             method, url, body=body, headers=headers, output_file=output_file)
       except HTTPError:
         logging.warning('HTTPError in Do(%s, %s)', method, url)
-        if n == attempt_times:
+        delay = self._GetRetryDelay(n, attempt_times)
+        if delay is None:
           raise
       else:
         if response.status not in retry_on_status:
           break
         logging.warning('Retry status hit for Do(%s, %s)', method, url)
+        delay = self._GetRetryDelay(n, attempt_times, response=response)
+        if delay is None:
+          break
+      time.sleep(delay)
 
     if output_filename:
       output_file.close()
@@ -1247,6 +1329,9 @@ class HttpsAuthClient(HttpsClient):
 class SimianClient(HttpsAuthClient):
   """Client to connect to Simian server."""
 
+  RESPONSE_CACHE_OSX_PATH = '/Library/Managed Installs/simian_cache'
+  RESPONSE_CACHE_DEFAULT_PATH = None  # cached in memory only
+
   def __init__(self, hostname=None, port=None, root_ok=False):
     if hostname is None:
       hostname = SERVER_HOSTNAME
@@ -1266,6 +1351,16 @@ class SimianClient(HttpsAuthClient):
 
     super(SimianClient, self).__init__(hostname, port)
 
+  def _PlatformSetup(self):
+    """Platform specific instance setup."""
+    super(SimianClient, self)._PlatformSetup()
+    if platform.system() == 'Darwin':
+      self.response_cache_path = self.RESPONSE_CACHE_OSX_PATH
+    else:
+      self.response_cache_path = self.RESPONSE_CACHE_DEFAULT_PATH
+    # str url to dict of cached response, see _LoadCachedResponse().
+    self._response_cache = {}
+
   def IsDefaultHostClient(self):
     """Returns True if the client was initialized with default hostname."""
     return self._default_hostname
@@ -1315,13 +1410,114 @@ class SimianClient(HttpsAuthClient):
     else:
       return os.getenv('LOGNAME')
 
+  def _GetResponseCacheFilename(self, url):
+    """Returns the str filename caching the response of a url."""
+    key = '%s:%s%s' % (self.hostname, self.port, url)
+    return os.path.join(
+        self.response_cache_path, hashlib.sha256(key).hexdigest())
+
+  def _LoadCachedResponse(self, url):
+    """Returns the cached response of a url.
+
+    Args:
+      url: str, url like '/catalogs/stable'.
+    Returns:
+      dict with etag, last_modified and body keys, or None if not cached.
+    """
+    cached = self._response_cache.get(url)
+    if cached is not None or self.response_cache_path is None:
+      return cached
+
+    filename = self._GetResponseCacheFilename(url)
+    try:
+      if os.stat(filename).st_uid != os.geteuid():
+        # don't trust a cache written by anyone else.
+        logging.info('Untrusted response cache %s, ignoring', filename)
+        return None
+      f = open(filename, 'r')
+      try:
+        cached = json.loads(f.readline())
+        cached['body'] = f.read()
+      finally:
+        f.close()
+    except (IOError, OSError, ValueError), e:
+      logging.debug('No response cache for %s: %s', url, str(e))
+      return None
+    self._response_cache[url] = cached
+    return cached
+
+  def _SaveCachedResponse(self, url, cached):
+    """Caches the response of a url.
+
+    Args:
+      url: str, url like '/catalogs/stable'.
+      cached: dict with etag, last_modified and body keys.
+    """
+    self._response_cache[url] = cached
+    if self.response_cache_path is None:
+      return
+
+    validators = dict((k, v) for k, v in cached.iteritems() if k != 'body')
+    try:
+      if not os.path.isdir(self.response_cache_path):
+        os.makedirs(self.response_cache_path, 0700)
+      fd, tmp_filename = tempfile.mkstemp(dir=self.response_cache_path)
+      f = os.fdopen(fd, 'w')
+      try:
+        f.write('%s\n' % json.dumps(validators))
+        f.write(cached['body'])
+      finally:
+        f.close()
+      os.rename(tmp_filename, self._GetResponseCacheFilename(url))
+    except (IOError, OSError), e:
+      logging.warning('Error writing response cache for %s: %s', url, str(e))
+
+  def _ConditionalGet(self, url):
+    """GET a url, reusing its cached body if the server says it's unchanged.
+
+    Args:
+      url: str, url like '/catalogs/stable'.
+    Returns:
+      str, body of the url.
+    Raises:
+      SimianServerError: if the Simian server returned an error.
+    """
+    cached = self._LoadCachedResponse(url)
+    headers = {}
+    if cached:
+      if cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+      if cached.get('last_modified'):
+        headers['If-Modified-Since'] = cached['last_modified']
+
+    try:
+      response = self.Do('GET', url, headers=headers)
+    except HTTPError, e:
+      raise SimianServerError(str(e))
+
+    if cached and response.status == httplib.NOT_MODIFIED:
+      logging.debug('Using cached response for %s', url)
+      return cached['body']
+    if not response.IsSuccess():
+      raise SimianServerError(response.status, response.reason, response.body)
+
+    response_headers = dict(
+        (k.lower(), v) for k, v in (response.headers or {}).iteritems())
+    etag = response_headers.get('etag')
+    last_modified = response_headers.get('last-modified')
+    if etag or last_modified:
+      self._SaveCachedResponse(url, {
+          'etag': etag, 'last_modified': last_modified,
+          'body': response.body})
+    return response.body
+
   def GetCatalog(self, name):
-    """Get a catalog."""
-    return self._SimianRequest('GET', '/catalog/%s' % name)
+    """Get a catalog, revalidating any locally cached copy."""
+    return self._ConditionalGet('/catalogs/%s' % name)
 
   def GetManifest(self, name):
-    """Get a manifest."""
-    return self._SimianRequest('GET', '/manifest/%s' % name)
+    """Get a manifest, revalidating any locally cached copy."""
+    return self._ConditionalGet('/manifests/%s' % name)
 
   def GetPackage(self, name, output_filename=None):
     """Get a package.
@@ -97,6 +97,8 @@ def GetMenu():
             'name': 'Lock Admin'},
            {'type': 'release_report', 'url': '/admin/release_report',
             'name': 'Release Report'},
+           {'type': 'rpc_stats', 'url': '/admin/rpc_stats',
+            'name': 'RPC Stats'},
            {'type': 'panic', 'url': '/admin/panic', 'name': 'Panic Mode'}
        ]},
       {'type': 'tags', 'url': '/admin/tags', 'name': 'Tags'},
@@ -181,14 +183,19 @@ class AdminHandler(webapp2.RequestHandler):
       self._is_admin = auth.IsAdminUser()
     return self._is_admin
 
-  def Paginate(self, query, default_limit):
-    """Returns a list of entities limited to limit, with a next_page cursor."""
+  def GetPageLimit(self, default_limit):
+    """Returns the int page size requested, or default_limit if invalid."""
     try:
       limit = int(self.request.get('limit', default_limit))
     except ValueError:
       limit = default_limit
     if limit not in QUERY_LIMITS:
       limit = default_limit
+    return limit
+
+  def Paginate(self, query, default_limit):
+    """Returns a list of entities limited to limit, with a next_page cursor."""
+    limit = self.GetPageLimit(default_limit)
 
     cursor = self.request.get('page', '')
     if cursor:
@@ -163,6 +163,8 @@ class AppleSUSAdmin(admin.AdminHandler):
     # queued to do so.
     for track in changed_tracks:
       deferred.defer(applesus.GenerateAppleSUSCatalogs, track=track, delay=180)
+    # Any product put changes its mtime, and therefore its auto-promote dates.
+    deferred.defer(applesus.GenerateAppleSUSPromotionSchedule)
     # TODO(user): add a visual cue to UI so admins know a generation is pending.
 
     self.response.headers['Content-Type'] = 'application/json'
@@ -188,14 +190,12 @@ class AppleSUSAdmin(admin.AdminHandler):
 
   def _DisplayMain(self):
     query = models.AppleSUSProduct.AllActive().order('-apple_mtime')
+    schedule = applesus.GetAppleSUSPromotionSchedule()['products']
     products = []
-    # NOTE(user): the following adds about 700ms onto the request, so we may
-    #             want to pre-calculate this in a cron in the future.
     for p in gae_util.QueryIterator(query, step=100):
-      if common.STABLE not in p.tracks:
-        p.stable_promote_date = applesus.GetAutoPromoteDate(common.STABLE, p)
-      if common.TESTING not in p.tracks:
-        p.testing_promote_date = applesus.GetAutoPromoteDate(common.TESTING, p)
+      promote_dates = schedule.get(p.product_id, {})
+      p.stable_promote_date = promote_dates.get(common.STABLE)
+      p.testing_promote_date = promote_dates.get(common.TESTING)
       products.append(p)
 
     catalogs = []
@@ -21,6 +21,7 @@ import json
 import os
 
 from google.appengine.api import users
+from google.appengine.ext import deferred
 
 from simian.auth import x509
 
@@ -28,6 +29,7 @@ from simian import settings as settings_module
 from simian.mac import admin
 from simian.mac import models
 from simian.mac.admin import xsrf
+from simian.mac.common import applesus
 from simian.mac.common import mail
 
 MISSING = 'Missing'
@@ -117,6 +119,7 @@ class Config(admin.AdminHandler):
         except (TypeError, ValueError), e:
           self.error(httplib.BAD_REQUEST)
           self.response.out.write(json.dumps({'error': str(e)}))
+          return
         else:
           new_value = getattr(settings_module, setting.upper())
           self.response.out.write(json.dumps(
@@ -142,6 +145,10 @@ class Config(admin.AdminHandler):
       self.error(httplib.BAD_REQUEST)
       self.response.out.write(json.dumps(
           {'error': 'Trying to set invalid setting.'}))
+      return
+
+    if setting in applesus.AUTO_PROMOTE_SETTINGS:
+      deferred.defer(applesus.GenerateAppleSUSPromotionSchedule)
 
   def _GetPems(self, pem_settings=None):
     """Returns a dictionary of PEM validation."""
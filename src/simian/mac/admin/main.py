@@ -36,6 +36,7 @@ from simian.mac.admin import package_alias
 from simian.mac.admin import packages
 from simian.mac.admin import panic
 from simian.mac.admin import release_report
+from simian.mac.admin import rpc_stats
 from simian.mac.admin import summary
 from simian.mac.admin import tags
 from simian.mac.admin import upload_icon
@@ -68,6 +69,8 @@ app = webapp2.WSGIApplication([
 
     (r'/admin/release_report/?$', release_report.ReleaseReport),
 
+    (r'/admin/rpc_stats/?$', rpc_stats.RpcStats),
+
     (r'/admin/manifest_modifications/?$',
      manifest_modifications.ManifestModifications),
 
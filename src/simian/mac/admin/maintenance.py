@@ -51,6 +51,9 @@ from simian.mac.cron import reports_cache
 
 
 INSTALL_LOG_MAX_FETCH = 2000
+MSU_USER_SUMMARY_USERS_PER_TASK = 100
+MSU_USER_SUMMARY_FINISH_DELAY_SECS = 60
+COMPUTER_SEARCH_INDEX_PER_TASK = 500
 
 
 def RebuildInstallCounts():
@@ -61,10 +64,80 @@ def RebuildInstallCounts():
   cursor_obj = models.KeyValueCache.get_by_key_name('pkgs_list_cursor')
   if cursor_obj:
     cursor_obj.delete()
-  models.ReportsCache.SetInstallCounts({})
+  shard_keys = list(models.InstallCountShard.all(keys_only=True))
+  gae_util.BatchDatastoreOp(models.db.delete, shard_keys, 100)
+  models.ReportsCache.SetInstallCountsState({}, None)
   deferred.defer(reports_cache._GenerateInstallCounts)
 
 
+def _GetMsuUserLogs(user):
+  """Returns dict of all ComputerMSULog entries of a user; see MsuUserState."""
+  logs = {}
+  query = models.ComputerMSULog.all().filter('user =', user)
+  for log in gae_util.QueryIterator(query):
+    logs[str(log.key())] = models.MsuUserState.GetEntry(log)
+  return logs
+
+
+def RebuildMsuUserSummary(cursor=None, generation=None):
+  """Rebuilds MSU user summary buckets from all ComputerMSULog entities.
+
+  Users are counted into a new generation of buckets, which replaces the
+  current one once all users are counted; see FinishMsuUserSummaryRebuild().
+  """
+  if generation is None:
+    generation = models.MsuUserSummaryBucket.StartGeneration()
+  query = models.db.Query(
+      models.ComputerMSULog, projection=('user',), distinct=True)
+  if cursor:
+    query.with_cursor(cursor)
+
+  users = query.fetch(MSU_USER_SUMMARY_USERS_PER_TASK)
+  for user in users:
+    models.MsuUserState.Rebuild(
+        user.user, _GetMsuUserLogs(user.user), generation)
+
+  if len(users) == MSU_USER_SUMMARY_USERS_PER_TASK:
+    deferred.defer(
+        RebuildMsuUserSummary, cursor=query.cursor(), generation=generation)
+  else:
+    # let puts which read the generations before the rebuild started commit.
+    deferred.defer(
+        FinishMsuUserSummaryRebuild, generation,
+        _countdown=MSU_USER_SUMMARY_FINISH_DELAY_SECS)
+
+
+def FinishMsuUserSummaryRebuild(generation, cursor=None):
+  """Counts users missed by a rebuild, then makes its generation current."""
+  query = models.MsuUserState.all(keys_only=True).filter(
+      'generation <', generation)
+  if cursor:
+    query.with_cursor(cursor)
+
+  keys = query.fetch(MSU_USER_SUMMARY_USERS_PER_TASK)
+  for key in keys:
+    models.MsuUserState.Rebuild(
+        key.name(), _GetMsuUserLogs(key.name()), generation)
+
+  if len(keys) == MSU_USER_SUMMARY_USERS_PER_TASK:
+    deferred.defer(
+        FinishMsuUserSummaryRebuild, generation, cursor=query.cursor())
+  else:
+    models.MsuUserSummaryBucket.FinishGeneration(generation)
+
+
+def RebuildComputerSearchIndex(cursor=None):
+  """Puts all Computer entities into the computer search index."""
+  query = models.Computer.all()
+  if cursor:
+    query.with_cursor(cursor)
+  computers = query.fetch(COMPUTER_SEARCH_INDEX_PER_TASK)
+  if not computers:
+    return
+  models.computer_search.IndexComputers(computers)
+  deferred.defer(RebuildComputerSearchIndex, cursor=query.cursor())
+
+
 def UpdateInstallLogSchema(cursor=None, num_updated=0):
   """Puts all InstallLog entities so any new properties are created."""
   q = models.InstallLog.all()
@@ -23,7 +23,6 @@ from simian.mac import admin
 from simian.mac import models
 from simian.mac.admin import maintenance
 from simian.mac.common import auth
-from simian.mac.common import util
 from simian.mac.munki import common
 
 
@@ -89,6 +88,10 @@ class Misc(admin.AdminHandler):
         maintenance.UpdateInstallLogSchema()
       elif action == 'rebuild_install_counts':
         maintenance.RebuildInstallCounts()
+      elif action == 'rebuild_msu_user_summary':
+        maintenance.RebuildMsuUserSummary()
+      elif action == 'rebuild_computer_search_index':
+        maintenance.RebuildComputerSearchIndex()
       else:
         self.response.set_status(httplib.NOT_FOUND)
     else:
@@ -188,17 +191,15 @@ class Misc(admin.AdminHandler):
     """Displays a summary of MSU logs."""
     summaries = []
     for since_days in None, 7, 1:
-      key = 'msu_user_summary'
       if since_days:
-        key = '%s_since_%sD_' % (key, since_days)
         human_since = '%s day(s)' % since_days
       else:
         human_since = 'forever'
 
-      m = models.ReportsCache.get_by_key_name(key)
-      if not m or not m.blob_value:
+      summary, mtime = models.MsuUserSummaryBucket.GetSummary(
+          since_days=since_days)
+      if not mtime:
         continue
-      summary = util.Deserialize(m.blob_value)
       summary_list = []
       keys = summary.keys()
       keys.sort(cmp=lambda x, y: cmp(summary[x], summary[y]), reverse=True)
@@ -206,9 +207,7 @@ class Misc(admin.AdminHandler):
         summary_list.append({'var': x, 'val': summary[x]})
 
       summaries.append(
-          {'values': summary_list, 'since': human_since, 'mtime': m.mtime})
-
-    # TODO(user): Since the above is a list now, memcache here.
+          {'values': summary_list, 'since': human_since, 'mtime': mtime})
 
     self.Render(
         'msu_log_summary.html',
@@ -19,10 +19,13 @@
 import datetime
 import httplib
 
+from google.appengine.ext import db
+
 from simian.mac import admin
 from simian.mac import common
 from simian.mac import models
 from simian.mac.common import auth
+from simian.mac.common import gae_util
 
 
 DEFAULT_PACKAGE_LOG_FETCH_LIMIT = 25
@@ -51,47 +54,83 @@ class Packages(admin.AdminHandler):
       else:
         self._DisplayPackagesList()
 
-  def _GetPackageQuery(self):
-    """Build query."""
+  def _GetPackageKeys(self):
+    """Returns db.Key list of packages to display."""
     all_packages = self.request.get('all_packages') == '1'
-    query = self.DATASTORE_MODEL.all()
-    if self.REPORT_TYPE == 'packages' and not all_packages:
-      query.filter('catalogs IN', common.TRACKS)
-    return query
+    if self.REPORT_TYPE != 'packages' or all_packages:
+      return list(self.DATASTORE_MODEL.all(keys_only=True))
+
+    # keys only queries do not support IN filters, so query each track.
+    keys = []
+    seen = set()
+    for track in common.TRACKS:
+      query = self.DATASTORE_MODEL.all(keys_only=True)
+      for key in query.filter('catalogs =', track):
+        if key not in seen:
+          seen.add(key)
+          keys.append(key)
+    return keys
+
+  def _GetPackages(self):
+    """Returns a list of package dicts from PackageInfoSummary entities.
+
+    Returns:
+      list of dicts, or None if a package has a broken plist.
+    """
+    keys = self._GetPackageKeys()
+    summaries = models.PackageInfoSummary.GetForPackageInfoKeys(keys)
+
+    proposal_keys = [
+        db.Key.from_path(models.PackageInfoProposal.kind(), s.filename)
+        for s in summaries if s.filename]
+    proposals = {}
+    for batch in gae_util.BatchDatastoreOpAsync(
+        db.get_async, proposal_keys, batch_size=100):
+      proposals.update((p.filename, p) for p in batch if p)
+
+    packages = []
+    for s in summaries:
+      proposal = proposals.get(s.filename)
+      if not s.plist_valid:
+        self.error(httplib.FORBIDDEN)
+        self.response.out.write('Package %s has a broken plist!' % s.filename)
+        return None
+      # Without a proposal, the proposed tracks are the current ones.
+      proposed_catalogs = proposal.catalogs if proposal else s.catalogs
+      proposed_manifests = proposal.manifests if proposal else s.manifests
+      packages.append({
+          'unattended': s.unattended_install,
+          'unattended_uninstall': s.unattended_uninstall,
+          'force_install_after_date': s.force_install_after_date,
+          'catalogs': common.util.MakeTrackMatrix(
+              s.catalogs, proposed_catalogs),
+          'manifests': common.util.MakeTrackMatrix(
+              s.manifests, proposed_manifests),
+          'munki_name': s.munki_name or '',
+          'filename': s.filename,
+          'file_size': s.installer_item_size * 1024,
+          'install_types': s.install_types,
+          'manifest_mod_access': s.manifest_mod_access,
+          'description': s.description,
+      })
+    return packages
 
   def _DisplayPackagesList(self):
     """Displays list of all installs/removals/etc."""
     installs, counts_mtime = models.ReportsCache.GetInstallCounts()
     pending, pending_mtime = models.ReportsCache.GetPendingCounts()
-    packages = []
     all_packages = self.request.get('all_packages') == '1'
-    query = self._GetPackageQuery()
-    for p in query:
-      if not p.plist:
-        self.error(httplib.FORBIDDEN)
-        self.response.out.write('Package %s has a broken plist!' % p.filename)
-        return
-      pkg = {}
-      pkg['count'] = installs.get(p.munki_name, {}).get('install_count', 'N/A')
-      pkg['fail_count'] = installs.get(p.munki_name, {}).get(
+    packages = self._GetPackages()
+    if packages is None:
+      return
+    for pkg in packages:
+      munki_name = pkg['munki_name']
+      pkg['count'] = installs.get(munki_name, {}).get('install_count', 'N/A')
+      pkg['fail_count'] = installs.get(munki_name, {}).get(
           'install_fail_count', 'N/A')
-      pkg['pending_count'] = pending.get(p.munki_name, 'N/A')
-      pkg['duration_seconds_avg'] = installs.get(p.munki_name, {}).get(
+      pkg['pending_count'] = pending.get(munki_name, 'N/A')
+      pkg['duration_seconds_avg'] = installs.get(munki_name, {}).get(
           'duration_seconds_avg', None) or 'N/A'
-      pkg['unattended'] = p.plist.get('unattended_install', False)
-      pkg['unattended_uninstall'] = p.plist.get('unattended_uninstall', False)
-      force_install_after_date = p.plist.get('force_install_after_date', None)
-      if force_install_after_date:
-        pkg['force_install_after_date'] = force_install_after_date
-      pkg['catalogs'] = p.catalog_matrix
-      pkg['manifests'] = p.manifest_matrix
-      pkg['munki_name'] = p.munki_name or p.plist.GetMunkiName()
-      pkg['filename'] = p.filename
-      pkg['file_size'] = p.plist.get('installer_item_size', 0) * 1024
-      pkg['install_types'] = p.install_types
-      pkg['manifest_mod_access'] = p.manifest_mod_access
-      pkg['description'] = p.description
-      packages.append(pkg)
 
     packages.sort(key=lambda pkg: pkg['munki_name'].lower())
 
@@ -196,5 +235,30 @@ class PackageProposals(Packages):
   LOG_REPORT_TYPE = 'proposal_logs'
   REPORT_TYPE = 'proposals'
 
-  def _GetPackageQuery(self):
-    return self.DATASTORE_MODEL.all()
+  def _GetPackages(self):
+    """Returns a list of package dicts from PackageInfoProposal entities.
+
+    Returns:
+      list of dicts, or None if a package has a broken plist.
+    """
+    packages = []
+    for p in self.DATASTORE_MODEL.all():
+      if not p.plist:
+        self.error(httplib.FORBIDDEN)
+        self.response.out.write('Package %s has a broken plist!' % p.filename)
+        return None
+      packages.append({
+          'unattended': p.plist.get('unattended_install', False),
+          'unattended_uninstall': p.plist.get('unattended_uninstall', False),
+          'force_install_after_date': p.plist.get(
+              'force_install_after_date', None),
+          'catalogs': p.catalog_matrix,
+          'manifests': p.manifest_matrix,
+          'munki_name': p.munki_name or p.plist.GetMunkiName(),
+          'filename': p.filename,
+          'file_size': p.plist.get('installer_item_size', 0) * 1024,
+          'install_types': p.install_types,
+          'manifest_mod_access': p.manifest_mod_access,
+          'description': p.description,
+      })
+    return packages
@@ -80,7 +80,6 @@ class ReleaseReport(admin.AdminHandler):
       self.error(httplib.BAD_REQUEST)
       self.response.out.write('invalid date input')
       return
-    candidate_items = []
     if not date:
       start_date = datetime.datetime.utcnow()
     else:
@@ -90,17 +89,12 @@ class ReleaseReport(admin.AdminHandler):
         self.error(httplib.BAD_REQUEST)
         self.response.out.write('invalid date input')
         return
-    # Get all package logs for the appropriate time range.
-    query = models.AdminPackageLog.all()
-    query.filter('mtime >', start_date - period)
-    # Check for packages that were in stable in some log entry.
-    for item in query:
-      if 'stable' in item.catalogs:
-        if item.filename not in candidate_items:
-          candidate_items.append(item.filename)
-    # Pass list of packages that were in stable in the time range.
-    final_list = self.ItemQualificationCheck(
-        candidate_items, start_date, range_of_days)
+    # Get packages promoted to stable within the time range, along with their
+    # current PackageInfo in a single batch.
+    filenames = models.PackageReleaseHistory.GetPromotedSince(
+        start_date - period)
+    packages = models.PackageInfo.get_by_key_name(filenames)
+    final_list = self.ItemQualificationCheck(packages)
     # Generate Actual Report.
     final_report, contains_forced_install = self.MakeReleaseReport(final_list)
     username = users.get_current_user()
@@ -128,40 +122,29 @@ class ReleaseReport(admin.AdminHandler):
         'version_verb': settings.RELEASE_REPORT_VERSION_VERB,
         })
 
-  def MakeReleaseReport(self, filename_list):
+  def MakeReleaseReport(self, packages):
     """Generates Release Report report as a dict."""
     report = []
     contains_forced_install = False
-    for filename in filename_list:
-      message_dict = self.Message(filename)
+    for p in packages:
+      message_dict = self.Message(p)
       report.append(message_dict)
       if message_dict['is_forced_install']:
         contains_forced_install = True
     return report, contains_forced_install
 
-  def ItemQualificationCheck(self, filename_list, date, range_of_days):
-    """Checks to see if packages were promoted to stable within date range."""
-    result_set = set([])
-    period = datetime.timedelta(days=range_of_days)
-    for filename in filename_list:
-      p = models.PackageInfo.get_by_key_name(filename)
-      # Package must currently be in stable to be considered.
-      if p:
-        if 'stable' in p.catalogs and 'stable' in p.manifests:
-          query = query = models.AdminPackageLog.all()
-          query.filter('filename =', filename)
-          query.order('-mtime')
-          # iterates over log entries in reverse chronological order.
-          for item in query:
-            # If it was not in stable in the next log entry it makes the list.
-            if 'stable' not in item.catalogs:
-              result_set.add(item.filename)
-              break
-            # If it was in stable prior to the date range, it does not.
-            else:
-              if item.mtime < date - period:
-                break
-    return result_set
+  def ItemQualificationCheck(self, packages):
+    """Returns packages which are currently in stable.
+
+    Args:
+      packages: list of models.PackageInfo entities or None, for packages that
+          were promoted to stable within the report date range.
+    Returns:
+      list of models.PackageInfo entities.
+    """
+    # Package must currently be in stable to be considered.
+    return [p for p in packages
+            if p and 'stable' in p.catalogs and 'stable' in p.manifests]
 
   def InstallOsTextGenerator(self, min_os=None, max_os=None):
     """Generates readable text about minimum and maximum OSs for a package.
@@ -203,10 +186,9 @@ class ReleaseReport(admin.AdminHandler):
       result_string = '.'
     return result_string
 
-  def Message(self, filename):
+  def Message(self, p):
     """Generates list of items with report parameters."""
     item_dict = {}
-    p = models.PackageInfo.get_by_key_name(filename)
 
     if p.plist.get('display_name', None):
       item_dict['package_name'] = p.plist.get('display_name', '')
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""RPC stats admin handler."""
+
+import httplib
+
+from simian.mac import admin
+from simian.mac import urls as munki_urls
+from simian.mac.api import urls as api_urls
+from simian.mac.common import rpc_stats
+
+
+class RpcStats(admin.AdminHandler):
+  """Handler for /admin/rpc_stats."""
+
+  def get(self):
+    """GET handler."""
+    if not self.IsAdminUser():
+      self.error(httplib.FORBIDDEN)
+      return
+
+    routes = rpc_stats.GetRouteNames([munki_urls.app, api_urls.app])
+    values = {
+        'report_type': 'rpc_stats',
+        'routes': rpc_stats.GetRouteStats(routes),
+        'percentiles': rpc_stats.PERCENTILES,
+        'max_bucket_ms': rpc_stats.LATENCY_BUCKETS_MS[-1],
+        'minutes': rpc_stats.WINDOW_SECS * rpc_stats.WINDOWS / 60,
+    }
+    self.Render('rpc_stats.html', values)
@@ -34,6 +34,14 @@ ACTIVE_DAY_COUNTS = [30, 14, 7, 1]
 DEFAULT_COMPUTER_FETCH_LIMIT = 500
 REPORT_TYPES = [
     'owner', 'hostname', 'serial', 'uuid', 'client_version', 'os_version']
+# Report types served from the computer search index unless a computer matches
+# exactly; "any" searches all of computer_search.SEARCH_FIELDS.
+SEARCH_TYPES = models.computer_search.SEARCH_FIELDS + ['any']
+TRENDING_INSTALLS_LIMIT = 5
+# Default trending installs windows, in hours, shown on the summary page.
+TRENDING_INSTALLS_HOURS = [1, 24, 24 * 7]
+MAX_TRENDING_INSTALLS_HOURS = (
+    models.INSTALL_COUNT_BUCKET_RETENTION_DAYS * 24)
 
 
 class Summary(admin.AdminHandler):
@@ -64,14 +72,19 @@ class Summary(admin.AdminHandler):
 
   def _DisplayCachedSummary(self):
     """Displays stats summary from cached dict."""
-    summary, mtime = models.ReportsCache.GetStatsSummary()
+    counters, mtime = models.ComputerSummaryShard.GetSummedCounters()
+    summary = PrepareComputerSummaryForTemplate(
+        GetComputerSummaryFromCounters(counters))
 
-    trend_hour, trend_hour_mtime = models.ReportsCache.GetTrendingInstalls(1)
-    trend_day, trend_day_mtime = models.ReportsCache.GetTrendingInstalls(24)
+    hours_list = TRENDING_INSTALLS_HOURS
+    try:
+      hours = int(self.request.get('trending-hours'))
+      if 0 < hours <= MAX_TRENDING_INSTALLS_HOURS:
+        hours_list = [hours]
+    except ValueError:
+      pass
     trending_installs = [
-        (1, trend_hour, trend_hour_mtime),
-        (24, trend_day, trend_day_mtime),
-    ]
+        (hours, GetTrendingInstalls(hours)) for hours in hours_list]
     values = {
         'summary': summary, 'cached_mtime': mtime, 'report_type': 'summary',
         'trending_installs': trending_installs,
@@ -91,12 +104,20 @@ class Summary(admin.AdminHandler):
     """
     default_limit = DEFAULT_COMPUTER_FETCH_LIMIT
     computers = None
+    facets = None
+    results_found = None
     if include_inactive:
       query = models.Computer.all()
     else:
       query = models.Computer.AllActive()
 
-    if report_type == 'track':
+    # exact matches, e.g. from host page links, and self reports, which must
+    # match the owner exactly, don't use the index.
+    if (report_type in SEARCH_TYPES and not self_report and
+        not self._HasExactMatch(report_type, report_filter, include_inactive)):
+      computers, facets, results_found = self._SearchComputers(
+          report_type, report_filter, include_inactive, default_limit)
+    elif report_type == 'track':
       query.filter('track =', report_filter).order('-preflight_datetime')
     elif report_type == 'site':
       if report_filter == 'None':
@@ -130,7 +151,7 @@ class Summary(admin.AdminHandler):
       return
 
     # If we didn't get a sorted query from Datastore, sort now.
-    if report_type in REPORT_TYPES:
+    if report_type in REPORT_TYPES or report_type in SEARCH_TYPES:
       computers.sort(key=lambda c: c.preflight_datetime, reverse=True)
 
     try:
@@ -145,9 +166,53 @@ class Summary(admin.AdminHandler):
         'search_type': report_type, 'search_term': report_filter,
         'owner_lookup_url': owner_lookup_url, 'self_report': self_report,
         'client_site_enabled': settings.CLIENT_SITE_ENABLED,
+        'facets': facets, 'results_found': results_found,
     }
     self.Render('summary.html', values)
 
+  def _HasExactMatch(self, report_type, report_filter, include_inactive):
+    """Returns True if a computer property equals report_filter exactly."""
+    if report_type not in REPORT_TYPES:
+      return False
+    if include_inactive:
+      query = models.Computer.all(keys_only=True)
+    else:
+      query = models.Computer.AllActive(keys_only=True)
+    query.filter('%s =' % report_type, report_filter)
+    return query.get() is not None
+
+  def _SearchComputers(
+      self, report_type, report_filter, include_inactive, default_limit):
+    """Returns a page of computers matching a search of the computer index.
+
+    Args:
+      report_type: str, one of SEARCH_TYPES.
+      report_filter: str, search term.
+      include_inactive: bool, True to include inactive hosts.
+      default_limit: int, default number of computers per page.
+    Returns:
+      tuple of (list of Computer entities, list of (str facet name, list of
+      (str value, int count) tuples) tuples, int number of matching computers)
+    """
+    limit = self.GetPageLimit(default_limit)
+    field = report_type
+    if report_type == 'any':
+      field = None
+    keys, next_page, results_found, facets = models.computer_search.Search(
+        field, report_filter, include_inactive=include_inactive,
+        limit=limit, cursor=self.request.get('page') or None)
+
+    # the index may briefly reference computers it has not caught up with.
+    computers = [c for c in db.get(keys) if c]
+    self._page = {
+        'limit': limit,
+        'next_page': next_page,
+        'results_count': len(computers),
+    }
+    facets = [
+        (f, facets[f]) for f in models.computer_search.FACETS if f in facets]
+    return computers, facets, results_found
+
 
 def PrepareComputerSummaryForTemplate(s):
   """Prepare data produced by GetComputerSummary for template."""
@@ -254,6 +319,81 @@ def GetComputerSummary(computers, initial_summary=None):
   return summary
 
 
+def GetComputerSummaryFromCounters(counters, now=None):
+  """Generates a summary overview from fleet summary counters.
+
+  All values come from the counters, so the summary is consistent. Shorter
+  active windows are the last days of preflight, counted in UTC calendar
+  days; the longest window is all active computers.
+
+  Args:
+    counters: dict, summed Computer.GetSummaryCounters() values.
+    now: datetime.datetime, optional, supply an alternative
+      value for the current date/time
+  Returns:
+    dict, stats summary data in the same format as GetComputerSummary().
+  """
+  if now is None:
+    now = datetime.datetime.utcnow()
+  window_starts = dict(
+      (days, (now - datetime.timedelta(days=days - 1)).strftime(
+          models.SUMMARY_DAY_FORMAT))
+      for days in ACTIVE_DAY_COUNTS[1:])
+
+  summary = GetComputerSummary([])
+  for name, value in counters.iteritems():
+    kind, _, rest = name.partition('|')
+    if kind == 'os':
+      summary['os_versions'][rest] = value
+    elif kind == 'client':
+      summary['client_versions'][rest] = value
+    elif kind == 'site':
+      summary['sites_histogram'][rest] = value
+    elif kind == 'conns':
+      summary['conns_%s' % rest] = value
+    elif kind == 'state':
+      day, all_pkgs, all_apple_updates, track = rest.split('|', 3)
+      windows = [ACTIVE_DAY_COUNTS[0]] + [
+          days for days, start in window_starts.iteritems() if day >= start]
+      for days in windows:
+        summary['active'][days] += value
+        if track in summary['tracks']:
+          summary['tracks'][track][days] = (
+              summary['tracks'][track].get(days, 0) + value)
+        if all_pkgs == '1':
+          summary['all_pkgs_installed'][days] += value
+        if all_apple_updates == '1':
+          summary['all_apple_updates_installed'][days] += value
+
+  return summary
+
+
+def GetTrendingInstalls(since_hours, now=None):
+  """Returns the top installed and failed packages over the last hours.
+
+  Args:
+    since_hours: int, number of hours to report on, including the current one.
+    now: datetime.datetime, optional, supply an alternative
+      value for the current date/time
+  Returns:
+    dict like {'success': {'packages': [(pkg, count, percent), ...],
+                           'total': int},
+               'failure': {...}}
+  """
+  counts = models.InstallCountBucket.GetCountsSince(since_hours, now=now)
+  trending = {}
+  for section in ['success', 'failure']:
+    total = sum(counts[section].itervalues())
+    packages = sorted(
+        counts[section].items(), key=lambda i: (i[1], i[0]), reverse=True)
+    trending[section] = {
+        'packages': [(pkg, count, GetPercentage(count, total))
+                     for pkg, count in packages[:TRENDING_INSTALLS_LIMIT]],
+        'total': total,
+    }
+  return trending
+
+
 def GetPercentage(number, total):
   """Returns the float percentage that a number is of a total."""
   if not number:
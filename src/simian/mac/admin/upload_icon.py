@@ -16,7 +16,6 @@
 #
 """Module to handle /admin/uploadpkg."""
 
-import base64
 import hashlib
 import httplib
 
@@ -26,6 +25,7 @@ from simian import settings
 from simian.mac import admin
 from simian.mac import models
 from simian.mac.common import auth
+from simian.mac.munki.handlers import icons
 
 
 def GetIconGCSPath(pkg):
@@ -37,8 +37,7 @@ def GetIconGCSPath(pkg):
   if not pkg.name:
     return ''
 
-  icon_path = '/%s/%s.png' % (
-      bucket, base64.urlsafe_b64encode(pkg.name))
+  icon_path = icons.GetIconPath(bucket, pkg.name)
   try:
     with gcs.open(icon_path, 'r'):
       return icon_path
@@ -89,13 +88,14 @@ class UploadIcon(admin.AdminHandler):
 
     content = self.request.POST['icon'].file.read()
 
-    icon_path = '/%s/%s.png' % (
-        bucket, base64.urlsafe_b64encode(p.name))
-    with gcs.open(icon_path, 'w') as f:
+    with gcs.open(icons.GetIconPath(bucket, p.name), 'w') as f:
       f.write(content)
+    icons.ClearCache(p.name)
+    sha256 = hashlib.sha256(content).hexdigest()
+    icons.SetIconHash(p.name, sha256)
 
     plist = p.plist
-    plist['icon_hash'] = hashlib.sha256(content).hexdigest()
+    plist['icon_hash'] = sha256
 
     # replace p._plist
     p.plist = str(plist)
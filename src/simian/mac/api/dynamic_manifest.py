@@ -26,9 +26,15 @@ from google.appengine.ext import db
 from simian import settings
 from simian.mac import models
 from simian.mac.common import auth
+from simian.mac.common import gae_util
 from simian.mac.munki import handlers
 
 
+# Max number of modification operations in a single bulk request.
+BULK_MAX_MODS = 10000
+BULK_ACTIONS = ['put', 'delete']
+
+
 class Error(Exception):
   """Class for domain specific exceptions."""
 
@@ -37,6 +43,10 @@ class InvalidModificationType(Error):
   """An invalid modification type was given."""
 
 
+class InvalidBulkModification(Error):
+  """An invalid operation was given in a bulk modification request."""
+
+
 class DynamicManifest(handlers.AuthenticationHandler):
   """Handler for /api/dynamic_manifest/"""
 
@@ -192,8 +202,7 @@ class DynamicManifest(handlers.AuthenticationHandler):
       logging.exception('error on DynamicManifest.delete()')
       self.error(httplib.INTERNAL_SERVER_ERROR)
 
-  def post(self):
-    """DynamicManifest post handler."""
+  def _OAuthOrUserAuthWithApiKeyCheck(self):
     # TODO(user): setup DoUserAuth require_level=gaeserver.LEVEL_API_DYN_MAN.
     try:
       self.user = auth.DoOAuthAuth()
@@ -202,6 +211,10 @@ class DynamicManifest(handlers.AuthenticationHandler):
       if not self.user:
         self._UserAuthWithApiKeyCheck()
 
+  def post(self):
+    """DynamicManifest post handler."""
+    self._OAuthOrUserAuthWithApiKeyCheck()
+
     mod_type = self.request.get('mod_type')
     target = self.request.get('target')
     mutate = self.request.get('mutate', 'true').lower() == 'true'
@@ -235,3 +248,135 @@ class DynamicManifest(handlers.AuthenticationHandler):
       self.error(httplib.BAD_REQUEST)
     except db.Error:
       self.error(httplib.INTERNAL_SERVER_ERROR)
+
+
+def _IsStringList(value):
+  """Returns True if value is a list of strings."""
+  return isinstance(value, list) and all(
+      isinstance(v, basestring) for v in value)
+
+
+class BulkDynamicManifest(DynamicManifest):
+  """Handler for /api/dynamic_manifest/bulk."""
+
+  def _ParseMod(self, op, pkg_aliases):
+    """Validates a single bulk operation.
+
+    Args:
+      op: dict, with "action" (one of BULK_ACTIONS), "mod_type", "target" and
+        "pkg_name" or "pkg_alias" keys, plus "install_types" and optional
+        "manifests" lists for puts.
+      pkg_aliases: dict, cache of str package alias to resolved package name.
+    Returns:
+      tuple of (str action, str mod_type, str target, BaseManifestModification
+      entity to put or db.Key to delete).
+    Raises:
+      InvalidBulkModification: the operation is invalid.
+    """
+    if not isinstance(op, dict):
+      raise InvalidBulkModification('operation is not an object')
+    action = op.get('action', 'put')
+    mod_type = op.get('mod_type')
+    target = op.get('target')
+    if action not in BULK_ACTIONS:
+      raise InvalidBulkModification('invalid action: %s' % action)
+    model = models.MANIFEST_MOD_MODELS.get(mod_type)
+    if not model:
+      raise InvalidBulkModification('invalid mod_type: %s' % mod_type)
+    if not target or not isinstance(target, basestring):
+      raise InvalidBulkModification('target string is required')
+
+    pkg_name = op.get('pkg_name')
+    pkg_alias = op.get('pkg_alias')
+    for value in pkg_name, pkg_alias:
+      if value is not None and not isinstance(value, basestring):
+        raise InvalidBulkModification('pkg_name and pkg_alias must be strings')
+    if pkg_alias:
+      if pkg_alias not in pkg_aliases:
+        pkg_aliases[pkg_alias] = models.PackageAlias.ResolvePackageName(
+            pkg_alias)
+      pkg_name = pkg_aliases[pkg_alias]
+      if not pkg_name:
+        raise InvalidBulkModification('package alias not found: %s' % pkg_alias)
+    if not pkg_name:
+      raise InvalidBulkModification('pkg_name or pkg_alias is required')
+
+    if action == 'delete':
+      key_name = '%s##%s' % (target, pkg_name)
+      return action, mod_type, target, db.Key.from_path(
+          model.kind(), key_name)
+
+    install_types = op.get('install_types')
+    if not install_types or not _IsStringList(install_types):
+      raise InvalidBulkModification('install_types list is required')
+    # Disallow manifests to be set for owner modifications.
+    manifests = []
+    if mod_type != 'owner':
+      manifests = op.get('manifests') or []
+      if not _IsStringList(manifests):
+        raise InvalidBulkModification('manifests must be a list of strings')
+    try:
+      mod = models.BaseManifestModification.GenerateInstance(
+          mod_type, target, pkg_name, enabled=True, manifests=manifests,
+          install_types=install_types, user=self.user)
+    except db.BadValueError, e:
+      raise InvalidBulkModification(str(e))
+    return action, mod_type, target, mod
+
+  def post(self):
+    """BulkDynamicManifest post handler.
+
+    The request body is a JSON object like {"mods": [op, ...]}, where each op
+    is described in _ParseMod(). All operations are validated before any is
+    applied; a "mutate" query parameter of "false" only validates them.
+    """
+    self._OAuthOrUserAuthWithApiKeyCheck()
+    mutate = self.request.get('mutate', 'true').lower() == 'true'
+
+    try:
+      ops = json.loads(self.request.body)['mods']
+      if not isinstance(ops, list):
+        raise ValueError
+    except (ValueError, KeyError, TypeError):
+      self.error(httplib.BAD_REQUEST)
+      self.response.out.write('request body must be {"mods": [...]}')
+      return
+    if len(ops) > BULK_MAX_MODS:
+      self.error(httplib.REQUEST_ENTITY_TOO_LARGE)
+      self.response.out.write('at most %d mods per request' % BULK_MAX_MODS)
+      return
+
+    # the last operation on a modification wins, as puts and deletes are
+    # applied in separate batches.
+    mods = {}
+    targets = set()
+    pkg_aliases = {}
+    for i, op in enumerate(ops):
+      try:
+        action, mod_type, target, mod = self._ParseMod(op, pkg_aliases)
+      except InvalidBulkModification, e:
+        logging.warning('Invalid bulk modification %d: %s', i, e)
+        self.error(httplib.BAD_REQUEST)
+        self.response.out.write('mod %d: %s' % (i, e))
+        return
+      key = mod.key() if action == 'put' else mod
+      mods[key] = (action, mod)
+      targets.add((mod_type, target))
+    to_put = [m for action, m in mods.itervalues() if action == 'put']
+    to_delete = [m for action, m in mods.itervalues() if action == 'delete']
+
+    if mutate:
+      try:
+        gae_util.BatchDatastoreOpAsync(db.put_async, to_put)
+        gae_util.BatchDatastoreOpAsync(db.delete_async, to_delete)
+      except db.Error:
+        logging.exception('error on BulkDynamicManifest.post()')
+        self.error(httplib.INTERNAL_SERVER_ERROR)
+        return
+      finally:
+        # clear caches even on failure, as some batches may have been applied.
+        models.BaseManifestModification.ResetModMemcaches(targets)
+
+    self.response.headers['Content-Type'] = 'application/json'
+    self.response.out.write(json.dumps({
+        'put': len(to_put), 'deleted': len(to_delete), 'mutate': mutate}))
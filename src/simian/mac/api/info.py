@@ -20,6 +20,8 @@ import datetime
 import logging
 import webapp2
 
+from google.appengine.api import memcache
+
 try:
   import icalendar
 except ImportError:
@@ -27,12 +29,14 @@ except ImportError:
 
 from simian import settings
 from simian.mac import common
-from simian.mac import models
 from simian.mac.common import applesus
 
 
 API_INFO_KEY = settings.API_INFO_KEY
 
+PROMO_CAL_MEMCACHE_KEY = 'applesus_promo_cal_%s_%s'
+PROMO_CAL_MEMCACHE_SECS = 86400
+
 
 class Error(Exception):
   """Class for domain specific exceptions."""
@@ -44,59 +48,58 @@ class InfoHandler(webapp2.RequestHandler):
   def _DisplayAppleSusPromoCalendar(self):
     """Display upcoming Apple SUS updates in iCal format."""
     now = datetime.datetime.utcnow().date()
-    query = models.AppleSUSProduct.all().order('-apple_mtime')
+    schedule = applesus.GetAppleSUSPromotionSchedule()
+    # The feed only changes with the schedule version or the date, so render it
+    # once for each rather than on every request.
+    memcache_key = PROMO_CAL_MEMCACHE_KEY % (
+        schedule['version'], now.strftime('%Y%m%d'))
+    cal_str = memcache.get(memcache_key)
+    if cal_str is None:
+      cal_str = self._GetAppleSusPromoCalendar(schedule['products'], now)
+      memcache.set(memcache_key, cal_str, time=PROMO_CAL_MEMCACHE_SECS)
+
+    self.response.headers['Content-Type'] = 'text/calendar'
+    self.response.out.write(cal_str)
+
+  def _GetAppleSusPromoCalendar(self, products, now):
+    """Returns an iCal str of upcoming Apple SUS auto-promotions.
+
+    Args:
+      products: dict, products of an Apple SUS promotion schedule.
+      now: datetime.date, promotions before this date are omitted.
+    Returns:
+      str iCal calendar.
+    """
     dates = {}
-    # NOTE(user): the following adds about 700ms onto the request, so we may
-    #             want to pre-calculate this in a cron in the future.
-    for p in query:
-      if p.manual_override:
-        continue
-      if not common.UNSTABLE in p.tracks:
-        continue
-      if common.STABLE not in p.tracks:
-        p.stable_promote_date = applesus.GetAutoPromoteDate(common.STABLE, p)
-      if common.TESTING not in p.tracks:
-        p.testing_promote_date = applesus.GetAutoPromoteDate(common.TESTING, p)
-
-      if hasattr(p, 'stable_promote_date') and p.stable_promote_date >= now:
-        dates.setdefault(p.stable_promote_date, []).append(p)
-      if hasattr(p, 'testing_promote_date') and p.testing_promote_date >= now:
-        dates.setdefault(p.testing_promote_date, []).append(p)
+    for product_id, p in products.iteritems():
+      for track in [common.STABLE, common.TESTING]:
+        promote_date = p.get(track)
+        if promote_date and promote_date >= now:
+          dates.setdefault(promote_date, {}).setdefault(track, []).append(
+              '  %s %s (%s)' % (p['name'], p['version'], product_id))
 
     dtstamp = datetime.datetime.utcnow()
     cal = icalendar.Calendar()
 
-    for d in dates:
+    for d in sorted(dates):
       e = icalendar.Event()
       e.add('dtstamp', dtstamp)
       e.add('summary', 'Apple SUS auto-promote')
       e.add('dtstart', d)
       e.add('transp', 'TRANSPARENT')
 
-      products = {common.TESTING: [], common.STABLE: []}
-      for p in dates[d]:
-        track = None
-        if p.stable_promote_date == d:
-          track = common.STABLE
-        elif p.testing_promote_date == d:
-          track = common.TESTING
-
-        products[track].append(
-            '  %s %s (%s)' % (p.name, p.version, p.product_id))
-
       desc = []
       for track in [common.STABLE, common.TESTING]:
-        if not products[track]:
+        if not dates[d].get(track):
           continue
         desc.append('Auto-promoting to %s:' % track.upper())
-        desc.append('\n'.join(products[track]))
+        desc.append('\n'.join(sorted(dates[d][track])))
 
       e.add('description', '\n\n'.join(desc))
       e['uid'] = '%s-simian-applesus' % d.strftime('%Y%m%d')
       cal.add_component(e)
 
-    self.response.headers['Content-Type'] = 'text/calendar'
-    self.response.out.write(cal.as_string())
+    return cal.as_string()
 
   def get(self, info_type=None):
     """Get handler.
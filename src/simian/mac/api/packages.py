@@ -16,16 +16,25 @@
 #
 """API handler for package info."""
 
+import datetime
 import httplib
 import json
 import logging
 import webapp2
 
+from google.appengine.ext import db
+
 from simian import settings
 from simian.mac import models
+from simian.mac.common import util
 
 API_INFO_KEY = settings.API_INFO_KEY
 
+# Number of PackageInfo entities to fetch per batch.
+FETCH_BATCH_SIZE = 100
+
+SINCE_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S')
+
 
 PKGINFO_PLIST_KEYS_AND_DEFAULTS = (
     ('display_name', None),
@@ -39,6 +48,90 @@ PKGINFO_PLIST_KEYS_AND_DEFAULTS = (
 
 
 class PackageInfo(webapp2.RequestHandler):
+  """Handler for /api/packages.
+
+  Packages are returned as a JSON object keyed on filename, ordered by mtime.
+  The response is buffered in full before it is sent, so use limit and cursor
+  to bound its size.
+
+  Optional query parameters:
+    since: ISO 8601 datetime; only packages modified after it are returned.
+      An If-Modified-Since header is used the same way, but results in a 304
+      when nothing was modified.
+    limit: int, maximum number of packages to return. If more remain, the
+      X-Simian-Next-Cursor response header holds a cursor for the next page.
+    cursor: str, cursor from a previous response to continue from.
+  """
+
+  def _GetSince(self):
+    """Returns datetime from the since param or If-Modified-Since, or None.
+
+    Raises:
+      ValueError: the since param is not a valid ISO 8601 datetime.
+    """
+    since = self.request.get('since')
+    if since:
+      for fmt in SINCE_FORMATS:
+        try:
+          return datetime.datetime.strptime(since, fmt)
+        except ValueError:
+          pass
+      raise ValueError('Invalid since: %s' % since)
+    header_dt = util.StrHeaderDateToDatetime(
+        self.request.headers.get('If-Modified-Since', ''))
+    if header_dt:
+      # Last-Modified is truncated to seconds, so skip the rest of that second.
+      return header_dt + datetime.timedelta(seconds=1, microseconds=-1)
+
+  def _GetPackageDict(self, package):
+    """Returns a dict for a PackageInfoSummary entity."""
+    d = {
+        'name': package.name,
+        'catalogs': package.catalogs,
+        'created': package.created.isoformat(),
+        'install_types': package.install_types,
+        'manifests': package.manifests,
+        'munki_name': package.munki_name,
+        'mtime': package.mtime.isoformat(),
+    }
+    # Summaries default to the same values as PKGINFO_PLIST_KEYS_AND_DEFAULTS.
+    for key, _ in PKGINFO_PLIST_KEYS_AND_DEFAULTS:
+      d[key] = getattr(package, key)
+    return d
+
+  def _WritePackages(self, query, limit):
+    """Writes packages as a JSON object, fetching entities a batch at a time.
+
+    Args:
+      query: db.Query, keys only PackageInfo query.
+      limit: int, maximum number of packages to write, or None for all.
+    Returns:
+      tuple (int number of packages written, datetime mtime of the last
+      package written or None, str cursor if limit was reached or None).
+    """
+    out = self.response.out
+    out.write('{')
+    count = 0
+    last_mtime = None
+    while limit is None or count < limit:
+      batch_size = FETCH_BATCH_SIZE
+      if limit is not None:
+        batch_size = min(batch_size, limit - count)
+      keys = query.fetch(batch_size)
+      for package in models.PackageInfoSummary.GetForPackageInfoKeys(keys):
+        if count:
+          out.write(', ')
+        out.write('%s: %s' % (
+            json.dumps(package.filename),
+            json.dumps(self._GetPackageDict(package))))
+        count += 1
+        last_mtime = package.mtime
+      if len(keys) < batch_size:
+        out.write('}')
+        return count, last_mtime, None
+      query.with_cursor(query.cursor())
+    out.write('}')
+    return count, last_mtime, query.cursor()
 
   def get(self):
     key = self.request.get('key')
@@ -51,21 +144,39 @@ class PackageInfo(webapp2.RequestHandler):
       self.response.set_status(httplib.UNAUTHORIZED)
       return
 
-    output = {}
-
-    for package in models.PackageInfo.all():
-      output[package.filename] = {
-          'name': package.name,
-          'catalogs': package.catalogs,
-          'created': package.created.isoformat(),
-          'install_types': package.install_types,
-          'manifests': package.manifests,
-          'munki_name': package.munki_name,
-          'mtime': package.mtime.isoformat(),
-      }
+    try:
+      since = self._GetSince()
+      limit = self.request.get('limit')
+      limit = int(limit) if limit else None
+      if limit is not None and limit < 1:
+        raise ValueError('Invalid limit: %d' % limit)
+    except ValueError, e:
+      self.response.set_status(httplib.BAD_REQUEST)
+      self.response.out.write(str(e))
+      return
 
-      for key, default in PKGINFO_PLIST_KEYS_AND_DEFAULTS:
-        output[package.filename][key] = package.plist.get(key, default)
+    query = models.PackageInfo.all(keys_only=True).order('mtime')
+    if since:
+      query.filter('mtime >', since)
+    cursor = self.request.get('cursor')
+    if cursor:
+      try:
+        query.with_cursor(cursor)
+      except (db.BadValueError, db.BadRequestError):
+        self.response.set_status(httplib.BAD_REQUEST)
+        self.response.out.write('Invalid cursor.')
+        return
 
     self.response.headers['Content-Type'] = 'application/json'
-    self.response.out.write(json.dumps(output))
+    count, last_mtime, next_cursor = self._WritePackages(query, limit)
+
+    if (not count and not self.request.get('since') and
+        self.request.headers.get('If-Modified-Since')):
+      self.response.clear()
+      self.response.set_status(httplib.NOT_MODIFIED)
+      return
+    if last_mtime:
+      self.response.headers['Last-Modified'] = last_mtime.strftime(
+          util.HEADER_DATE_FORMAT)
+    if next_cursor:
+      self.response.headers['X-Simian-Next-Cursor'] = next_cursor
@@ -22,6 +22,7 @@ from simian import settings
 from simian.mac.api import dynamic_manifest
 from simian.mac.api import groups
 from simian.mac.api import packages
+from simian.mac.common import rpc_stats
 
 
 class ServeHello(webapp2.RequestHandler):
@@ -33,6 +34,7 @@ class ServeHello(webapp2.RequestHandler):
 
 
 app = webapp2.WSGIApplication([
+    (r'/api/dynamic_manifest/bulk/?', dynamic_manifest.BulkDynamicManifest),
     (r'/api/dynamic_manifest/?', dynamic_manifest.DynamicManifest),
     (r'/api/dynamic_manifest/([^/]+)/([^/]+)/?',
      dynamic_manifest.DynamicManifest),
@@ -43,3 +45,4 @@ app = webapp2.WSGIApplication([
     (r'/api/packages/?', packages.PackageInfo),
     (r'/api/?$', ServeHello),
 ], debug=settings.DEBUG)
+rpc_stats.Install(app)
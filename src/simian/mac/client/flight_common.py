@@ -37,6 +37,7 @@ import time
 
 from simian.client import client as base_client  # pylint: disable=import-error
 from simian.mac.client import version
+from simian.mac.common import fact_cache
 
 # Place all ObjC-dependent imports in this try/except block.
 # Silently work around missing modules within this module using OBJC_OK!
@@ -69,6 +70,11 @@ DEFAULT_ADDITIONAL_HTTP_HEADERS_KEY = 'AdditionalHttpHeaders'
 AUTH1_TOKEN = None
 HUNG_MSU_TIMEOUT = datetime.timedelta(hours=2)
 MUNKI_CLIENT_ID_HEADER_KEY = 'X-munki-client-id'
+# Seconds slow facts are cached for; they are also probed again when the
+# fact_cache triggers they depend on change.
+FACTER_CACHE_TTL = 6 * 60 * 60
+HARDWARE_CACHE_TTL = 7 * 24 * 60 * 60
+PRIMARY_USER_CACHE_TTL = 24 * 60 * 60
 
 
 DEBUG = False
@@ -127,11 +133,27 @@ def _GetHostname():
     return None
 
 
-def _GetSerialNumber():
-  """Returns the str serial number from system_profiler, or '' if not found."""
+def _ProbeHardwareDataType():
+  """Returns the str system_profiler hardware overview, or '' on error."""
   return_code, stdout, unused_stderr = Exec(
       'system_profiler SPHardwareDataType')
   if return_code == 0 and stdout:
+    return stdout
+  return ''
+
+
+def _GetHardwareDataType():
+  """Returns the str system_profiler hardware overview, or '' on error."""
+  # hardware only changes across reboots, i.e. repairs.
+  return fact_cache.Get(
+      'system_profiler_hardware', _ProbeHardwareDataType, HARDWARE_CACHE_TTL,
+      triggers=(fact_cache.TRIGGER_BOOT, fact_cache.TRIGGER_OS_BUILD))
+
+
+def _GetSerialNumber():
+  """Returns the str serial number from system_profiler, or '' if not found."""
+  stdout = _GetHardwareDataType()
+  if stdout:
     match = re.search(r'^\s+Serial Number[^:]+: (.*)$', stdout, re.MULTILINE)
     if match:
       return match.group(1)
@@ -140,16 +162,15 @@ def _GetSerialNumber():
 
 def _GetHardwareUUID():
   """Returns the str hardware UUID from system_profiler, or '' if not found."""
-  return_code, stdout, unused_stderr = Exec(
-      'system_profiler SPHardwareDataType')
-  if return_code == 0 and stdout:
+  stdout = _GetHardwareDataType()
+  if stdout:
     match = re.search(r'^\s+Hardware UUID: (.*)$', stdout, re.MULTILINE)
     if match:
       return match.group(1)
   return ''
 
 
-def _GetPrimaryUser():
+def _ProbePrimaryUser():
   """Returns the str username of the user that has logged in the most."""
   return_code, stdout, unused_stderr = Exec(['/usr/bin/last', '-100'])
   if return_code == 0 and stdout:
@@ -163,6 +184,13 @@ def _GetPrimaryUser():
   return ''
 
 
+def _GetPrimaryUser():
+  """Returns the str username of the user that has logged in the most."""
+  return fact_cache.Get(
+      'primary_user', _ProbePrimaryUser, PRIMARY_USER_CACHE_TTL,
+      triggers=(fact_cache.TRIGGER_BOOT,))
+
+
 def _GetMachineInfoPlistValue(key):
   """Returns value of given key in the machineinfo plist, or '' if not found."""
   return ''
@@ -336,6 +364,19 @@ def GetFacterFacts():
   if _facts:
     return _facts
 
+  _facts = fact_cache.Get(
+      'facter', _ProbeFacterFacts, FACTER_CACHE_TTL,
+      triggers=(fact_cache.TRIGGER_BOOT, fact_cache.TRIGGER_OS_BUILD,
+                fact_cache.TRIGGER_NETWORK, fact_cache.TRIGGER_FACT_SOURCES))
+  return _facts
+
+
+def _ProbeFacterFacts():
+  """Runs facter and returns its facts.
+
+  Returns:
+    dict, facter contents, or {} if facter failed.
+  """
   return_code, stdout, unused_stderr = Exec(
       FACTER_CMD, timeout=300, waitfor=0.5)
   if return_code != 0:
@@ -352,8 +393,7 @@ def GetFacterFacts():
     logging.error(
         'There was a problem scanning facter JSON output. %s', str(e))
 
-  _facts = facts
-  return _facts
+  return facts
 
 
 def GetSystemUptime():
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Admission control of client requests to munki endpoints.
+
+Each endpoint has a budget of requests running concurrently on an instance,
+and of requests per second across all instances. Requests over budget are
+rejected before doing any expensive work, so that instances keep serving the
+requests they do admit within their deadlines. Handlers which answer some
+requests cheaply, like catalogs answering If-Modified-Since with a 304, only
+ask for admission once they know the full response is needed.
+
+Admission control is opt-in: every endpoint is unlimited until budgeted with
+the admission_budgets setting, like "reports=2/50,manifests=2/0", where 0
+means unlimited.
+"""
+
+import logging
+import random
+import threading
+import time
+
+from google.appengine.api import memcache
+
+from simian import settings
+
+
+# str endpoint name to tuple of (int max concurrent requests per instance,
+# int max requests per second across instances); 0 means unlimited.
+DEFAULT_BUDGETS = {
+    'auth': (0, 0),
+    'catalogs': (0, 0),
+    'manifests': (0, 0),
+    'reports': (0, 0),
+}
+BUDGETS_CACHE_SECS = 60
+# Rejected requests are asked to retry after a random time in this range.
+RETRY_AFTER_MIN_SECS = 30
+RETRY_AFTER_MAX_SECS = 120
+MEMCACHE_KEY_PREFIX = 'admission_'
+
+_lock = threading.Lock()
+# str endpoint name to int number of requests running on this instance.
+_running = {}
+# list of [float time loaded, dict of budgets].
+_budgets = [0, {}]
+
+
+def ParseBudgets(value):
+  """Returns budgets parsed from an admission_budgets setting value.
+
+  Args:
+    value: str, like 'reports=2/50,manifests=2/0'.
+  Returns:
+    dict of DEFAULT_BUDGETS, updated with the valid budgets in value.
+  """
+  budgets = dict(DEFAULT_BUDGETS)
+  for item in (value or '').split(','):
+    item = item.strip()
+    if not item:
+      continue
+    try:
+      endpoint, budget = item.split('=', 1)
+      concurrent, rate = budget.split('/', 1)
+      budgets[endpoint.strip()] = (int(concurrent), int(rate))
+    except ValueError:
+      logging.warning('Invalid admission budget: %s', item)
+  return budgets
+
+
+def GetBudgets(now=None):
+  """Returns the dict of budgets, re-reading settings at most every minute.
+
+  Args:
+    now: float, optional, supply an alternative time.time() value.
+  """
+  if now is None:
+    now = time.time()
+  if now - _budgets[0] >= BUDGETS_CACHE_SECS:
+    try:
+      value = settings.ADMISSION_BUDGETS
+    except AttributeError:
+      value = None
+    _budgets[:] = [now, ParseBudgets(value)]
+  return _budgets[1]
+
+
+def _IsRateExceeded(endpoint, max_rate, now):
+  """Counts a request and returns True if it's over the per second budget."""
+  # one counter per second; old counters are left for memcache to evict.
+  key = '%s%s_%d' % (MEMCACHE_KEY_PREFIX, endpoint, int(now))
+  count = memcache.incr(key, initial_value=0)
+  if count is None:
+    return False  # admit requests when memcache is unavailable.
+  return count > max_rate
+
+
+def Admit(endpoint, now=None):
+  """Admits a request to an endpoint if it's within the endpoint budget.
+
+  Args:
+    endpoint: str, endpoint name, a key of DEFAULT_BUDGETS.
+    now: float, optional, supply an alternative time.time() value.
+  Returns:
+    True if the request was admitted, and Release() must be called once it
+    completes. False if it was rejected.
+  """
+  if now is None:
+    now = time.time()
+  max_concurrent, max_rate = GetBudgets(now).get(endpoint, (0, 0))
+  with _lock:
+    running = _running.get(endpoint, 0)
+    if max_concurrent and running >= max_concurrent:
+      logging.info(
+          'Rejecting %s request: %d running on this instance.',
+          endpoint, running)
+      return False
+    _running[endpoint] = running + 1
+
+  if max_rate and _IsRateExceeded(endpoint, max_rate, now):
+    Release(endpoint)
+    logging.info(
+        'Rejecting %s request: over %d per second.', endpoint, max_rate)
+    return False
+  return True
+
+
+def Release(endpoint):
+  """Marks an admitted request to an endpoint as completed."""
+  with _lock:
+    _running[endpoint] = max(0, _running.get(endpoint, 0) - 1)
+
+
+def GetRetryAfter():
+  """Returns the int seconds rejected clients should wait before retrying."""
+  # random, so clients rejected together don't all come back together.
+  return random.randint(RETRY_AFTER_MIN_SECS, RETRY_AFTER_MAX_SECS)
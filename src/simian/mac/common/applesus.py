@@ -17,6 +17,8 @@
 """Apple SUS shared functions."""
 
 import datetime
+import hashlib
+import json
 import logging
 import re
 import xml
@@ -26,6 +28,7 @@ from google.appengine.api import taskqueue
 from google.appengine.ext import deferred
 
 from simian.mac.common import datastore_locks
+from simian.mac.common import gae_util
 from simian import settings
 from simian.mac import common
 from simian.mac import models
@@ -39,6 +42,17 @@ _CATALOG_REGENERATION_LOCK_NAME = 'applesus_catalog_regeneration_%s_%s'
 
 MON, TUE, WED, THU, FRI, SAT, SUN = range(0, 7)
 
+# Settings which GetAutoPromoteDate() depends on; changing any of them requires
+# the promotion schedule to be regenerated.
+AUTO_PROMOTE_SETTINGS = frozenset([
+    'apple_auto_promote_enabled',
+    'apple_auto_promote_stable_weekday',
+    'apple_testing_grace_period_days',
+    'apple_unstable_grace_period_days',
+])
+
+_PROMOTE_DATE_FORMAT = '%Y-%m-%d'
+
 
 def CatalogRegenerationLockName(track, os_version):
   return _CATALOG_REGENERATION_LOCK_NAME % (
@@ -356,6 +370,60 @@ def GetAutoPromoteDate(track, applesus_product):
       min_date=min_auto_promote_date)
 
 
+def GenerateAppleSUSPromotionSchedule():
+  """Generates and stores the auto-promote schedule for all active products.
+
+  The schedule depends on product tracks and mtimes as well as the auto-promote
+  settings, so this must be called whenever any of those change.
+
+  Returns:
+    dict promotion schedule, in the serialized form stored in ReportsCache.
+  """
+  products = {}
+  query = models.AppleSUSProduct.AllActive()
+  for p in gae_util.QueryIterator(query, step=100):
+    promote_dates = {}
+    for track in [common.TESTING, common.STABLE]:
+      if track in p.tracks:
+        continue
+      promote_date = GetAutoPromoteDate(track, p)
+      if promote_date:
+        promote_dates[track] = promote_date.strftime(_PROMOTE_DATE_FORMAT)
+    if promote_dates:
+      promote_dates['name'] = p.name
+      promote_dates['version'] = p.version
+      products[p.product_id] = promote_dates
+
+  schedule = {
+      'version': hashlib.sha1(json.dumps(products, sort_keys=True)).hexdigest(),
+      'products': products,
+  }
+  models.ReportsCache.SetAppleSUSPromotionSchedule(schedule)
+  return schedule
+
+
+def GetAppleSUSPromotionSchedule():
+  """Returns the auto-promote schedule, generating it if it does not exist.
+
+  Returns:
+    dict with the following keys:
+      version: str, changes whenever any product's promote dates change.
+      products: dict of product_id keys with dict values containing name,
+          version and a datetime.date for each track the product will
+          auto-promote to.
+  """
+  schedule, _ = models.ReportsCache.GetAppleSUSPromotionSchedule()
+  if not schedule:
+    schedule = GenerateAppleSUSPromotionSchedule()
+
+  for promote_dates in schedule['products'].itervalues():
+    for track in [common.TESTING, common.STABLE]:
+      if track in promote_dates:
+        promote_dates[track] = datetime.datetime.strptime(
+            promote_dates[track], _PROMOTE_DATE_FORMAT).date()
+  return schedule
+
+
 def _GetNextWeekdayDate(weekday, min_date=None):
   """Returns the date of the current or next weekday on or after min_date.
 
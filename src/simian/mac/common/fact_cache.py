@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""On-disk cache of facts about a Mac client which are slow to probe.
+
+Each fact is cached with a TTL and the values of its triggers, cheap probes of
+state the fact depends on, like the boot time. A fact is probed again once its
+TTL expires or any of its triggers changes.
+
+Contents:
+
+  class FactCache:
+    to get facts, probing them only when their cached value may be stale
+  def Get:
+    to get a fact from the default cache of this platform
+"""
+
+import hashlib
+import json
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+
+CACHE_OSX_PATH = '/Library/Managed Installs/fact_cache.json'
+CACHE_DEFAULT_PATH = None  # disabled
+# Files rewritten by configd when the network configuration or location
+# changes.
+NETWORK_STATE_FILES = (
+    '/Library/Preferences/SystemConfiguration/preferences.plist',
+    '/var/run/resolv.conf',
+)
+# Sources of facter custom and external facts, like configtrack and site, and
+# the Simian settings simianfacter falls back to. Directories are walked.
+FACT_SOURCE_PATHS = (
+    '/etc/facter/facts.d',
+    '/etc/puppetlabs/facter/facts.d',
+    '/var/lib/puppet/lib/facter',
+    '/opt/puppetlabs/puppet/cache/lib/facter',
+    '/var/lib/puppet/state/classes.txt',
+    '/opt/puppetlabs/puppet/cache/state/classes.txt',
+    '/etc/simian/settings.cfg',
+)
+TRIGGER_BOOT = 'boot'
+TRIGGER_OS_BUILD = 'os_build'
+TRIGGER_NETWORK = 'network'
+TRIGGER_FACT_SOURCES = 'fact_sources'
+
+
+def _Sysctl(name):
+  """Returns the str value of a sysctl, or None if it can't be read."""
+  try:
+    p = subprocess.Popen(
+        ['/usr/sbin/sysctl', '-n', name],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+  except OSError:
+    return None
+  stdout, _ = p.communicate()
+  if p.wait() != 0:
+    return None
+  return stdout.strip()
+
+
+def GetBootTime():
+  """Returns a str identifying the current boot, or None if unknown."""
+  return _Sysctl('kern.boottime')
+
+
+def GetOsBuild():
+  """Returns the str OS version and build, like '10.13.6 17G65'."""
+  return '%s %s' % (platform.mac_ver()[0], _Sysctl('kern.osversion'))
+
+
+def GetNetworkState():
+  """Returns a str of the mtimes of NETWORK_STATE_FILES."""
+  mtimes = []
+  for path in NETWORK_STATE_FILES:
+    try:
+      mtimes.append(str(os.stat(path).st_mtime))
+    except OSError:
+      mtimes.append('')
+  return ','.join(mtimes)
+
+
+def _GetFactSourceFiles():
+  """Yields the str path of every file in FACT_SOURCE_PATHS, in order."""
+  for path in FACT_SOURCE_PATHS:
+    if not os.path.isdir(path):
+      yield path
+      continue
+    for dirpath, dirnames, filenames in os.walk(path):
+      dirnames.sort()
+      for filename in sorted(filenames):
+        yield os.path.join(dirpath, filename)
+
+
+def GetFactSourcesState():
+  """Returns a str digest of the contents of FACT_SOURCE_PATHS.
+
+  Contents are digested rather than mtimes compared, as puppet rewrites its
+  state files on every run even when they don't change.
+  """
+  digest = hashlib.sha256()
+  for path in _GetFactSourceFiles():
+    try:
+      f = open(path, 'rb')
+      try:
+        digest.update('%s\0%s\0' % (path, f.read()))
+      finally:
+        f.close()
+    except IOError:
+      continue  # missing or unreadable.
+  return digest.hexdigest()
+
+
+TRIGGERS = {
+    TRIGGER_BOOT: GetBootTime,
+    TRIGGER_OS_BUILD: GetOsBuild,
+    TRIGGER_NETWORK: GetNetworkState,
+    TRIGGER_FACT_SOURCES: GetFactSourcesState,
+}
+
+_default_cache = []
+
+
+class FactCache(object):
+  """Cache of facts in a JSON file."""
+
+  def __init__(self, path):
+    """Init.
+
+    Args:
+      path: str, path of the cache file, or None to disable caching.
+    """
+    self._path = path
+    self._facts = None
+    self._trigger_values = {}
+
+  def _GetTriggerValues(self, triggers):
+    """Returns a dict of trigger name to its current value."""
+    values = {}
+    for trigger in triggers:
+      if trigger not in self._trigger_values:
+        self._trigger_values[trigger] = TRIGGERS[trigger]()
+      values[trigger] = self._trigger_values[trigger]
+    return values
+
+  def _Load(self):
+    """Returns the dict of cached facts, reading the cache file once."""
+    if self._facts is not None:
+      return self._facts
+    self._facts = {}
+    try:
+      if os.stat(self._path).st_uid != os.geteuid():
+        # don't trust a cache written by anyone else.
+        logging.info('Untrusted fact cache %s, ignoring', self._path)
+        return self._facts
+      f = open(self._path, 'r')
+      try:
+        self._facts = json.load(f)
+      finally:
+        f.close()
+    except (IOError, OSError, ValueError), e:
+      logging.debug('Fact cache not loaded: %s', str(e))
+    if type(self._facts) is not dict:
+      self._facts = {}
+    return self._facts
+
+  def _Save(self):
+    """Writes the cached facts to the cache file."""
+    try:
+      fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self._path))
+      f = os.fdopen(fd, 'w')
+      try:
+        json.dump(self._facts, f)
+      finally:
+        f.close()
+      os.rename(tmp_path, self._path)
+    except (IOError, OSError, TypeError, ValueError), e:
+      logging.warning('Error writing fact cache %s: %s', self._path, str(e))
+
+  def Get(self, name, probe, ttl, triggers=(), now=None):
+    """Returns a fact, probing it only if the cached value may be stale.
+
+    Args:
+      name: str, unique name of the fact.
+      probe: func, returning the current JSON serializable value of the fact.
+          Empty values, which are returned by most probes on failure, are not
+          cached.
+      ttl: int, max seconds to cache the fact for.
+      triggers: sequence of TRIGGER_* names of state the fact depends on.
+      now: float, optional, supply an alternative time.time() value.
+    Returns:
+      the value of the fact.
+    """
+    if self._path is None:
+      return probe()
+    if now is None:
+      now = time.time()
+
+    trigger_values = self._GetTriggerValues(triggers)
+    facts = self._Load()
+    cached = facts.get(name)
+    if (cached and now - ttl < cached['time'] <= now and
+        cached['triggers'] == trigger_values):
+      return cached['value']
+
+    logging.debug('Probing fact %s', name)
+    value = probe()
+    if value:
+      facts[name] = {'time': now, 'triggers': trigger_values, 'value': value}
+      self._Save()
+    return value
+
+  def Invalidate(self, name=None):
+    """Removes a fact, or all facts, from the cache.
+
+    Args:
+      name: str, optional, name of the fact to remove; default all.
+    """
+    if self._path is None:
+      return
+    facts = self._Load()
+    if name is None:
+      facts.clear()
+    else:
+      facts.pop(name, None)
+    self._Save()
+
+
+def GetCachePath():
+  """Returns the str path of the fact cache of this platform, or None."""
+  if platform.system() == 'Darwin':
+    return CACHE_OSX_PATH
+  return CACHE_DEFAULT_PATH
+
+
+def Get(name, probe, ttl, triggers=()):
+  """Returns a fact from the default cache; see FactCache.Get()."""
+  if not _default_cache:
+    _default_cache.append(FactCache(GetCachePath()))
+  return _default_cache[0].Get(name, probe, ttl, triggers=triggers)
@@ -36,6 +36,23 @@ def BatchDatastoreOp(op, entities_or_keys, batch_size=25):
     op(entities_or_keys[i:i + batch_size])
 
 
+def BatchDatastoreOpAsync(op_async, entities_or_keys, batch_size=25):
+  """Performs parallel batch Datastore operations on keys or entities.
+
+  All batches are issued before waiting on any of them.
+
+  Args:
+    op_async: func, async Datastore operation, i.e. db.put_async.
+    entities_or_keys: sequence, db.Key or db.Model instances.
+    batch_size: int, number of keys or entities to batch per operation.
+  Returns:
+    list of results, one per batch.
+  """
+  rpcs = [op_async(entities_or_keys[i:i + batch_size])
+          for i in xrange(0, len(entities_or_keys), batch_size)]
+  return [rpc.get_result() for rpc in rpcs]
+
+
 def SafeBlobDel(blobstore_key):
   """Helper method to delete a blob by its key.
 
@@ -23,9 +23,15 @@ Contents:
 """
 
 import subprocess
+from simian.mac.common import fact_cache
 from simian.mac.munki import plist
 
 
+# Seconds a system profile is cached for; it's also probed again on reboot,
+# OS updates and network changes.
+PROFILE_CACHE_TTL = 24 * 60 * 60
+
+
 class Error(Exception):
   """Base class."""
 
@@ -176,6 +182,15 @@ class SystemProfile(object):
             self._profile['isight_serial_number'] = (
                 usb_item.get('d_serial_num', 'unknown'))
 
+  def _GetCacheName(self):
+    """Returns the str fact_cache name of this profile."""
+    return 'system_profile_%s' % ','.join(sorted(self._include_only or []))
+
+  def _ProbeProfile(self):
+    """Returns a new system profile, from a system_profiler run."""
+    self._FindAll()
+    return self._profile
+
   def _FindAll(self):
     """Find all properties from system profile."""
     self._GetSystemProfile()
@@ -207,7 +222,10 @@ class SystemProfile(object):
       }
     """
     if not self._profile:
-      self._FindAll()
+      self._profile = fact_cache.Get(
+          self._GetCacheName(), self._ProbeProfile, PROFILE_CACHE_TTL,
+          triggers=(fact_cache.TRIGGER_BOOT, fact_cache.TRIGGER_OS_BUILD,
+                    fact_cache.TRIGGER_NETWORK))
     return self._profile
 
 
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Per-request RPC and latency instrumentation of webapp2 apps.
+
+Install() wraps the handler dispatch of a webapp2.WSGIApplication. Every API
+call made while a handler runs is counted, timed and sized per service; the
+totals are logged, optionally returned in a debug header, and added to
+per-route latency histograms. Each instance periodically flushes its
+histograms to memcache, where GetRouteStats() sums them into a rolling table
+for the admin UI.
+"""
+
+import json
+import logging
+import threading
+import time
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+
+from simian import settings
+
+
+HOOK_KEY = 'simian_rpc_stats'
+DEBUG_HEADER = 'X-Simian-RPC-Stats'
+# Requests slower than this are logged at info level, others at debug.
+SLOW_REQUEST_MS = 1000
+# Upper bounds, in ms, of the latency histogram buckets; the last is open.
+LATENCY_BUCKETS_MS = [
+    10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000]
+PERCENTILES = [50, 90, 99]
+METRICS = ['count', 'ms', 'rpcs', 'rpc_ms', 'bytes']
+FLUSH_SECS = 60
+WINDOW_SECS = 300
+# Number of windows summed by GetRouteStats(), i.e. the last hour.
+WINDOWS = 12
+MEMCACHE_KEY_PREFIX = 'rpc_stats_'
+
+_local = threading.local()
+_lock = threading.Lock()
+# str route name to dict of str metric, or int bucket index, to int value.
+_pending = {}
+_last_flush = [time.time()]
+
+
+def GetRouteName(route):
+  """Returns a short str name of the handler of a webapp2 route."""
+  handler = route.handler
+  if isinstance(handler, basestring):
+    return '.'.join(handler.split('.')[-2:])
+  return '%s.%s' % (handler.__module__.rsplit('.', 1)[-1], handler.__name__)
+
+
+def _PreCallHook(
+    unused_service, unused_call, request, unused_response, unused_rpc):
+  """apiproxy pre-call hook, recording the start time of an API call."""
+  if getattr(_local, 'stats', None) is not None:
+    _local.starts[id(request)] = time.time()
+
+
+def _PostCallHook(
+    service, unused_call, request, response, unused_rpc, unused_error):
+  """apiproxy post-call hook, recording the count, time and size of a call."""
+  stats = getattr(_local, 'stats', None)
+  if stats is None:
+    return
+  start = _local.starts.pop(id(request), None)
+  ms = 0
+  if start is not None:
+    ms = (time.time() - start) * 1000
+  try:
+    size = request.ByteSize() + response.ByteSize()
+  except Exception:  # pylint: disable=broad-except
+    size = 0  # incomplete responses of failed calls can't always be sized.
+  service_stats = stats.setdefault(service, {'count': 0, 'ms': 0, 'bytes': 0})
+  service_stats['count'] += 1
+  service_stats['ms'] += ms
+  service_stats['bytes'] += size
+
+
+def _GetBucket(ms):
+  """Returns the int index of the latency histogram bucket of ms."""
+  for i, upper in enumerate(LATENCY_BUCKETS_MS):
+    if ms <= upper:
+      return i
+  return len(LATENCY_BUCKETS_MS)
+
+
+def _GetWindow(now):
+  """Returns the int window number of a time.time() value."""
+  return int(now // WINDOW_SECS)
+
+
+def _GetMemcacheKey(window, route, metric):
+  return '%s%d_%s_%s' % (MEMCACHE_KEY_PREFIX, window, route, metric)
+
+
+def _Record(route, ms, stats):
+  """Adds a request to the pending per-route totals of this instance."""
+  with _lock:
+    totals = _pending.setdefault(route, {})
+    for metric, value in [
+        ('count', 1), ('ms', ms),
+        ('rpcs', sum(s['count'] for s in stats.itervalues())),
+        ('rpc_ms', sum(s['ms'] for s in stats.itervalues())),
+        ('bytes', sum(s['bytes'] for s in stats.itervalues())),
+        (_GetBucket(ms), 1)]:
+      totals[metric] = totals.get(metric, 0) + int(value)
+
+
+def Flush(now=None):
+  """Adds the pending per-route totals of this instance to memcache.
+
+  Args:
+    now: float, optional, supply an alternative time.time() value.
+  """
+  if now is None:
+    now = time.time()
+  with _lock:
+    pending = dict(_pending)
+    _pending.clear()
+    _last_flush[0] = now
+  if not pending:
+    return
+
+  window = _GetWindow(now)
+  deltas = {}
+  for route, totals in pending.iteritems():
+    for metric, value in totals.iteritems():
+      deltas[_GetMemcacheKey(window, route, metric)] = value
+  # offset_multi() can't set an expiry, so create expiring keys first.
+  memcache.add_multi(
+      dict.fromkeys(deltas, 0), time=WINDOW_SECS * (WINDOWS + 1))
+  memcache.offset_multi(deltas)
+
+
+def _FormatDebugHeader(stats):
+  """Returns a str summary of per-service stats, for DEBUG_HEADER."""
+  return ', '.join(
+      '%s=%d/%dms/%dB' % (service, s['count'], s['ms'], s['bytes'])
+      for service, s in sorted(stats.iteritems()))
+
+
+def _InstallHooks():
+  """Adds the apiproxy hooks, unless the current apiproxy already has them."""
+  apiproxy = apiproxy_stub_map.apiproxy
+  apiproxy.GetPreCallHooks().Append(HOOK_KEY, _PreCallHook)
+  apiproxy.GetPostCallHooks().Append(HOOK_KEY, _PostCallHook)
+
+
+def _Dispatch(router, request, response):
+  """webapp2 dispatcher recording the RPCs made by the dispatched handler."""
+  # the apiproxy is replaced when testbeds are activated, so check every time.
+  _InstallHooks()
+  _local.stats = {}
+  _local.starts = {}
+  start = time.time()
+  try:
+    return router.default_dispatcher(request, response)
+  finally:
+    stats = _local.stats
+    _local.stats = None
+    _local.starts = {}
+    ms = (time.time() - start) * 1000
+    route = getattr(request, 'route', None)
+    # requests not matching any route have no handler to attribute stats to.
+    if route is not None:
+      route_name = GetRouteName(route)
+      _Record(route_name, ms, stats)
+      log = logging.info if ms >= SLOW_REQUEST_MS else logging.debug
+      log('rpc_stats %s', json.dumps({
+          'route': route_name, 'method': request.method, 'ms': int(ms),
+          'rpcs': dict((service, dict((k, int(v)) for k, v in s.iteritems()))
+                       for service, s in stats.iteritems())}))
+      if settings.DEBUG:
+        response.headers[DEBUG_HEADER] = _FormatDebugHeader(stats)
+      if time.time() - _last_flush[0] >= FLUSH_SECS:
+        try:
+          Flush()
+        except Exception:  # pylint: disable=broad-except
+          logging.exception('Error flushing rpc stats.')
+
+
+def Install(app):
+  """Instruments all handlers of a webapp2.WSGIApplication.
+
+  Args:
+    app: webapp2.WSGIApplication instance.
+  """
+  app.router.set_dispatcher(_Dispatch)
+
+
+def GetRouteNames(apps):
+  """Returns a sorted list of unique route names of webapp2 apps."""
+  names = set()
+  for app in apps:
+    for route in app.router.match_routes:
+      names.add(GetRouteName(route))
+  return sorted(names)
+
+
+def _GetPercentile(buckets, count, percentile):
+  """Returns the upper bound in ms of the bucket holding a percentile.
+
+  Args:
+    buckets: list of int request counts per LATENCY_BUCKETS_MS bucket.
+    count: int, total number of requests.
+    percentile: int, percentile to find.
+  Returns:
+    int ms, or None if the percentile lies in the open-ended last bucket.
+  """
+  seen = 0
+  for i, n in enumerate(buckets):
+    seen += n
+    if seen * 100 >= count * percentile:
+      if i < len(LATENCY_BUCKETS_MS):
+        return LATENCY_BUCKETS_MS[i]
+      return None
+  return None
+
+
+def GetRouteStats(routes, now=None):
+  """Returns rolling latency and RPC stats of routes over the last WINDOWS.
+
+  Args:
+    routes: list of str route names, as returned by GetRouteNames().
+    now: float, optional, supply an alternative time.time() value.
+  Returns:
+    list of dicts with route, count, avg_ms, avg_rpcs, avg_rpc_ms, avg_bytes
+    and percentiles (list of (int percentile, int ms or None)) keys, for
+    routes with requests, sorted by descending count.
+  """
+  if now is None:
+    now = time.time()
+  last = _GetWindow(now)
+  metrics = METRICS + range(len(LATENCY_BUCKETS_MS) + 1)
+  keys = [
+      _GetMemcacheKey(window, route, metric)
+      for window in xrange(last - WINDOWS + 1, last + 1)
+      for route in routes
+      for metric in metrics]
+  values = memcache.get_multi(keys)
+
+  table = []
+  for route in routes:
+    totals = dict.fromkeys(metrics, 0)
+    for window in xrange(last - WINDOWS + 1, last + 1):
+      for metric in metrics:
+        totals[metric] += values.get(
+            _GetMemcacheKey(window, route, metric), 0)
+    count = totals['count']
+    if not count:
+      continue
+    buckets = [totals[i] for i in xrange(len(LATENCY_BUCKETS_MS) + 1)]
+    table.append({
+        'route': route,
+        'count': count,
+        'avg_ms': totals['ms'] / count,
+        'avg_rpcs': float(totals['rpcs']) / count,
+        'avg_rpc_ms': totals['rpc_ms'] / count,
+        'avg_bytes': totals['bytes'] / count,
+        'percentiles': [
+            (p, _GetPercentile(buckets, count, p)) for p in PERCENTILES],
+    })
+  table.sort(key=lambda r: r['count'], reverse=True)
+  return table
@@ -18,12 +18,16 @@
 
 import datetime
 import json
+import logging
 import os
 import urllib
 
 from simian.mac import common
 
 
+HEADER_DATE_FORMAT = '%a, %d %b %Y %H:%M:%S GMT'
+
+
 class Error(Exception):
   """Base error."""
 
@@ -132,6 +136,24 @@ def Deserialize(s, parse_float=float):
     raise DeserializeError(e)
 
 
+def StrHeaderDateToDatetime(str_header_dt):
+  """Converts a string header date to a datetime object.
+
+  Args:
+    str_header_dt: str date from header, i.e. If-Modified-Since.
+  Returns:
+    datetime.datetime object, or None if there's a parsing error.
+  """
+  if not str_header_dt:
+    return
+  try:
+    # NOTE(user): strptime is a py2.5+ feature.
+    return datetime.datetime.strptime(str_header_dt, HEADER_DATE_FORMAT)
+  except ValueError:
+    logging.exception(
+        'Error parsing If-Modified-Since date: %s', str_header_dt)
+
+
 def UrlUnquote(s):
   """Return unquoted version of a url string."""
   return urllib.unquote(s)
@@ -21,7 +21,6 @@ Classes:
 """
 
 import datetime
-import gc
 import httplib
 import logging
 import time
@@ -244,17 +243,16 @@ class AppleSUSCatalogSync(webapp2.RequestHandler):
         if not catalog_obj:
           logging.error('Catalog does not exist: %s', key)
           continue
-        catalog_plist = plist.ApplePlist(catalog_obj.plist)
+        # catalog xml is ~4MB, so stream products rather than parse it whole.
+        products = set()
         try:
-          catalog_plist.Parse()
+          for product, _ in plist.IterParseItems(
+              catalog_obj.plist, path=('Products',)):
+            products.add(product)
         except plist.Error:
           logging.exception('Error parsing Apple Updates catalog: %s', key)
           continue
-        for product in catalog_plist.get('Products', []):
-          catalog_products.add(product)
-      # catalog xml is ~4MB, parsing creates a lot of interconnected
-      # temporary objects
-      gc.collect()
+        catalog_products.update(products)
 
     deprecated = []
     # Loop over Datastore products, deprecating all that aren't in any catalogs.
@@ -295,6 +293,9 @@ class AppleSUSCatalogSync(webapp2.RequestHandler):
     models.AdminAppleSUSProductLog.Log(
         deprecated_products, 'deprecated for %s' % os_version)
 
+    if new_products or deprecated_products:
+      applesus.GenerateAppleSUSPromotionSchedule()
+
   @classmethod
   def _ProcessCatalog(cls, os_version):
     url = CATALOGS.get(os_version, 'UNKNOWN_OS_VERSION')
@@ -389,4 +390,5 @@ class AppleSUSAutoPromote(webapp2.RequestHandler):
             promotions[track], 'auto-promote to %s' % track)
 
     if promotions:
+      applesus.GenerateAppleSUSPromotionSchedule()
       self._NotifyAdminsOfAutoPromotions(promotions)
@@ -39,6 +39,10 @@ app = webapp2.WSGIApplication([
     ('/cron/maintenance/mark_computers_inactive',
      maintenance.MarkComputersInactive),
     ('/cron/maintenance/verify_packages', maintenance.VerifyPackages),
+    ('/cron/maintenance/install_count_bucket_cleanup',
+     maintenance.InstallCountBucketCleanup),
+    ('/cron/maintenance/install_count_bucket_rollup',
+     maintenance.InstallCountBucketRollup),
     ('/cron/maintenance/update_avg_install_durations',
      maintenance.UpdateAverageInstallDurations),
 
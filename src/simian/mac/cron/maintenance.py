@@ -28,6 +28,7 @@ import uuid
 import webapp2
 
 from google.appengine.ext import blobstore
+from google.appengine.ext import db
 from google.appengine.ext import deferred
 
 from simian.mac.common import datastore_locks
@@ -85,9 +86,51 @@ class AuthSessionCleanup(webapp2.RequestHandler):
 class MarkComputersInactive(webapp2.RequestHandler):
   """Class to mark all inactive hosts as such in Datastore."""
 
+  @classmethod
+  def _DeferMarkInactive(cls, cursor=None, count=0):
+    deferred_name = 'mark_computers_inactive_%s' % str(uuid.uuid1())
+    deferred.defer(cls._MarkInactive, cursor, count, _name=deferred_name)
+
+  @classmethod
+  def _MarkInactive(cls, cursor, count):
+    """Marks one batch of computers inactive, then defers the next batch."""
+    marked, cursor = models.Computer.MarkInactive(cursor=cursor)
+    count += marked
+    if cursor:
+      cls._DeferMarkInactive(cursor=cursor, count=count)
+    else:
+      logging.info('Complete! Marked %s inactive.', count)
+
   def get(self):
-    count = models.Computer.MarkInactive()
-    logging.info('Complete! Marked %s inactive.', count)
+    """Handle GET."""
+    self._DeferMarkInactive()
+
+
+class InstallCountBucketCleanup(webapp2.RequestHandler):
+  """Class to delete hourly install count buckets past their retention."""
+
+  @classmethod
+  def _DeleteExpired(cls):
+    """Deletes one batch of expired buckets, then defers the next batch."""
+    expiry = datetime.datetime.utcnow() - datetime.timedelta(
+        days=models.INSTALL_COUNT_BUCKET_RETENTION_DAYS)
+    keys = models.InstallCountBucket.all(keys_only=True).filter(
+        'hour <', expiry).fetch(settings.ENTITIES_PER_DEFERRED_TASK)
+    gae_util.BatchDatastoreOp(db.delete, keys)
+    if len(keys) == settings.ENTITIES_PER_DEFERRED_TASK:
+      deferred.defer(cls._DeleteExpired)
+
+  def get(self):
+    """Handle GET."""
+    self._DeleteExpired()
+
+
+class InstallCountBucketRollup(webapp2.RequestHandler):
+  """Class to roll install count bucket shards up into hours and days."""
+
+  def get(self):
+    """Handle GET."""
+    models.InstallCountBucket.Rollup()
 
 
 class UpdateAverageInstallDurations(webapp2.RequestHandler):
@@ -141,15 +184,74 @@ class VerifyPackages(webapp2.RequestHandler):
 
   def get(self):
     """Handle GET."""
-    self._NotifyAboutPkgInfosWithoutFile()
-    self._ScheduleRemovalOfOrphanedBlobs()
+    orphaned, missing = self._DiffBlobsAndPackages()
+    self._NotifyAboutPkgInfosWithoutFile(missing)
+    if orphaned:
+      # Datastore is eventually consistent.
+      # related package info can be available later.
+      deferred_name = 'remove_orphaned_blobs_%s' % str(uuid.uuid1())
+      deferred.defer(
+          self._DoubleCheckAndRemove, orphaned,
+          _name=deferred_name, _countdown=600)
 
-  def _NotifyAboutPkgInfosWithoutFile(self):
-    """Verify that entities older than a week have a file in Blobstore."""
-    for p in models.PackageInfo.all():
-      if p.blobstore_key and blobstore.BlobInfo.get(p.blobstore_key):
-        continue
-      elif p.mtime < (datetime.datetime.utcnow() - datetime.timedelta(days=7)):
+  @classmethod
+  def _DiffBlobsAndPackages(cls):
+    """Returns the set difference between Blobstore and PackageInfo blob keys.
+
+    Blob keys are streamed with a keys-only query and referenced blobstore_key
+    values with a distinct projection query. Both are ordered by blob key, so
+    they are merged in a single pass. PackageInfo entities without a
+    blobstore_key are skipped here; _NotifyAboutPkgInfosWithoutFile() queries
+    them separately.
+
+    Returns:
+      tuple of (list of str blob keys which no PackageInfo references,
+      list of str blobstore_key values referenced by a PackageInfo but lacking
+      a blob).
+    """
+    blob_query = db.Query(blobstore.BlobInfo, keys_only=True, namespace='')
+    blob_query.order('__key__')
+    blob_keys = (k.name() for k in gae_util.QueryIterator(blob_query))
+
+    pkg_query = db.Query(
+        models.PackageInfo, projection=('blobstore_key',), distinct=True)
+    pkg_query.order('blobstore_key')
+    # None sorts first, and would be mistaken for the end of pkg_keys.
+    pkg_keys = (
+        p.blobstore_key for p in gae_util.QueryIterator(pkg_query)
+        if p.blobstore_key is not None)
+
+    orphaned = []
+    missing = []
+    blob_key = next(blob_keys, None)
+    pkg_key = next(pkg_keys, None)
+    while blob_key is not None or pkg_key is not None:
+      if pkg_key is None or (blob_key is not None and blob_key < pkg_key):
+        orphaned.append(blob_key)
+        blob_key = next(blob_keys, None)
+      elif blob_key is None or pkg_key < blob_key:
+        missing.append(pkg_key)
+        pkg_key = next(pkg_keys, None)
+      else:
+        blob_key = next(blob_keys, None)
+        pkg_key = next(pkg_keys, None)
+    return orphaned, missing
+
+  def _NotifyAboutPkgInfosWithoutFile(self, missing_blob_keys):
+    """Verify that entities older than a week have a file in Blobstore.
+
+    Args:
+      missing_blob_keys: list of str blobstore_key values without a blob.
+    """
+    queries = [models.PackageInfo.all().filter('blobstore_key =', None)]
+    for key in missing_blob_keys:
+      queries.append(models.PackageInfo.all().filter('blobstore_key =', key))
+
+    week_ago = datetime.datetime.utcnow() - datetime.timedelta(days=7)
+    for query in queries:
+      for p in query:
+        if p.mtime >= week_ago:
+          continue
         subject = 'Package is lacking a file: %s' % p.filename
         body = (
             'The following package is lacking a DMG file: \n'
@@ -158,43 +260,22 @@ class VerifyPackages(webapp2.RequestHandler):
         mail.SendMail(settings.EMAIL_ADMIN_LIST, subject, body, defer=False)
 
   @classmethod
-  def _DoubleCheckAndRemove(cls, infos):
-    for blob_info in infos:
-      key = blob_info.key()
-      pkg = models.PackageInfo.all().filter('blobstore_key =', key).get()
-      if pkg:
+  def _DoubleCheckAndRemove(cls, blob_keys):
+    """Deletes blobs which are still unreferenced by any PackageInfo.
+
+    Args:
+      blob_keys: list of str blob keys believed to be orphaned.
+    """
+    blob_keys = [
+        k for k in blob_keys
+        if not models.PackageInfo.all(keys_only=True).filter(
+            'blobstore_key =', k).get()]
+    if not blob_keys:
+      return
+    for blob_info in blobstore.BlobInfo.get(blob_keys):
+      if not blob_info:
         continue
       logging.info(
-          'deleting orphaned blob: %s %s', blob_info.filename, str(key))
+          'deleting orphaned blob: %s %s', blob_info.filename,
+          str(blob_info.key()))
       blob_info.delete()
-
-  @classmethod
-  def _ScheduleRemovalOfOrphanedBlobs(cls, cursor=None):
-    query = blobstore.BlobInfo.all()
-    if cursor is not None:
-      query.with_cursor(cursor)
-    infos = query.fetch(settings.ENTITIES_PER_DEFERRED_TASK)
-
-    orphaned = []
-    for blob_info in infos:
-      # Filter by blobstore_key as duplicate filenames are allowed in Blobstore.
-      key = blob_info.key()
-      pkg = models.PackageInfo.all().filter('blobstore_key =', key).get()
-      is_orphaned = pkg is None
-      if is_orphaned:
-        orphaned.append(blob_info)
-
-    if orphaned:
-      # Datastore is eventually consistent.
-      # related package info can be available later.
-      deferred_name = 'remove_orphaned_blobs_%s' % str(uuid.uuid1())
-      deferred.defer(
-          cls._DoubleCheckAndRemove, orphaned,
-          _name=deferred_name, _countdown=600)
-    if len(infos) == settings.ENTITIES_PER_DEFERRED_TASK:
-      deferred_name = 'find_orphaned_blobs_%s' % str(uuid.uuid1())
-      deferred.defer(
-          cls._ScheduleRemovalOfOrphanedBlobs, query.cursor(),
-          _name=deferred_name)
-
-
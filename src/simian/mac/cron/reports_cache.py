@@ -26,7 +26,6 @@ import logging
 import time
 import webapp2
 
-from google.appengine.api import taskqueue
 from google.appengine.ext import db
 from google.appengine.ext import deferred
 
@@ -35,179 +34,36 @@ from simian.mac import models
 from simian.mac.admin import summary as summary_module
 
 
-TRENDING_INSTALLS_LIMIT = 5
 RUNTIME_MAX_SECS = 30
+# Size of the server_datetime partitions of InstallLog counted in parallel.
+INSTALL_COUNTS_PARTITION = datetime.timedelta(minutes=15)
+# Partitions are only counted once they are this old, so that eventually
+# consistent server_datetime queries return every InstallLog in them.
+INSTALL_COUNTS_SETTLE = datetime.timedelta(minutes=5)
+# Max number of partitions fanned out ahead of the watermark.
+INSTALL_COUNTS_MAX_SHARDS = 100
+# Incomplete shards not updated for this long are rolled up again.
+INSTALL_COUNTS_STALE = datetime.timedelta(minutes=10)
+INSTALL_COUNTS_FETCH_LIMIT = 1000
+INSTALL_COUNTS_MERGE_RETRY_SECS = 30
 
 
 class ReportsCache(webapp2.RequestHandler):
   """Class to cache reports on a regular basis."""
 
-  USER_EVENTS = [
-      'launched',
-      'install_with_logout',
-      'install_without_logout',
-      'cancelled',
-      'exit_later_clicked',
-      'exit_installwithnologout',
-      'conflicting_apps'
-  ]
-
-  FETCH_LIMIT = 500
-
   def get(self, name=None, arg=None):
     """Handle GET."""
 
     if name == 'summary':
-      _GenerateComputersSummaryCache()
+      _ReconcileComputerSummaryCounters()
     elif name == 'installcounts':
       _GenerateInstallCounts()
-    elif name == 'trendinginstalls':
-      if arg:
-        try:
-          kwargs = {'since_hours': int(arg)}
-        except ValueError:
-          kwargs = {}
-      else:
-        kwargs = {}
-      _GenerateTrendingInstallsCache(**kwargs)
     elif name == 'pendingcounts':
       self._GeneratePendingCounts()
-    elif name == 'msu_user_summary':
-      if arg:
-        try:
-          kwargs = {'since_days': int(arg)}
-        except ValueError:
-          kwargs = {}
-      else:
-        kwargs = {}
-      self._GenerateMsuUserSummary(**kwargs)
     else:
       logging.warning('Unknown ReportsCache cron requested: %s', name)
       self.response.set_status(httplib.NOT_FOUND)
 
-  def _GenerateMsuUserSummary(self, since_days=None, now=None):
-    """Generate summary of MSU user data.
-
-    Args:
-      since_days: int, optional, only report on the last x days
-      now: datetime.datetime, optional, supply an alternative
-        value for the current date/time
-    """
-    lock_name = 'msu_user_summary_lock'
-    cursor_name = 'msu_user_summary_cursor'
-    if since_days is None:
-      since = None
-    else:
-      since = '%dD' % since_days
-      lock_name = '%s_%s' % (lock_name, since)
-      cursor_name = '%s_%s' % (cursor_name, since)
-
-    lock = datastore_locks.DatastoreLock(lock_name)
-    try:
-      lock.Acquire(timeout=RUNTIME_MAX_SECS + 10, max_acquire_attempts=2)
-    except datastore_locks.AcquireLockError:
-      logging.warning('GenerateMsuUserSummary lock found; exiting.')
-      return
-
-    interested_events = self.USER_EVENTS
-
-    lquery = models.ComputerMSULog.all()
-    cursor = models.KeyValueCache.MemcacheWrappedGet(
-        cursor_name, 'text_value')
-    summary, unused_dt = models.ReportsCache.GetMsuUserSummary(
-        since=since, tmp=True)
-
-    if cursor and summary:
-      lquery.with_cursor(cursor)
-    else:
-      summary = {}
-      for event in interested_events:
-        summary[event] = 0
-      summary['total_events'] = 0
-      summary['total_users'] = 0
-      summary['total_uuids'] = 0
-      models.ReportsCache.SetMsuUserSummary(
-          summary, since=since, tmp=True)
-
-    begin = time.time()
-    if now is None:
-      now = datetime.datetime.utcnow()
-
-    while True:
-      reports = lquery.fetch(self.FETCH_LIMIT)
-      if not reports:
-        break
-
-      userdata = {}
-      last_user = None
-      last_user_cursor = None
-      prev_user_cursor = None
-
-      n = 0
-      for report in reports:
-        userdata.setdefault(report.user, {})
-        userdata[report.user].setdefault(
-            report.uuid, {}).update(
-                {report.event: report.mtime})
-        if last_user != report.user:
-          last_user = report.user
-          prev_user_cursor = last_user_cursor
-          last_user_cursor = str(lquery.cursor())
-        n += 1
-
-      if n == self.FETCH_LIMIT:
-        # full fetch, might not have finished this user -- rewind
-        del userdata[last_user]
-        last_user_cursor = prev_user_cursor
-
-      for user in userdata:
-        events = 0
-        for uuid in userdata[user]:
-          if 'launched' not in userdata[user][uuid]:
-            continue
-          for event in userdata[user][uuid]:
-            if since_days is None or IsTimeDelta(
-                userdata[user][uuid][event], now, days=since_days):
-              summary.setdefault(event, 0)
-              summary[event] += 1
-              summary['total_events'] += 1
-              events += 1
-          if events:
-            summary['total_uuids'] += 1
-        if events:
-          summary['total_users'] += 1
-          summary.setdefault('total_users_%d_events' % events, 0)
-          summary['total_users_%d_events' % events] += 1
-
-      lquery = models.ComputerMSULog.all()
-      lquery.with_cursor(last_user_cursor)
-
-      end = time.time()
-      if (end - begin) > RUNTIME_MAX_SECS:
-        break
-
-    if reports:
-      models.ReportsCache.SetMsuUserSummary(
-          summary, since=since, tmp=True)
-      models.KeyValueCache.MemcacheWrappedSet(
-          cursor_name, 'text_value', last_user_cursor)
-      if since_days:
-        args = '/%d' % since_days
-      else:
-        args = ''
-      taskqueue.add(
-          url='/cron/reports_cache/msu_user_summary%s' % args,
-          method='GET',
-          countdown=5)
-    else:
-      models.ReportsCache.SetMsuUserSummary(
-          summary, since=since)
-      models.KeyValueCache.DeleteMemcacheWrap(
-          cursor_name, prop_name='text_value')
-      models.ReportsCache.DeleteMsuUserSummary(since=since, tmp=True)
-
-    lock.Release()
-
   def _GeneratePendingCounts(self):
     """Generates a dictionary of all install names and their pending count."""
     d = {}
@@ -217,131 +73,265 @@ class ReportsCache(webapp2.RequestHandler):
     models.ReportsCache.SetPendingCounts(d)
 
 
-def _GenerateInstallCounts():
-  """Generates a dictionary of all installs names and the count of each."""
+def _GetInstallCountsWatermark(now):
+  """Returns the install counts watermark, initializing it if needed.
 
-  # Obtain a lock.
-  lock_name = 'pkgs_list_cron_lock'
-  lock = datastore_locks.DatastoreLock(lock_name)
-  try:
-    lock.Acquire(timeout=600, max_acquire_attempts=1)
-  except datastore_locks.AcquireLockError:
-    logging.warning('GenerateInstallCounts: lock found; exiting.')
-    return
-
-  # Get a list of all packages that have previously been pushed.
-  pkgs, unused_dt = models.ReportsCache.GetInstallCounts()
+  Args:
+    now: datetime.datetime, the current date/time.
+  Returns:
+    datetime.datetime up to which InstallLog entities are counted.
+  """
+  pkgs, watermark = models.ReportsCache.GetInstallCountsState()
+  if watermark is not None:
+    return watermark
 
-  # Generate a query of all InstallLog entites that haven't been read yet.
+  # Continue where the old serial rollup left off, if it ever ran.
   query = models.InstallLog.all().order('server_datetime')
   cursor_obj = models.KeyValueCache.get_by_key_name('pkgs_list_cursor')
-  if cursor_obj:
+  if pkgs and cursor_obj:
     query.with_cursor(cursor_obj.text_value)
+  else:
+    pkgs = {}
 
-  # Loop over new InstallLog entries.
-  try:
-    installs = query.fetch(1000)
-  except db.Error:
-    installs = None
-  if not installs:
-    models.ReportsCache.SetInstallCounts(pkgs)
-    lock.Release()
-    return
+  first_install = query.get()
+  if first_install:
+    watermark = first_install.server_datetime
+  else:
+    watermark = now - INSTALL_COUNTS_SETTLE
+
+  models.ReportsCache.SetInstallCountsState(pkgs, watermark)
+  if cursor_obj:
+    cursor_obj.delete()
+  return watermark
+
+
+def _GetInstallCountShardStarts(watermark, horizon):
+  """Returns start datetimes of the shards following watermark.
+
+  Args:
+    watermark: datetime.datetime, start of the first shard.
+    horizon: datetime.datetime, no shard may end after this.
+  Returns:
+    list of datetime.datetime, at most INSTALL_COUNTS_MAX_SHARDS long.
+  """
+  starts = []
+  start = watermark
+  while (start + INSTALL_COUNTS_PARTITION <= horizon and
+         len(starts) < INSTALL_COUNTS_MAX_SHARDS):
+    starts.append(start)
+    start += INSTALL_COUNTS_PARTITION
+  return starts
+
+
+def _CountInstalls(pkgs, installs):
+  """Adds InstallLog entities to a dictionary of per-package counts.
 
+  Args:
+    pkgs: dict, package name keys with count dict values, modified in place.
+    installs: iterable of models.InstallLog entities.
+  """
   for install in installs:
-    pkg_name = install.package
+    counts = pkgs.setdefault(install.package, {
+        'install_count': 0,
+        'install_fail_count': 0,
+        'applesus': install.applesus,
+        'duration_count': 0,
+        'duration_total_seconds': 0,
+    })
+    if install.IsSuccess():
+      counts['install_count'] += 1
+      # only count durations on entities with "duration_seconds" != None.
+      if getattr(install, 'duration_seconds', None) is not None:
+        counts['duration_count'] += 1
+        counts['duration_total_seconds'] += install.duration_seconds
+    else:
+      counts['install_fail_count'] += 1
+
+
+def _MergeInstallCounts(pkgs, shard_pkgs):
+  """Merges per-package counts from a shard into the install counts.
+
+  Args:
+    pkgs: dict, install counts as stored in ReportsCache, modified in place.
+    shard_pkgs: dict, per-package counts from an InstallCountShard.
+  """
+  for pkg_name, counts in shard_pkgs.iteritems():
     if pkg_name not in pkgs:
       pkgs[pkg_name] = {
           'install_count': 0,
           'install_fail_count': 0,
-          'applesus': install.applesus,
+          'applesus': counts['applesus'],
       }
-    if install.IsSuccess():
-      pkgs[pkg_name]['install_count'] = (
-          pkgs[pkg_name].setdefault('install_count', 0) + 1)
-      # (re)calculate avg_duration_seconds for this package.
-      if 'duration_seconds_avg' not in pkgs[pkg_name]:
-        pkgs[pkg_name]['duration_count'] = 0
-        pkgs[pkg_name]['duration_total_seconds'] = 0
-        pkgs[pkg_name]['duration_seconds_avg'] = None
-      # only proceed if entity has "duration_seconds" property != None.
-      if getattr(install, 'duration_seconds', None) is not None:
-        pkgs[pkg_name]['duration_count'] += 1
-        pkgs[pkg_name]['duration_total_seconds'] += (
-            install.duration_seconds)
-        pkgs[pkg_name]['duration_seconds_avg'] = int(
-            pkgs[pkg_name]['duration_total_seconds'] /
-            pkgs[pkg_name]['duration_count'])
-    else:
-      pkgs[pkg_name]['install_fail_count'] = (
-          pkgs[pkg_name].setdefault('install_fail_count', 0) + 1)
+    pkg = pkgs[pkg_name]
+    pkg['install_count'] = (
+        pkg.get('install_count', 0) + counts['install_count'])
+    pkg['install_fail_count'] = (
+        pkg.get('install_fail_count', 0) + counts['install_fail_count'])
+    if not counts['install_count']:
+      continue
+    # (re)calculate avg_duration_seconds for this package.
+    if 'duration_seconds_avg' not in pkg:
+      pkg['duration_count'] = 0
+      pkg['duration_total_seconds'] = 0
+      pkg['duration_seconds_avg'] = None
+    if counts['duration_count']:
+      pkg['duration_count'] += counts['duration_count']
+      pkg['duration_total_seconds'] += counts['duration_total_seconds']
+      pkg['duration_seconds_avg'] = int(
+          pkg['duration_total_seconds'] / pkg['duration_count'])
+
+
+def _GenerateInstallCounts(now=None):
+  """Fans out install count rollups over new partitions of InstallLog.
+
+  InstallLog entities after the install counts watermark are split into fixed
+  size server_datetime partitions, and each partition is counted in parallel
+  by its own _RollupInstallCountShard task. Completed shards are then folded
+  into the install counts by _MergeInstallCountShards().
 
-  # Update any changed packages.
-  models.ReportsCache.SetInstallCounts(pkgs)
-
-  if not cursor_obj:
-    cursor_obj = models.KeyValueCache(key_name='pkgs_list_cursor')
+  Args:
+    now: datetime.datetime, optional, supply an alternative
+      value for the current date/time
+  """
+  lock = datastore_locks.DatastoreLock('pkgs_list_cron_lock')
+  try:
+    lock.Acquire(timeout=RUNTIME_MAX_SECS + 10, max_acquire_attempts=1)
+  except datastore_locks.AcquireLockError:
+    logging.warning('GenerateInstallCounts: lock found; exiting.')
+    return
 
-  cursor_txt = str(query.cursor())
-  cursor_obj.text_value = cursor_txt
-  cursor_obj.put()
+  if now is None:
+    now = datetime.datetime.utcnow()
+  watermark = _GetInstallCountsWatermark(now)
+  starts = _GetInstallCountShardStarts(watermark, now - INSTALL_COUNTS_SETTLE)
+  key_names = [models.InstallCountShard.KeyName(start) for start in starts]
+  if key_names:
+    shards = models.InstallCountShard.get_by_key_name(key_names)
+  else:
+    shards = []
+
+  new_shards = []
+  to_rollup = []
+  for start, key_name, shard in zip(starts, key_names, shards):
+    if not shard:
+      new_shards.append(models.InstallCountShard(
+          key_name=key_name, start=start,
+          end=start + INSTALL_COUNTS_PARTITION))
+      to_rollup.append(key_name)
+    elif not shard.complete and now - shard.mtime > INSTALL_COUNTS_STALE:
+      # the task rolling up this shard was lost; start another.
+      to_rollup.append(key_name)
+
+  if new_shards:
+    db.put(new_shards)
+  for key_name in to_rollup:
+    deferred.defer(_RollupInstallCountShard, key_name)
 
-  # Delete the lock.
   lock.Release()
 
-  deferred.defer(_GenerateInstallCounts)
-
-
-def _GenerateTrendingInstallsCacheDeferCallback(
-    since_hours, query, cursor, total_success, total_failure,
-    trending):
-  """Defer task for _GenerateTrendingInstallsCache."""
-  installs = query.with_cursor(cursor).fetch(
-      summary_module.DEFAULT_COMPUTER_FETCH_LIMIT)
-  if installs:
-    for install in installs:
-      pkg = install.package.encode('utf-8')
-      if install.IsSuccess():
-        trending['success'][pkg] = trending['success'].setdefault(pkg, 0) + 1
-        total_success += 1
-      else:
-        trending['failure'][pkg] = trending['failure'].setdefault(pkg, 0) + 1
-        total_failure += 1
+  _MergeInstallCountShards(now=now)
+
+
+def _RollupInstallCountShard(key_name):
+  """Counts the InstallLog entities in one InstallCountShard partition.
+
+  Args:
+    key_name: str, key_name of the InstallCountShard to roll up.
+  """
+  shard = models.InstallCountShard.get_by_key_name(key_name)
+  if not shard or shard.complete:
+    return
+
+  query = models.InstallLog.all().filter(
+      'server_datetime >=', shard.start).filter(
+          'server_datetime <', shard.end).order('server_datetime')
+  if shard.cursor:
+    query.with_cursor(shard.cursor)
+
+  pkgs = shard.GetCounts()
+  begin = time.time()
+  while True:
+    installs = query.fetch(INSTALL_COUNTS_FETCH_LIMIT)
+    _CountInstalls(pkgs, installs)
+    cursor = str(query.cursor())
+    complete = len(installs) < INSTALL_COUNTS_FETCH_LIMIT
+    if complete or time.time() - begin > RUNTIME_MAX_SECS:
+      break
+    query.with_cursor(cursor)
+
+  def _Update():
+    """Saves progress unless another task already saved progress."""
+    current = models.InstallCountShard.get_by_key_name(key_name)
+    if not current or current.complete or current.cursor != shard.cursor:
+      return False
+    current.SetCounts(pkgs)
+    current.cursor = cursor
+    current.complete = complete
+    current.put()
+    return True
+
+  if not db.run_in_transaction(_Update):
+    logging.warning('RollupInstallCountShard: %s changed; exiting.', key_name)
+    return
+
+  if complete:
+    _MergeInstallCountShards()
+  else:
+    deferred.defer(_RollupInstallCountShard, key_name)
+
+
+def _MergeInstallCountShards(now=None):
+  """Merges completed shards following the watermark into install counts.
+
+  Shards are merged strictly in order, so the watermark only ever moves past
+  partitions which have been fully counted.
 
+  Args:
+    now: datetime.datetime, optional, supply an alternative
+      value for the current date/time
+  """
+  lock = datastore_locks.DatastoreLock('install_counts_merge_lock')
+  try:
+    lock.Acquire(timeout=RUNTIME_MAX_SECS + 10, max_acquire_attempts=1)
+  except datastore_locks.AcquireLockError:
     deferred.defer(
-        _GenerateTrendingInstallsCacheDeferCallback, since_hours, query,
-        query.cursor(), total_success, total_failure, trending)
+        _MergeInstallCountShards, _countdown=INSTALL_COUNTS_MERGE_RETRY_SECS)
     return
 
-  # Get the top trending installs and failures.
-  success = sorted(
-      trending['success'].items(), key=lambda i: (i[1], i[0]), reverse=True)
-  success = success[:TRENDING_INSTALLS_LIMIT]
-  success = [(pkg, count, float(count) / total_success * 100)
-             for pkg, count in success]
-  failure = sorted(
-      trending['failure'].items(), key=lambda i: (i[1], i[0]), reverse=True)
-  failure = failure[:TRENDING_INSTALLS_LIMIT]
-  failure = [(pkg, count, float(count) / total_failure * 100)
-             for pkg, count in failure]
-  trending = {
-      'success': {'packages': success, 'total': total_success},
-      'failure': {'packages': failure, 'total': total_failure},
-  }
-  models.ReportsCache.SetTrendingInstalls(since_hours, trending)
-
-
-def _GenerateTrendingInstallsCache(since_hours=None):
-  """Generates trending install and failure data."""
-  if not since_hours:
-    since_hours = 1
-
-  trending = {'success': {}, 'failure': {}}
-  dt = datetime.datetime.utcnow() - datetime.timedelta(minutes=since_hours * 60)
-  query = models.InstallLog.all().filter('mtime >', dt)
-
-  _GenerateTrendingInstallsCacheDeferCallback(
-      since_hours, query, None, 0, 0, trending)
+  pkgs, watermark = models.ReportsCache.GetInstallCountsState()
+  if watermark is None:
+    lock.Release()
+    return
+
+  if now is None:
+    now = datetime.datetime.utcnow()
+  horizon = now - INSTALL_COUNTS_SETTLE
+  key_names = [
+      models.InstallCountShard.KeyName(start)
+      for start in _GetInstallCountShardStarts(watermark, horizon)]
+  if key_names:
+    shards = models.InstallCountShard.get_by_key_name(key_names)
+  else:
+    shards = []
+
+  merged = []
+  for shard in shards:
+    if not shard or not shard.complete:
+      break
+    _MergeInstallCounts(pkgs, shard.GetCounts())
+    watermark = shard.end
+    merged.append(shard)
+
+  if merged:
+    models.ReportsCache.SetInstallCountsState(pkgs, watermark)
+    db.delete(merged)
+
+  lock.Release()
+
+  # partitions beyond those already fanned out are waiting; fan them out.
+  if merged and len(_GetInstallCountShardStarts(watermark, horizon)) > (
+      len(shards) - len(merged)):
+    deferred.defer(_GenerateInstallCounts)
 
 
 def IsTimeDelta(dt1, dt2, seconds=None, minutes=None, hours=None, days=None):
@@ -376,14 +366,22 @@ def IsTimeDelta(dt1, dt2, seconds=None, minutes=None, hours=None, days=None):
     return delta
 
 
-def _GenerateComputersSummaryCache(cursor=None, summary=None):
+def _ReconcileComputerSummaryCounters(cursor=None):
+  """Reconciles the summary counters of all active computers.
+
+  Computer.put() keeps the ComputerSummaryShard counters, which the whole
+  stats summary is rendered from, up to date; this periodic scan only fixes
+  computers whose counters drifted through writes bypassing put(), one at a
+  time, so counters are never reset under concurrent puts.
+
+  Args:
+    cursor: str, optional, query cursor to resume the scan from.
+  """
   query = models.Computer.AllActive().with_cursor(cursor)
 
   computers = query.fetch(summary_module.DEFAULT_COMPUTER_FETCH_LIMIT)
   if computers:
-    summary = summary_module.GetComputerSummary(
-        computers, initial_summary=summary)
-    deferred.defer(_GenerateComputersSummaryCache, query.cursor(), summary)
-    return
-  models.ReportsCache.SetStatsSummary(
-      summary_module.PrepareComputerSummaryForTemplate(summary))
+    drifted = models.Computer.ReconcileSummaryCounters(computers)
+    if drifted:
+      logging.info('Reconciled summary counters of %d computers.', drifted)
+    deferred.defer(_ReconcileComputerSummaryCounters, query.cursor())
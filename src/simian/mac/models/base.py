@@ -16,18 +16,23 @@
 #
 """App Engine Models for Simian web application."""
 
+import collections
 import datetime
 import difflib
-import gc
+import hashlib
 import logging
+import random
 import re
+import threading
 
 from google.appengine.api import memcache
 from google.appengine.ext import db
+from google.appengine.ext import deferred
 
 from simian.mac.common import ipcalc
 from simian.mac.common import gae_util
 from simian.mac.common import util
+from simian.mac.models import computer_search
 from simian.mac.models import properties
 from simian.mac.munki import plist as plist_lib
 
@@ -42,8 +47,55 @@ class InvalidArgumentsError(Error):
 
 # The number of days a client is silent before being considered inactive.
 COMPUTER_ACTIVE_DAYS = 30
+# Max number of computers marked inactive per cross-group transaction.
+COMPUTER_MARK_INACTIVE_TXN_SIZE = 25
 # Default memcache seconds for memcache-backed datastore entities
 MEMCACHE_SECS = 300
+# Max estimated bytes of parsed plists kept in the in-process plist cache.
+PLIST_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# Estimated bytes a cached plist takes per byte of its XML: the XML text it
+# keeps plus its parsed tree of Python objects.
+PLIST_CACHE_BYTES_PER_XML_BYTE = 8
+# Max size of plist XML to keep parsed in the cache; catalogs are too large.
+PLIST_CACHE_MAX_XML_BYTES = 256 * 1024
+# Format of the preflight day in Computer summary counter names.
+SUMMARY_DAY_FORMAT = '%Y-%m-%d'
+# Days of hourly InstallCountBucket entities kept for trending reports.
+INSTALL_COUNT_BUCKET_RETENTION_DAYS = 31
+# Format of install count watermarks and InstallCountShard key names.
+INSTALL_COUNTS_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def DiffCounters(old, new):
+  """Returns a dict of counters changed from old to new, and by how much.
+
+  Args:
+    old: dict of str counter name to int value.
+    new: dict of str counter name to int value.
+  Returns:
+    dict of str counter name to non-zero int change.
+  """
+  delta = {}
+  for name in set(old) | set(new):
+    change = new.get(name, 0) - old.get(name, 0)
+    if change:
+      delta[name] = change
+  return delta
+
+
+def AddToCounters(counters, delta):
+  """Adds delta to counters in place, dropping counters that reach zero.
+
+  Args:
+    counters: dict of str counter name to int value.
+    delta: dict of str counter name to int change.
+  """
+  for name, change in delta.iteritems():
+    value = counters.get(name, 0) + change
+    if value:
+      counters[name] = value
+    else:
+      counters.pop(name, None)
 
 
 class BaseModel(db.Model):
@@ -171,8 +223,7 @@ class BaseModel(db.Model):
     Returns:
       entities
     """
-    filter_str = '|'.join(map(lambda x: '_%s,%s_' % (x[0], x[1]), filters))
-    memcache_key = 'mwgaf_%s%s' % (cls.kind(), filter_str)
+    memcache_key = cls._GetMemcacheWrappedGetAllFilterKey(filters)
 
     entities = memcache.get(memcache_key)
     if entities is None:
@@ -193,9 +244,13 @@ class BaseModel(db.Model):
         ( ( "foo =", True ),
           ( "zoo =", 1 ), ),
     """
+    memcache.delete(cls._GetMemcacheWrappedGetAllFilterKey(filters))
+
+  @classmethod
+  def _GetMemcacheWrappedGetAllFilterKey(cls, filters):
+    """Returns the memcache key of MemcacheWrappedGetAllFilter(filters)."""
     filter_str = '|'.join(map(lambda x: '_%s,%s_' % (x[0], x[1]), filters))
-    memcache_key = 'mwgaf_%s%s' % (cls.kind(), filter_str)
-    memcache.delete(memcache_key)
+    return 'mwgaf_%s%s' % (cls.kind(), filter_str)
 
   @classmethod
   def MemcacheWrappedSet(
@@ -247,6 +302,65 @@ class BaseModel(db.Model):
     memcache.delete(memcache_key)
 
 
+class _PlistCache(object):
+  """In-process LRU cache of parsed plists, bounded by their estimated size.
+
+  Cached plists are never handed out directly; Get() returns a copy() which
+  shares contents with the cached plist copy-on-write.
+  """
+
+  def __init__(self, max_bytes):
+    self._max_bytes = max_bytes
+    self._bytes = 0
+    # key to tuple of (plist, int estimated bytes), in least recently used
+    # order.
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def Get(self, key):
+    """Returns a copy of the cached plist for key, or None if not cached."""
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is None:
+        return None
+      self._entries[key] = entry
+    return entry[0].copy()
+
+  def _PopLocked(self, key):
+    """Removes an entry; _lock must be held."""
+    entry = self._entries.pop(key, None)
+    if entry:
+      self._bytes -= entry[1]
+
+  def Set(self, key, plist, xml_bytes):
+    """Caches a copy of a parsed plist under key.
+
+    Args:
+      key: hashable cache key.
+      plist: plist_lib.ApplePlist object, parsed.
+      xml_bytes: int, length of the XML the plist was parsed from.
+    """
+    size = xml_bytes * PLIST_CACHE_BYTES_PER_XML_BYTE
+    if size > self._max_bytes:
+      return
+    plist = plist.copy()
+    with self._lock:
+      self._PopLocked(key)
+      self._entries[key] = (plist, size)
+      self._bytes += size
+      while self._bytes > self._max_bytes:
+        self._PopLocked(next(iter(self._entries)))
+
+  def Clear(self):
+    """Removes all cached plists."""
+    with self._lock:
+      self._entries.clear()
+      self._bytes = 0
+
+
+_plist_cache = _PlistCache(PLIST_CACHE_MAX_BYTES)
+
+
 class BasePlistModel(BaseModel):
   """Base model which can easily store a utf-8 plist."""
 
@@ -255,13 +369,28 @@ class BasePlistModel(BaseModel):
   _plist = db.TextProperty()  # catalog/manifest/pkginfo plist file.
 
   def _ParsePlist(self):
-    """Parses the self._plist XML into a plist_lib.ApplePlist object."""
-    self._plist_obj = self.PLIST_LIB_CLASS(self._plist.encode('utf-8'))
+    """Parses the self._plist XML into a plist_lib.ApplePlist object.
+
+    Parsed plists are cached in-process by XML content hash, so unchanged
+    entities are not parsed again.
+    """
+    plist_xml = self._plist.encode('utf-8')
+    cache_key = None
+    if len(plist_xml) <= PLIST_CACHE_MAX_XML_BYTES:
+      cache_key = (self.PLIST_LIB_CLASS, hashlib.sha1(plist_xml).digest())
+      self._plist_obj = _plist_cache.Get(cache_key)
+      if self._plist_obj is not None:
+        return
+
+    self._plist_obj = self.PLIST_LIB_CLASS(plist_xml)
     try:
       self._plist_obj.Parse()
     except plist_lib.PlistError, e:
       logging.exception('Error parsing self._plist: %s', str(e))
       self._plist_obj = None
+      return
+    if cache_key:
+      _plist_cache.Set(cache_key, self._plist_obj, len(plist_xml))
 
   def _GetPlist(self):
     """Returns the _plist property encoded in utf-8."""
@@ -294,6 +423,8 @@ class BasePlistModel(BaseModel):
     else:
       self._plist_obj = plist
       self._plist = db.Text(self._plist_obj.GetXml())
+    # XML set from outside is normalized with GetXml() on the next put().
+    self._plist_set = True
 
   plist = property(_GetPlist, _SetPlist)
 
@@ -306,14 +437,21 @@ class BasePlistModel(BaseModel):
   def put(self, *args, **kwargs):
     """Put to Datastore.
 
+    The plist is only re-serialized if it was set or may have been modified
+    since it was parsed; otherwise the stored XML is reused as is.
+
     Args:
       args: list, optional, args to superclass put()
       kwargs: dict, optional, keyword args to superclass put()
     Returns:
       return value from superclass put()
     """
-    if self.plist:
-      self._plist = self.plist.GetXml()
+    plist_obj = getattr(self, '_plist_obj', None)
+    if (not self._plist or getattr(self, '_plist_set', False) or
+        (plist_obj is not None and plist_obj.IsDirty())):
+      if self.plist:
+        self._plist = self.plist.GetXml()
+      self._plist_set = False
     return super(BasePlistModel, self).put(*args, **kwargs)
 
 
@@ -360,6 +498,10 @@ class Computer(db.Model):
   # connection. Resets to 0 when a postflight connection is posted.
   preflight_count_since_postflight = db.IntegerProperty(default=0)
   cert_fingerprint = db.StringProperty()
+  # util.Serialize()d GetSummaryCounters() as last added to the summary.
+  _summary_counters = db.TextProperty()
+  # computer_search.GetSignature() as last put into the search index.
+  _search_signature = db.StringProperty(indexed=False)
 
   def _GetUserSettings(self):
     """Returns the user setting dictionary, or None."""
@@ -383,38 +525,158 @@ class Computer(db.Model):
 
   user_settings = property(_GetUserSettings, _SetUserSettings)
 
+  def GetSummaryCounters(self):
+    """Returns the counters this computer contributes to the fleet summary.
+
+    Activity is counted on the day of preflight_datetime, so that shorter
+    active windows are sums of days, and changes at most once a day.
+    Connection counts are snapshots, only refreshed when another counter
+    changes; see _SummaryCountersChanged().
+
+    Returns:
+      dict of str counter name to int value, empty if inactive.
+    """
+    if not self.active:
+      return {}
+    day = ''
+    if self.preflight_datetime:
+      day = self.preflight_datetime.strftime(SUMMARY_DAY_FORMAT)
+    return {
+        'os|%s' % self.os_version: 1,
+        'client|%s' % self.client_version: 1,
+        'site|%s' % self.site: 1,
+        'state|%s|%d|%d|%s' % (
+            day, bool(self.all_pkgs_installed),
+            bool(self.all_apple_updates_installed), self.track): 1,
+        'conns|on_corp': self.connections_on_corp or 0,
+        'conns|off_corp': self.connections_off_corp or 0,
+    }
+
+  def _GetStoredSummaryCounters(self):
+    """Returns the summary counters last added to the fleet summary."""
+    if self._summary_counters:
+      return util.Deserialize(self._summary_counters)
+    return {}
+
+  def _SummaryCountersChanged(self):
+    """Returns True if this computer's summary counters differ from stored.
+
+    Connection counts change on every connection, so they alone don't count
+    as a change; they are refreshed along with the other counters.
+    """
+    def _WithoutConns(counters):
+      return dict(
+          (k, v) for k, v in counters.iteritems() if not k.startswith('conns|'))
+
+    return (_WithoutConns(self._GetStoredSummaryCounters()) !=
+            _WithoutConns(self.GetSummaryCounters()))
+
+  @classmethod
+  def ReconcileSummaryCounters(cls, computers):
+    """Applies summary counter changes missed by writes which bypassed put().
+
+    Args:
+      computers: list of Computer entities.
+    Returns:
+      int number of computers whose stored counters had drifted.
+    """
+    def _Reconcile(key):
+      computer = cls.get(key)
+      if computer:
+        computer.put(update_active=False)
+
+    drifted = 0
+    for c in computers:
+      if c._SummaryCountersChanged():
+        # re-read in the transaction, as the computer may have changed since.
+        db.run_in_transaction(_Reconcile, c.key())
+        drifted += 1
+    return drifted
+
+  def _UpdateSummaryCounters(self):
+    """Stores new summary counters, returning the delta from the old ones."""
+    old = self._GetStoredSummaryCounters()
+    new = self.GetSummaryCounters()
+    self._summary_counters = util.Serialize(new)
+    return DiffCounters(old, new)
+
+  def _UpdateSearchSignature(self):
+    """Stores a new search index signature, returning True if it changed."""
+    signature = computer_search.GetSignature(self)
+    if signature == self._search_signature:
+      return False
+    self._search_signature = signature
+    return True
+
   @classmethod
   def AllActive(cls, keys_only=False):
     """Returns a query for all Computer entities that are active."""
     return cls.all(keys_only=keys_only).filter('active =', True)
 
   @classmethod
-  def MarkInactive(cls):
-    """Marks any inactive computers as such."""
-    count = 0
+  def MarkInactive(cls, cursor=None, batch_size=500):
+    """Marks a batch of inactive computers as such.
+
+    Candidates are selected with a projection query on preflight_datetime, so
+    only computers that actually need to change are fully fetched and put.
+
+    Args:
+      cursor: str, optional, query cursor to resume the sweep from.
+      batch_size: int, number of candidate computers to process.
+    Returns:
+      tuple of (int count of computers marked inactive, str cursor to resume
+      from or None if the sweep is complete).
+    """
     now = datetime.datetime.utcnow()
     earliest_active_date = now - datetime.timedelta(days=COMPUTER_ACTIVE_DAYS)
-    query = cls.AllActive().filter('preflight_datetime <', earliest_active_date)
-    gc.collect()
-    while True:
-      computers = query.fetch(500)
-      if not computers:
-        break
-      for c in computers:
-        c.active = False  # this isn't neccessary, but makes more obvious.
-        c.put()
-        count += 1
-      cursor = str(query.cursor())
-      del computers
-      del query
-      gc.collect()
-      query = cls.AllActive().filter(
-          'preflight_datetime <', earliest_active_date)
+    query = db.Query(cls, projection=('preflight_datetime',))
+    query.filter('active =', True)
+    query.filter('preflight_datetime <', earliest_active_date)
+    if cursor:
       query.with_cursor(cursor)
-    return count
+    candidates = query.fetch(batch_size)
+    if not candidates:
+      return 0, None
+    next_cursor = query.cursor() if len(candidates) == batch_size else None
+
+    def _MarkInactive(keys):
+      computers = []
+      reindex = []
+      delta = {}
+      for c in db.get(keys):
+        # The computer may have connected since the projection was fetched.
+        if c and c.active and c.preflight_datetime < earliest_active_date:
+          c.active = False  # this isn't neccessary, but makes more obvious.
+          AddToCounters(delta, c._UpdateSummaryCounters())
+          if c._UpdateSearchSignature():
+            reindex.append(c)
+          computers.append(c)
+      db.put(computers)
+      ComputerSummaryShard.ApplyDelta(delta)
+      return len(computers), reindex
+
+    keys = [candidate.key() for candidate in candidates]
+    options = db.create_transaction_options(xg=True)
+    count = 0
+    for i in xrange(0, len(keys), COMPUTER_MARK_INACTIVE_TXN_SIZE):
+      batch_count, reindex = db.run_in_transaction_options(
+          options, _MarkInactive, keys[i:i + COMPUTER_MARK_INACTIVE_TXN_SIZE])
+      count += batch_count
+      computer_search.IndexComputers(reindex)
+    return count, next_cursor
+
+  def put(self, update_active=True, update_summary=True):
+    """Forcefully set active according to preflight_datetime.
+
+    Most puts leave the summary counters unchanged, and are plain puts; only
+    when they changed is the put made in a transaction that diffs against
+    the stored counters and enqueues the delta.
 
-  def put(self, update_active=True):
-    """Forcefully set active according to preflight_datetime."""
+    Args:
+      update_active: bool, default True, set active from preflight_datetime.
+      update_summary: bool, default True, add changes of this computer's
+        summary counters to the fleet summary.
+    """
     if update_active:
       now = datetime.datetime.utcnow()
       earliest_active_date = now - datetime.timedelta(days=COMPUTER_ACTIVE_DAYS)
@@ -423,7 +685,103 @@ class Computer(db.Model):
           self.active = True
         else:
           self.active = False
-    super(Computer, self).put()
+    reindex = self._UpdateSearchSignature()
+    if update_summary and self._SummaryCountersChanged():
+      def _Put():
+        # diff against the stored counters, not those of a stale copy, so
+        # that concurrent puts never apply the same change twice.
+        if self.has_key():
+          stored = db.get(self.key())
+          if stored:
+            self._summary_counters = stored._summary_counters
+        ComputerSummaryShard.ApplyDelta(self._UpdateSummaryCounters())
+        super(Computer, self).put()
+
+      if db.is_in_transaction():
+        _Put()
+      else:
+        db.run_in_transaction(_Put)
+    else:
+      super(Computer, self).put()
+    if reindex:
+      computer_search.IndexComputers([self])
+
+
+class ComputerSummaryShard(BaseModel):
+  """Shard of the fleet summary counters of all active computers.
+
+  The fleet summary is the sum of Computer.GetSummaryCounters() for all
+  computers, maintained incrementally as they are put. Deltas are added by
+  tasks enqueued in the transaction of each put, and spread over SHARDS
+  entities so that concurrent tasks don't contend on one entity; key_name is
+  "shard_<n>".
+  """
+
+  SHARDS = 20
+  MEMCACHE_KEY = 'computer_summary_counters'
+  MEMCACHE_SECS = 60
+
+  # util.Serialize()d dict of str counter name to int value.
+  blob_value = db.BlobProperty()
+  mtime = db.DateTimeProperty(auto_now=True)
+
+  def GetCounters(self):
+    """Returns the deserialized counters of this shard."""
+    if self.blob_value:
+      return util.Deserialize(self.blob_value)
+    return {}
+
+  @classmethod
+  def Add(cls, delta):
+    """Adds a counters delta to a random shard.
+
+    Args:
+      delta: dict of str counter name to int change.
+    """
+    key_name = 'shard_%d' % random.randrange(cls.SHARDS)
+
+    def _Add():
+      shard = cls.get_by_key_name(key_name)
+      if not shard:
+        shard = cls(key_name=key_name)
+      counters = shard.GetCounters()
+      AddToCounters(counters, delta)
+      shard.blob_value = util.Serialize(counters)
+      shard.put()
+
+    db.run_in_transaction(_Add)
+
+  @classmethod
+  def ApplyDelta(cls, delta):
+    """Adds a counters delta asynchronously.
+
+    Must be called in the transaction which stores the counters the delta
+    was computed from, so that the delta is added if and only if it commits.
+
+    Args:
+      delta: dict of str counter name to int change.
+    """
+    if delta:
+      deferred.defer(cls.Add, delta, _transactional=True)
+
+  @classmethod
+  def GetSummedCounters(cls):
+    """Returns tuple (dict of summed counters, latest shard mtime)."""
+    cached = memcache.get(cls.MEMCACHE_KEY)
+    if cached is not None:
+      return cached
+
+    counters = {}
+    mtime = None
+    key_names = ['shard_%d' % i for i in xrange(cls.SHARDS)]
+    for shard in cls.get_by_key_name(key_names):
+      if not shard:
+        continue
+      AddToCounters(counters, shard.GetCounters())
+      if mtime is None or shard.mtime > mtime:
+        mtime = shard.mtime
+    memcache.set(cls.MEMCACHE_KEY, (counters, mtime), cls.MEMCACHE_SECS)
+    return counters, mtime
 
 
 class ComputerClientBroken(db.Model):
@@ -454,6 +812,405 @@ class ComputerMSULog(db.Model):
   desc = db.StringProperty()  # additional descriptive text
   mtime = db.DateTimeProperty()  # time of log
 
+  def _UpdateUserState(self, user, entry):
+    """Updates this log in a user's MsuUserState, deferring on failure.
+
+    Args:
+      user: str, user name.
+      entry: tuple from MsuUserState.GetEntry(), or None to remove the log.
+    """
+    try:
+      MsuUserState.UpdateLog(user, str(self.key()), entry)
+    except db.Error:
+      logging.warning('Error updating MSU user state; deferring.')
+      deferred.defer(MsuUserState.UpdateLog, user, str(self.key()), entry)
+
+  def put(self, *args, **kwargs):
+    """Puts the log and updates the MSU user state and summary buckets."""
+    previous = None
+    if self.has_key():
+      previous = self.get(self.key())
+    key = super(ComputerMSULog, self).put(*args, **kwargs)
+
+    if previous and previous.user != self.user:
+      # the log moved from another user, whose summary counters change too.
+      self._UpdateUserState(previous.user, None)
+    self._UpdateUserState(self.user, MsuUserState.GetEntry(self))
+    return key
+
+
+class MsuUserState(BaseModel):
+  """MSU logs of one user, as counted in the MSU user summary.
+
+  Keeping every log of a user in one entity lets each ComputerMSULog put
+  update the user's summary counters from a single get, regardless of how
+  many logs the user has. key_name is the user name.
+  """
+
+  MTIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+  # util.Serialize()d dict of str ComputerMSULog key to list of
+  # [str uuid, str event, str mtime formatted with MTIME_FORMAT].
+  blob_value = db.BlobProperty()
+  # latest MsuUserSummaryBucket generation this user is counted in.
+  generation = db.IntegerProperty(default=0)
+  mtime = db.DateTimeProperty(auto_now=True)
+
+  @classmethod
+  def GetEntry(cls, log):
+    """Returns the tuple entry of a ComputerMSULog, as used in GetLogs()."""
+    return (log.uuid, log.event, log.mtime.replace(microsecond=0))
+
+  def GetLogs(self):
+    """Returns dict of str ComputerMSULog key to tuple entry of the log."""
+    logs = {}
+    if self.blob_value:
+      for log_key, (uuid, event, mtime) in util.Deserialize(
+          self.blob_value).iteritems():
+        logs[log_key] = (
+            uuid, event,
+            datetime.datetime.strptime(mtime, self.MTIME_FORMAT))
+    return logs
+
+  def SetLogs(self, logs):
+    """Sets the logs of this user, as returned by GetLogs()."""
+    self.blob_value = util.Serialize(dict(
+        (log_key, [uuid, event, mtime.strftime(self.MTIME_FORMAT)])
+        for log_key, (uuid, event, mtime) in logs.iteritems()))
+
+  @classmethod
+  def UpdateLog(cls, user, log_key, entry):
+    """Adds, replaces or removes a log of a user and updates the summary.
+
+    Retrying is safe, as the log entry replaces any previous entry of the log.
+
+    Args:
+      user: str, user name.
+      log_key: str, ComputerMSULog key.
+      entry: tuple from GetEntry(), or None to remove the log.
+    """
+    current, building = MsuUserSummaryBucket.GetGenerations()
+
+    def _Update():
+      state = cls.get_by_key_name(user)
+      if not state:
+        # a rebuild in progress may have passed this user already.
+        state = cls(key_name=user, generation=building or current)
+      logs = state.GetLogs()
+      if logs.get(log_key) == entry:
+        return
+      old = MsuUserSummaryBucket.GetUserCounters(logs.itervalues())
+      if entry is None:
+        del logs[log_key]
+      else:
+        logs[log_key] = entry
+      delta = DiffCounters(
+          old, MsuUserSummaryBucket.GetUserCounters(logs.itervalues()))
+      state.SetLogs(logs)
+      state.put()
+      MsuUserSummaryBucket.ApplyDeltas(
+          dict((g, delta) for g in set([current, state.generation])))
+
+    db.run_in_transaction(_Update)
+
+  @classmethod
+  def Rebuild(cls, user, logs, generation):
+    """Counts a user in a generation of MSU user summary buckets being built.
+
+    Args:
+      user: str, user name.
+      logs: dict of str ComputerMSULog key to GetEntry() tuple, of the logs
+        the user had when the rebuild read them.
+      generation: int, generation being built.
+    """
+    current, _ = MsuUserSummaryBucket.GetGenerations()
+
+    def _Rebuild():
+      state = cls.get_by_key_name(user)
+      if not state:
+        state = cls(key_name=user, generation=current)
+      state_logs = state.GetLogs()
+      old = MsuUserSummaryBucket.GetUserCounters(state_logs.itervalues())
+      for log_key, entry in logs.iteritems():
+        # logs put since they were read are already up to date in the state.
+        state_logs.setdefault(log_key, entry)
+      new = MsuUserSummaryBucket.GetUserCounters(state_logs.itervalues())
+
+      deltas = {current: DiffCounters(old, new)}
+      if state.generation == generation:
+        deltas[generation] = deltas[current]
+      else:
+        deltas[generation] = new
+      state.generation = generation
+      state.SetLogs(state_logs)
+      state.put()
+      MsuUserSummaryBucket.ApplyDeltas(deltas)
+
+    db.run_in_transaction(_Rebuild)
+
+
+class MsuUserSummaryBucket(BaseModel):
+  """Shard of MSU user summary counters for one day.
+
+  Each counter a user contributes is attributed to the day of one of their
+  ComputerMSULog mtimes, such that the summary of any window of days is the
+  sum of its buckets; see GetUserCounters(). Each day is spread over SHARDS
+  entities to avoid write contention; key_name is
+  "<generation>_<day>_<shard>". Every update also goes to an all-time rollup,
+  spread over SHARDS entities with no day; key_name is
+  "<generation>_all_<shard>".
+
+  Only buckets of the current generation are summarized. A rebuild counts all
+  users into the next generation while puts keep updating both, and then
+  makes it current; see StartGeneration() and FinishGeneration().
+  """
+
+  SHARDS = 10
+  DAY_FORMAT = '%Y-%m-%d'
+  USER_EVENTS = [
+      'launched',
+      'install_with_logout',
+      'install_without_logout',
+      'cancelled',
+      'exit_later_clicked',
+      'exit_installwithnologout',
+      'conflicting_apps'
+  ]
+  MEMCACHE_KEY = 'msu_user_summary_%s_%s_%s'
+  MEMCACHE_SECS = 300
+  DELETE_GENERATION_BATCH_SIZE = 500
+
+  generation = db.IntegerProperty(default=0)
+  day = db.DateProperty()
+  # util.Serialize()d dict of str counter name to int value.
+  blob_value = db.BlobProperty()
+  mtime = db.DateTimeProperty(auto_now=True)
+
+  def GetCounters(self):
+    """Returns the deserialized counters of this bucket."""
+    if self.blob_value:
+      return util.Deserialize(self.blob_value)
+    return {}
+
+  @classmethod
+  def GetUserCounters(cls, logs):
+    """Returns the summary counters contributed by one user's logs.
+
+    Only uuids where MSU was launched count. Every event counts on the day of
+    its mtime, and each uuid on the day of its latest event. A user with N
+    events counts towards "users_min_events_<i>" on the day of their i-th
+    latest event, for i = 1..N, so summing a window of days yields the number
+    of users with at least i events in that window.
+
+    Args:
+      logs: iterable of MsuUserState.GetEntry() tuples of a single user.
+    Returns:
+      dict of str "<day>|<counter name>" to int value.
+    """
+    uuids = {}
+    for uuid, event, mtime in logs:
+      events = uuids.setdefault(uuid, {})
+      if event not in events or mtime > events[event]:
+        events[event] = mtime
+
+    counters = {}
+    event_days = []
+    for events in uuids.itervalues():
+      if 'launched' not in events:
+        continue
+      days = []
+      for event, mtime in events.iteritems():
+        day = mtime.strftime(cls.DAY_FORMAT)
+        AddToCounters(counters, {
+            '%s|%s' % (day, event): 1, '%s|total_events' % day: 1})
+        days.append(day)
+      AddToCounters(counters, {'%s|total_uuids' % max(days): 1})
+      event_days.extend(days)
+
+    event_days.sort(reverse=True)
+    for i, day in enumerate(event_days):
+      AddToCounters(counters, {'%s|users_min_events_%d' % (day, i + 1): 1})
+    return counters
+
+  @classmethod
+  def _SplitByDay(cls, counters):
+    """Returns dict of str day to dict of counters, from GetUserCounters()."""
+    by_day = {}
+    for name, value in counters.iteritems():
+      day, counter = name.split('|', 1)
+      by_day.setdefault(day, {})[counter] = value
+    return by_day
+
+  @classmethod
+  def GetGenerations(cls):
+    """Returns tuple of (int current generation, int generation being built).
+
+    The generation being built is None if no rebuild is in progress.
+    """
+    generations = ReportsCache.GetMsuUserSummaryGenerations()
+    return generations.get('current', 0), generations.get('building')
+
+  @classmethod
+  def StartGeneration(cls):
+    """Returns the int number of a new generation to build."""
+
+    def _Start():
+      current, building = cls.GetGenerations()
+      # an abandoned rebuild is replaced, and its buckets later deleted.
+      generation = max(current, building or 0) + 1
+      ReportsCache.SetMsuUserSummaryGenerations(current, generation)
+      return generation
+
+    return db.run_in_transaction(_Start)
+
+  @classmethod
+  def FinishGeneration(cls, generation):
+    """Makes a built generation current and deletes older generations."""
+
+    def _Finish():
+      _, building = cls.GetGenerations()
+      if building != generation:
+        return False
+      ReportsCache.SetMsuUserSummaryGenerations(generation, None)
+      return True
+
+    if db.run_in_transaction(_Finish):
+      deferred.defer(cls.DeleteGenerations, generation)
+    else:
+      logging.warning(
+          'MSU user summary generation %d was replaced; not finishing.',
+          generation)
+
+  @classmethod
+  def DeleteGenerations(cls, generation):
+    """Deletes buckets older than a generation, deferring until all are gone.
+
+    Args:
+      generation: int, oldest generation to keep.
+    """
+    keys = cls.all(keys_only=True).filter('generation <', generation).fetch(
+        cls.DELETE_GENERATION_BATCH_SIZE)
+    if keys:
+      gae_util.BatchDatastoreOp(db.delete, keys)
+      deferred.defer(cls.DeleteGenerations, generation)
+
+  @classmethod
+  def _AllTimeKeyName(cls, generation, shard):
+    """Returns the key_name of a shard of a generation's all-time rollup."""
+    return '%d_all_%d' % (generation, shard)
+
+  @classmethod
+  def Add(cls, generation, day, delta):
+    """Adds a counters delta to random shards of a day's bucket and all-time.
+
+    Args:
+      generation: int, bucket generation.
+      day: str, day formatted with DAY_FORMAT.
+      delta: dict of str counter name to int change.
+    """
+    key_name = '%d_%s_%d' % (generation, day, random.randrange(cls.SHARDS))
+    all_key_name = cls._AllTimeKeyName(
+        generation, random.randrange(cls.SHARDS))
+
+    def _Add():
+      bucket, all_bucket = cls.get_by_key_name([key_name, all_key_name])
+      if not bucket:
+        bucket = cls(
+            key_name=key_name, generation=generation,
+            day=datetime.datetime.strptime(day, cls.DAY_FORMAT).date())
+      if not all_bucket:
+        all_bucket = cls(key_name=all_key_name, generation=generation)
+      for b in [bucket, all_bucket]:
+        counters = b.GetCounters()
+        AddToCounters(counters, delta)
+        b.blob_value = util.Serialize(counters)
+      db.put([bucket, all_bucket])
+
+    db.run_in_transaction_options(
+        db.create_transaction_options(xg=True), _Add)
+
+  @classmethod
+  def AddDeltas(cls, deltas):
+    """Adds GetUserCounters() deltas, deferring days that fail to update.
+
+    Args:
+      deltas: dict of int generation to GetUserCounters() delta.
+    """
+    for generation, delta in deltas.iteritems():
+      for day, day_delta in cls._SplitByDay(delta).iteritems():
+        try:
+          cls.Add(generation, day, day_delta)
+        except db.Error:
+          logging.warning(
+              'Error updating MSU user summary bucket; deferring.')
+          deferred.defer(cls.Add, generation, day, day_delta)
+
+  @classmethod
+  def ApplyDeltas(cls, deltas):
+    """Adds deltas to the buckets once the current transaction commits.
+
+    Args:
+      deltas: dict of int generation to GetUserCounters() delta.
+    """
+    deltas = dict((g, d) for g, d in deltas.iteritems() if d)
+    if deltas:
+      deferred.defer(cls.AddDeltas, deltas, _transactional=True)
+
+  @classmethod
+  def GetSummary(cls, since_days=None, now=None):
+    """Returns the MSU user summary over a window of days.
+
+    Args:
+      since_days: int, optional, only summarize the last x days.
+      now: datetime.datetime, optional, supply an alternative
+        value for the current date/time
+    Returns:
+      tuple (dict of summary data, datetime of the latest bucket update).
+    """
+    if now is None:
+      now = datetime.datetime.utcnow()
+    generation, _ = cls.GetGenerations()
+    if since_days is None:
+      start = None
+    else:
+      start = (now - datetime.timedelta(days=since_days)).date()
+    memcache_key = cls.MEMCACHE_KEY % (generation, since_days, start)
+    cached = memcache.get(memcache_key)
+    if cached is not None:
+      return cached
+
+    if since_days is None:
+      buckets = cls.get_by_key_name([
+          cls._AllTimeKeyName(generation, shard)
+          for shard in xrange(cls.SHARDS)])
+    else:
+      buckets = cls.all().filter('generation =', generation).filter(
+          'day >=', start)
+    counters = {}
+    mtime = None
+    for bucket in buckets:
+      if not bucket:
+        continue
+      AddToCounters(counters, bucket.GetCounters())
+      if mtime is None or bucket.mtime > mtime:
+        mtime = bucket.mtime
+
+    summary = dict((event, 0) for event in cls.USER_EVENTS)
+    summary['total_events'] = 0
+    summary['total_uuids'] = 0
+    summary['total_users'] = counters.get('users_min_events_1', 0)
+    for name, value in counters.iteritems():
+      if name.startswith('users_min_events_'):
+        events = int(name[len('users_min_events_'):])
+        users = value - counters.get('users_min_events_%d' % (events + 1), 0)
+        if users:
+          summary['total_users_%d_events' % events] = users
+      else:
+        summary[name] = value
+
+    memcache.set(memcache_key, (summary, mtime), cls.MEMCACHE_SECS)
+    return summary, mtime
+
 
 class ClientLogFile(db.Model):
   """Store client log files, like ManagedSoftwareUpdate.log.
@@ -520,6 +1277,260 @@ class InstallLog(ClientLogBase):
     return super(InstallLog, self).put()
 
 
+class InstallCountBucket(BaseModel):
+  """Per-package install success and failure counts for one hour.
+
+  Each hour is spread over SHARDS entities so concurrent install reports
+  don't contend on a single entity; key_name is "<hour>_<shard>".  Rollup()
+  later folds closed hours into one "<hour>_all" entity each, and closed days
+  into one "<day>_day" entity each, so long windows read one entity per day.
+  """
+
+  SHARDS = 10
+  MEMCACHE_KEY = 'install_count_buckets_%d_hours_%s'
+  MEMCACHE_SECS = 60
+  # Number of closed hours Rollup() looks back over for missing rollups.
+  ROLLUP_HOURS = 48
+  # Maximum number of keys fetched per datastore get.
+  GET_BATCH_SIZE = 1000
+
+  # Start of the hour, or of the day for daily rollups.
+  hour = db.DateTimeProperty()
+  # util.Serialize()d dict like {'success': {pkg: n}, 'failure': {pkg: n}}.
+  blob_value = db.BlobProperty()
+  mtime = db.DateTimeProperty(auto_now=True)
+
+  @classmethod
+  def GetHour(cls, dt):
+    """Returns the datetime of the start of the hour containing dt."""
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+  @classmethod
+  def GetDay(cls, dt):
+    """Returns the datetime of the start of the day containing dt."""
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+  @classmethod
+  def _HourKeyName(cls, hour, shard):
+    """Returns the key_name of an hour's shard, or its rollup for 'all'."""
+    return '%s_%s' % (hour.strftime('%Y-%m-%d-%H'), shard)
+
+  @classmethod
+  def _DayKeyName(cls, day):
+    """Returns the key_name of a day's rollup."""
+    return '%s_day' % day.strftime('%Y-%m-%d')
+
+  @classmethod
+  def _GetByKeyNames(cls, key_names):
+    """Returns buckets for key_names, None for missing ones, in batches."""
+    keys = [db.Key.from_path(cls.kind(), key_name) for key_name in key_names]
+    buckets = []
+    for batch in gae_util.BatchDatastoreOpAsync(
+        db.get_async, keys, batch_size=cls.GET_BATCH_SIZE):
+      buckets.extend(batch)
+    return buckets
+
+  def GetCounts(self):
+    """Returns the deserialized counts dict of this bucket."""
+    if self.blob_value:
+      return util.Deserialize(self.blob_value)
+    return {'success': {}, 'failure': {}}
+
+  @classmethod
+  def _AddCounts(cls, counts, new_counts):
+    """Adds new_counts to counts, modifying counts in place."""
+    for section in ['success', 'failure']:
+      section_counts = counts.setdefault(section, {})
+      for pkg, count in new_counts.get(section, {}).iteritems():
+        section_counts[pkg] = section_counts.get(pkg, 0) + count
+
+  @classmethod
+  def Add(cls, hour, counts):
+    """Adds counts to a random shard of an hour's bucket.
+
+    If the hour was already rolled up, e.g. for a late retried task, counts
+    are added to its rollups instead so they aren't lost.
+
+    Args:
+      hour: datetime.datetime, start of the hour, as returned by GetHour().
+      counts: dict like {'success': {pkg: n}, 'failure': {pkg: n}}.
+    """
+    shard_key_name = cls._HourKeyName(hour, random.randrange(cls.SHARDS))
+    hour_key_name = cls._HourKeyName(hour, 'all')
+    day_key_name = cls._DayKeyName(cls.GetDay(hour))
+
+    def _Add():
+      shard, hour_rollup, day_rollup = cls.get_by_key_name(
+          [shard_key_name, hour_key_name, day_key_name])
+      if hour_rollup:
+        buckets = [b for b in [hour_rollup, day_rollup] if b]
+      else:
+        buckets = [shard or cls(key_name=shard_key_name, hour=hour)]
+      for bucket in buckets:
+        bucket_counts = bucket.GetCounts()
+        cls._AddCounts(bucket_counts, counts)
+        bucket.blob_value = util.Serialize(bucket_counts)
+      db.put(buckets)
+
+    db.run_in_transaction_options(
+        db.create_transaction_options(xg=True), _Add)
+
+  @classmethod
+  def AddInstalls(cls, installs, now=None):
+    """Enqueues counting newly reported installs into the current hour.
+
+    Args:
+      installs: list of InstallLog entities.
+      now: datetime.datetime, optional, supply an alternative
+        value for the current date/time
+    """
+    if not installs:
+      return
+    if now is None:
+      now = datetime.datetime.utcnow()
+
+    counts = {'success': {}, 'failure': {}}
+    for install in installs:
+      section = 'success' if install.IsSuccess() else 'failure'
+      counts[section][install.package] = (
+          counts[section].get(install.package, 0) + 1)
+
+    deferred.defer(cls.Add, cls.GetHour(now), counts)
+
+  @classmethod
+  def RollupHour(cls, hour):
+    """Folds the shards of a closed hour into its single rollup entity.
+
+    Args:
+      hour: datetime.datetime, start of the hour, as returned by GetHour().
+    """
+    hour_key_name = cls._HourKeyName(hour, 'all')
+    key_names = [hour_key_name] + [
+        cls._HourKeyName(hour, shard) for shard in xrange(cls.SHARDS)]
+
+    def _Rollup():
+      buckets = cls.get_by_key_name(key_names)
+      if buckets[0]:
+        return
+      counts = {'success': {}, 'failure': {}}
+      for bucket in buckets[1:]:
+        if bucket:
+          cls._AddCounts(counts, bucket.GetCounts())
+      cls(key_name=hour_key_name, hour=hour,
+          blob_value=util.Serialize(counts)).put()
+
+    db.run_in_transaction_options(
+        db.create_transaction_options(xg=True), _Rollup)
+
+  @classmethod
+  def RollupDay(cls, day):
+    """Folds the 24 hourly rollups of a closed day into one entity.
+
+    Args:
+      day: datetime.datetime, start of the day, as returned by GetDay().
+    Returns:
+      Boolean, True if the day is rolled up, False if an hour isn't yet.
+    """
+    day_key_name = cls._DayKeyName(day)
+    key_names = [day_key_name] + [
+        cls._HourKeyName(day + datetime.timedelta(hours=i), 'all')
+        for i in xrange(24)]
+
+    def _Rollup():
+      buckets = cls.get_by_key_name(key_names)
+      if buckets[0]:
+        return True
+      if not all(buckets[1:]):
+        return False
+      counts = {'success': {}, 'failure': {}}
+      for bucket in buckets[1:]:
+        cls._AddCounts(counts, bucket.GetCounts())
+      cls(key_name=day_key_name, hour=day,
+          blob_value=util.Serialize(counts)).put()
+      return True
+
+    return db.run_in_transaction_options(
+        db.create_transaction_options(xg=True), _Rollup)
+
+  @classmethod
+  def Rollup(cls, now=None):
+    """Rolls up closed hours and days of the last ROLLUP_HOURS hours.
+
+    Args:
+      now: datetime.datetime, optional, supply an alternative
+        value for the current date/time
+    """
+    if now is None:
+      now = datetime.datetime.utcnow()
+    end = cls.GetHour(now)
+    hours = [end - datetime.timedelta(hours=i)
+             for i in xrange(cls.ROLLUP_HOURS, 0, -1)]
+    rollups = cls._GetByKeyNames(
+        [cls._HourKeyName(hour, 'all') for hour in hours])
+    for hour, rollup in zip(hours, rollups):
+      if not rollup:
+        cls.RollupHour(hour)
+
+    for day in sorted(set(cls.GetDay(hour) for hour in hours)):
+      if day >= hours[0] and day + datetime.timedelta(days=1) <= end:
+        cls.RollupDay(day)
+
+  @classmethod
+  def GetCountsSince(cls, since_hours, now=None):
+    """Returns summed install counts for the last since_hours hours.
+
+    Whole closed days are read from their daily rollup and other closed
+    hours from their hourly rollup, falling back to shards for the current
+    hour and any hour not yet rolled up.
+
+    Args:
+      since_hours: int, number of hourly buckets to sum, including the
+        current hour.
+      now: datetime.datetime, optional, supply an alternative
+        value for the current date/time
+    Returns:
+      dict like {'success': {pkg: n}, 'failure': {pkg: n}}.
+    """
+    if now is None:
+      now = datetime.datetime.utcnow()
+    end = cls.GetHour(now)
+    start = end - datetime.timedelta(hours=since_hours - 1)
+    memcache_key = cls.MEMCACHE_KEY % (
+        since_hours, end.strftime('%Y-%m-%d-%H'))
+    counts = memcache.get(memcache_key)
+    if counts is not None:
+      return counts
+
+    days = []
+    day = cls.GetDay(start)
+    if day < start:
+      day += datetime.timedelta(days=1)
+    while day + datetime.timedelta(days=1) <= end:
+      days.append(day)
+      day += datetime.timedelta(days=1)
+    day_rollups = cls._GetByKeyNames([cls._DayKeyName(d) for d in days])
+    rolled_up_days = set(d for d, b in zip(days, day_rollups) if b)
+
+    closed_hours = [
+        start + datetime.timedelta(hours=i) for i in xrange(since_hours - 1)]
+    closed_hours = [
+        h for h in closed_hours if cls.GetDay(h) not in rolled_up_days]
+    hour_rollups = cls._GetByKeyNames(
+        [cls._HourKeyName(h, 'all') for h in closed_hours])
+    open_hours = [h for h, b in zip(closed_hours, hour_rollups) if not b]
+    open_hours.append(end)
+    shards = cls._GetByKeyNames([
+        cls._HourKeyName(h, shard)
+        for h in open_hours for shard in xrange(cls.SHARDS)])
+
+    counts = {'success': {}, 'failure': {}}
+    for bucket in day_rollups + hour_rollups + shards:
+      if bucket:
+        cls._AddCounts(counts, bucket.GetCounts())
+    memcache.set(memcache_key, counts, cls.MEMCACHE_SECS)
+    return counts
+
+
 class AdminLogBase(Log):
   """AdminLogBase model for all admin interaction."""
 
@@ -536,6 +1547,17 @@ class AdminPackageLog(AdminLogBase, BasePlistModel):
   manifests = db.StringListProperty()
   install_types = db.StringListProperty()
 
+  # Whether put() should maintain PackageReleaseHistory for the filename.
+  _UPDATE_RELEASE_HISTORY = True
+
+  def put(self, *args, **kwargs):
+    """Puts the log entry and updates the package's release history."""
+    key = super(AdminPackageLog, self).put(*args, **kwargs)
+    if self._UPDATE_RELEASE_HISTORY and self.filename:
+      PackageReleaseHistory.Update(
+          self.filename, 'stable' in self.catalogs, self.mtime)
+    return key
+
   def _GetPlistDiff(self):
     """Returns a generator of diff lines between original and new plist."""
     new_plist = self.plist.GetXml().splitlines()
@@ -584,6 +1606,66 @@ class AdminPackageProposalLog(AdminPackageLog):
 
   approver = db.StringProperty()
 
+  _UPDATE_RELEASE_HISTORY = False
+
+
+class PackageReleaseHistory(BaseModel):
+  """Per-package stable release state, derived from AdminPackageLog entries.
+
+  key_name is the package filename.
+  """
+
+  # True if the latest AdminPackageLog entry had the package in stable.
+  in_stable = db.BooleanProperty()
+  # UTC datetime of the log entry that most recently moved the package into
+  # stable from another catalog, or None if it is not in stable.
+  stable_since = db.DateTimeProperty()
+  mtime = db.DateTimeProperty(auto_now=True)
+
+  @classmethod
+  def Update(cls, filename, in_stable, log_mtime):
+    """Updates release history for a package from a new AdminPackageLog entry.
+
+    Args:
+      filename: str, package filename.
+      in_stable: bool, True if the log entry has the package in stable.
+      log_mtime: datetime.datetime, mtime of the log entry.
+    """
+    previously_in_stable = None
+    if not cls.get_by_key_name(filename):
+      # Seed from entries logged before release history was kept, so that
+      # the first entry logged since can still count as a promotion.
+      previous = AdminPackageLog.all().filter('filename =', filename).filter(
+          'mtime <', log_mtime).order('-mtime').get()
+      if previous:
+        previously_in_stable = 'stable' in previous.catalogs
+
+    def _Update():
+      history = cls.get_by_key_name(filename)
+      if not history:
+        history = cls(key_name=filename, in_stable=previously_in_stable)
+      if not in_stable:
+        history.stable_since = None
+      elif history.in_stable is False:
+        # Packages that are in stable from their very first log entry were
+        # never promoted, so only a transition from another catalog counts.
+        history.stable_since = log_mtime
+      history.in_stable = in_stable
+      history.put()
+    db.run_in_transaction(_Update)
+
+  @classmethod
+  def GetPromotedSince(cls, since):
+    """Returns filenames of packages promoted to stable after a datetime.
+
+    Args:
+      since: datetime.datetime, only return packages promoted after this.
+    Returns:
+      list of str package filenames.
+    """
+    query = cls.all(keys_only=True).filter('stable_since >', since)
+    return [key.name() for key in query]
+
 
 class AdminAppleSUSProductLog(AdminLogBase):
   """Model to log all admin Apple SUS Product changes."""
@@ -715,29 +1797,38 @@ class KeyValueCache(BaseModel):
 class ReportsCache(KeyValueCache):
   """Model for various reports data caching."""
 
-  _SUMMARY_KEY = 'summary'
   _INSTALL_COUNTS_KEY = 'install_counts'
-  _TRENDING_INSTALLS_KEY = 'trending_installs_%d_hours'
   _PENDING_COUNTS_KEY = 'pending_counts'
-  _MSU_USER_SUMMARY_KEY = 'msu_user_summary'
+  _APPLESUS_PROMOTION_SCHEDULE_KEY = 'applesus_promotion_schedule'
+  _MSU_USER_SUMMARY_GENERATIONS_KEY = 'msu_user_summary_generations'
 
   int_value = db.IntegerProperty()
 
   # TODO(user): migrate reports cache to properties.SerializedProperty()
 
   @classmethod
-  def GetStatsSummary(cls):
-    """Returns tuples (stats summary dictionary, datetime) from Datastore."""
-    return cls.GetSerializedItem(cls._SUMMARY_KEY)
+  def GetMsuUserSummaryGenerations(cls):
+    """Returns dict of MSU user summary generations from Datastore.
+
+    Like GetInstallCountsState(), this skips memcache so every put of a
+    ComputerMSULog sees a rebuild as soon as it starts.
+    """
+    entity = cls.get_by_key_name(cls._MSU_USER_SUMMARY_GENERATIONS_KEY)
+    if entity and entity.blob_value:
+      return util.Deserialize(entity.blob_value)
+    return {}
 
   @classmethod
-  def SetStatsSummary(cls, d):
-    """Sets a the stats summary dictionary to Datastore.
+  def SetMsuUserSummaryGenerations(cls, current, building):
+    """Sets the MSU user summary generations.
 
     Args:
-      d: dict of summary data.
+      current: int, generation of buckets summarized.
+      building: int, generation of buckets being rebuilt, or None.
     """
-    return cls.SetSerializedItem(cls._SUMMARY_KEY, d)
+    cls(key_name=cls._MSU_USER_SUMMARY_GENERATIONS_KEY,
+        blob_value=util.Serialize(
+            {'current': current, 'building': building})).put()
 
   @classmethod
   def GetInstallCounts(cls):
@@ -754,14 +1845,44 @@ class ReportsCache(KeyValueCache):
     return cls.SetSerializedItem(cls._INSTALL_COUNTS_KEY, d)
 
   @classmethod
-  def GetTrendingInstalls(cls, since_hours):
-    key = cls._TRENDING_INSTALLS_KEY % since_hours
-    return cls.GetSerializedItem(key)
+  def GetInstallCountsState(cls):
+    """Returns tuple (install counts dict, watermark datetime) from Datastore.
+
+    Unlike GetInstallCounts(), this skips memcache so rollups always merge
+    into the latest committed counts. The watermark is the server_datetime up
+    to which InstallLog entities have been counted, or None if unknown.
+    """
+    entity = cls.get_by_key_name(cls._INSTALL_COUNTS_KEY)
+    if not entity:
+      return {}, None
+    d = {}
+    if entity.blob_value:
+      d = util.Deserialize(entity.blob_value)
+    watermark = None
+    if entity.text_value:
+      watermark = datetime.datetime.strptime(
+          entity.text_value, INSTALL_COUNTS_DATETIME_FORMAT)
+    return d, watermark
 
   @classmethod
-  def SetTrendingInstalls(cls, since_hours, d):
-    key = cls._TRENDING_INSTALLS_KEY % since_hours
-    return cls.SetSerializedItem(key, d)
+  def SetInstallCountsState(cls, d, watermark):
+    """Sets the install counts dictionary and its watermark in a single put.
+
+    Args:
+      d: dict of summary data.
+      watermark: datetime.datetime up to which InstallLog entities are
+        counted in d, or None to reset it.
+    """
+    entity = cls.get_by_key_name(cls._INSTALL_COUNTS_KEY)
+    if not entity:
+      entity = cls(key_name=cls._INSTALL_COUNTS_KEY)
+    entity.blob_value = util.Serialize(d)
+    if watermark is None:
+      entity.text_value = None
+    else:
+      entity.text_value = watermark.strftime(INSTALL_COUNTS_DATETIME_FORMAT)
+    entity.put()
+    cls.DeleteMemcacheWrap(cls._INSTALL_COUNTS_KEY)
 
   @classmethod
   def GetPendingCounts(cls):
@@ -778,50 +1899,48 @@ class ReportsCache(KeyValueCache):
     return cls.SetSerializedItem(cls._PENDING_COUNTS_KEY, d)
 
   @classmethod
-  def _GetMsuUserSummaryKey(cls, since, tmp):
-    if since is not None:
-      since = '_since_%s_' % since
-    else:
-      since = ''
-    return '%s%s%s' % (cls._MSU_USER_SUMMARY_KEY, since, tmp * '_tmp')
+  def GetAppleSUSPromotionSchedule(cls):
+    """Returns tuple (promotion schedule dict, datetime) from Datastore."""
+    return cls.GetSerializedItem(cls._APPLESUS_PROMOTION_SCHEDULE_KEY)
 
   @classmethod
-  def SetMsuUserSummary(cls, d, since=None, tmp=False):
-    """Sets the msu user summary dictionary to Datstore.
+  def SetAppleSUSPromotionSchedule(cls, d):
+    """Sets the Apple SUS promotion schedule dictionary to Datastore.
 
     Args:
-      d: dict of summary data.
-      since: str, since when
-      tmp: bool, default False, retrieve tmp summary (in process of
-        calculation)
+      d: dict of promotion schedule data.
     """
-    key = cls._GetMsuUserSummaryKey(since, tmp)
-    return cls.SetSerializedItem(key, d)
+    return cls.SetSerializedItem(cls._APPLESUS_PROMOTION_SCHEDULE_KEY, d)
 
-  @classmethod
-  def GetMsuUserSummary(cls, since, tmp=False):
-    """Gets the MSU user summary dictionary from Datastore.
 
-    Args:
-      since: str, summary since date
-    Returns:
-      (dict of summary data, datetime mtime) or None if no summary
-    """
-    key = cls._GetMsuUserSummaryKey(since, tmp)
-    return cls.GetSerializedItem(key)
+class InstallCountShard(BaseModel):
+  """Partial install counts for one server_datetime partition of InstallLog.
+
+  key_name is the partition start, formatted by KeyName().
+  """
+
+  start = db.DateTimeProperty()
+  end = db.DateTimeProperty()
+  # True once every InstallLog in [start, end) has been counted.
+  complete = db.BooleanProperty(default=False)
+  cursor = db.TextProperty()
+  blob_value = db.BlobProperty()
+  mtime = db.DateTimeProperty(auto_now=True)
 
   @classmethod
-  def DeleteMsuUserSummary(cls, since, tmp=False):
-    """Deletes the MSU user summary entity from Datastore.
+  def KeyName(cls, start):
+    """Returns the key_name for the shard starting at start datetime."""
+    return start.strftime(INSTALL_COUNTS_DATETIME_FORMAT)
 
-    Args:
-      since: str, summary since date
-    """
-    key = cls._GetMsuUserSummaryKey(since, tmp)
-    entity = cls.get_by_key_name(key)
-    if not entity:
-      return
-    entity.delete()
+  def GetCounts(self):
+    """Returns the deserialized dict of per-package counts in this shard."""
+    if self.blob_value:
+      return util.Deserialize(self.blob_value)
+    return {}
+
+  def SetCounts(self, d):
+    """Serializes and sets the dict of per-package counts in this shard."""
+    self.blob_value = util.Serialize(d)
 
 
 # Munki ########################################################################
@@ -937,16 +2056,50 @@ class Tag(BaseModel):
   mrtime = db.DateTimeProperty(auto_now=True)
   keys = db.ListProperty(db.Key)
 
+  def _GetStoredMembers(self):
+    """Returns a set of str keys tagged by the stored copy of this tag."""
+    if not self.has_key():
+      return set()
+    stored = self.get(self.key())
+    if not stored:
+      return set()
+    return set(str(k) for k in stored.keys)
+
   def put(self, *args, **kwargs):
-    """Ensure tags memcache entries are purged when a new one is created."""
+    """Ensure tags memcache entries are purged when a new one is created.
+
+    The TagMembership index is updated by a task enqueued with the put, so
+    it may briefly lag behind large changes; see BaseMembership.
+    """
     memcache.delete(self.ALL_TAGS_MEMCACHE_KEY)
-    return super(Tag, self).put(*args, **kwargs)
+    new_members = set(str(k) for k in self.keys)
+
+    def _Txn():
+      old_members = self._GetStoredMembers()
+      key = super(Tag, self).put(*args, **kwargs)
+      return key, TagMembership.EnqueueUpdate(
+          key.name(), old_members, new_members)
+
+    key, members = db.run_in_transaction_options(
+        db.create_transaction_options(xg=True), _Txn)
+    TagMembership.UpdateMembersInline(key.name(), members)
+    return key
 
   def delete(self, *args, **kwargs):
     """Ensure tags memcache entries are purged when one is delete."""
     # TODO(user): extend BaseModel so such memcache cleanup is reusable.
     memcache.delete(self.ALL_TAGS_MEMCACHE_KEY)
-    return super(Tag, self).delete(*args, **kwargs)
+    name = self.key().name()
+
+    def _Txn():
+      old_members = self._GetStoredMembers()
+      old_members.update(str(k) for k in self.keys)
+      super(Tag, self).delete(*args, **kwargs)
+      return TagMembership.EnqueueUpdate(name, old_members, set())
+
+    members = db.run_in_transaction_options(
+        db.create_transaction_options(xg=True), _Txn)
+    TagMembership.UpdateMembersInline(name, members)
 
   @classmethod
   def GetAllTagNames(cls):
@@ -961,8 +2114,7 @@ class Tag(BaseModel):
   @classmethod
   def GetAllTagNamesForKey(cls, key):
     """Returns a list of all tag names for a given db.Key."""
-    return [k.name() for k in
-            cls.all(keys_only=True).filter('keys =', key)]
+    return TagMembership.GetNames(str(key))
 
   @classmethod
   def GetAllTagNamesForEntity(cls, entity):
@@ -978,15 +2130,49 @@ class Group(BaseModel):
   mrtime = db.DateTimeProperty(auto_now=True)
   users = db.StringListProperty()
 
+  def _GetStoredMembers(self):
+    """Returns a set of users in the stored copy of this group."""
+    if not self.has_key():
+      return set()
+    stored = self.get(self.key())
+    if not stored:
+      return set()
+    return set(stored.users)
+
   def put(self, *args, **kwargs):
-    """Ensure groups memcache entries are purged when a new one is created."""
+    """Ensure groups memcache entries are purged when a new one is created.
+
+    The GroupMembership index is updated by a task enqueued with the put, so
+    it may briefly lag behind large changes; see BaseMembership.
+    """
     memcache.delete(self.ALL_GROUPS_MEMCACHE_KEY)
-    return super(Group, self).put(*args, **kwargs)
+    new_members = set(self.users)
+
+    def _Txn():
+      old_members = self._GetStoredMembers()
+      key = super(Group, self).put(*args, **kwargs)
+      return key, GroupMembership.EnqueueUpdate(
+          key.name(), old_members, new_members)
+
+    key, members = db.run_in_transaction_options(
+        db.create_transaction_options(xg=True), _Txn)
+    GroupMembership.UpdateMembersInline(key.name(), members)
+    return key
 
   def delete(self, *args, **kwargs):
     """Ensure groups memcache entries are purged when one is delete."""
     memcache.delete(self.ALL_GROUPS_MEMCACHE_KEY)
-    return super(Group, self).delete(*args, **kwargs)
+    name = self.key().name()
+
+    def _Txn():
+      old_members = self._GetStoredMembers()
+      old_members.update(self.users)
+      super(Group, self).delete(*args, **kwargs)
+      return GroupMembership.EnqueueUpdate(name, old_members, set())
+
+    members = db.run_in_transaction_options(
+        db.create_transaction_options(xg=True), _Txn)
+    GroupMembership.UpdateMembersInline(name, members)
 
   @classmethod
   def GetAllGroupNames(cls):
@@ -1001,8 +2187,195 @@ class Group(BaseModel):
   @classmethod
   def GetAllGroupNamesForUser(cls, user):
     """Returns a list of all group names for a given string user."""
+    return GroupMembership.GetNames(user)
+
+
+class BaseMembership(BaseModel):
+  """Reverse index of the Tag or Group names a single member belongs to.
+
+  key_name is the member, so a member's tags or groups are resolved with a
+  single get. Tag and Group enqueue the index update in the transaction that
+  changes their members, so it is never lost, but reads may lag until that
+  task runs. Small changes are also indexed right after the commit.
+  """
+
+  # Member diffs up to this size are also indexed in the request changing
+  # them; the enqueued task updates UPDATES_PER_TASK members per task.
+  INLINE_UPDATES = 10
+  UPDATES_PER_TASK = 100
+
+  names = db.StringListProperty()
+  mtime = db.DateTimeProperty(auto_now=True)
+
+  @classmethod
+  def _QueryNames(cls, member):
+    """Returns a list of names a member belongs to, queried from Tag/Group."""
+    raise NotImplementedError
+
+  @classmethod
+  def _FilterNames(cls, names, member):
+    """Returns the names whose Tag/Group entity has a member, using gets."""
+    raise NotImplementedError
+
+  @classmethod
+  def _Update(cls, member, name):
+    """Adds or removes name in a member's index after name's members changed.
+
+    Only name is changed, as confirmed by a get of its Tag/Group in the same
+    transaction, so concurrent updates of other names for the member are
+    kept, and updates can be retried and run in any order. A missing index is
+    seeded from a _QueryNames() query first.
+
+    Args:
+      member: str, key_name of the index entity.
+      name: str, Tag or Group name whose members changed.
+    """
+    seed = None
+    if not cls.get_by_key_name(member):
+      seed = cls._FilterNames(cls._QueryNames(member), member)
+
+    def _Txn():
+      entity = cls.get_by_key_name(member)
+      if not entity:
+        entity = cls(key_name=member, names=sorted(seed or []))
+      names = set(entity.names)
+      if cls._FilterNames([name], member):
+        names.add(name)
+      else:
+        names.discard(name)
+      names = sorted(names)
+      if entity.is_saved() and entity.names == names:
+        return
+      entity.names = names
+      entity.put()
+
+    db.run_in_transaction_options(
+        db.create_transaction_options(xg=True), _Txn)
+
+  @classmethod
+  def UpdateMembersBatch(cls, name, members):
+    """Updates the index of members, deferring the rest on failure.
+
+    Args:
+      name: str, Tag or Group name.
+      members: list of str members added to or removed from name.
+    """
+    for i, member in enumerate(members):
+      try:
+        cls._Update(member, name)
+      except db.Error:
+        logging.warning(
+            'Error updating %s for %s; deferring.', cls.kind(), member)
+        deferred.defer(cls.UpdateMembersBatch, name, members[i:])
+        return
+
+  @classmethod
+  def UpdateMembers(cls, name, members):
+    """Updates the index of members in deferred tasks of UPDATES_PER_TASK.
+
+    Args:
+      name: str, Tag or Group name.
+      members: list of str members added to or removed from name.
+    """
+    for i in xrange(0, len(members), cls.UPDATES_PER_TASK):
+      deferred.defer(
+          cls.UpdateMembersBatch, name, members[i:i + cls.UPDATES_PER_TASK])
+
+  @classmethod
+  def EnqueueUpdate(cls, name, old_members, new_members):
+    """Enqueues indexing members changed in the current transaction.
+
+    Args:
+      name: str, Tag or Group name.
+      old_members: set of str members before the change.
+      new_members: set of str members after the change.
+    Returns:
+      list of str members added to or removed from name.
+    """
+    members = sorted(old_members ^ new_members)
+    if members:
+      deferred.defer(cls.UpdateMembers, name, members, _transactional=True)
+    return members
+
+  @classmethod
+  def UpdateMembersInline(cls, name, members):
+    """Indexes a small committed change now, ahead of its enqueued task.
+
+    Args:
+      name: str, Tag or Group name.
+      members: list of str members added to or removed from name, as
+        returned by EnqueueUpdate().
+    """
+    if len(members) > cls.INLINE_UPDATES:
+      return
+    for member in members:
+      try:
+        cls._Update(member, name)
+      except db.Error:
+        logging.warning(
+            'Error updating %s for %s; left to the queued task.',
+            cls.kind(), member)
+        return
+
+  @classmethod
+  def GetNames(cls, member):
+    """Returns a list of names a member belongs to.
+
+    Members without an index yet, e.g. ones not changed since the index was
+    introduced, are resolved with a Tag/Group query and indexed on the way.
+
+    Args:
+      member: str, key_name of the index entity.
+    Returns:
+      list of str names.
+    """
+    entity = cls.get_by_key_name(member)
+    if entity:
+      return entity.names
+
+    names = sorted(cls._QueryNames(member))
+
+    def _Txn():
+      # changes made since the query are applied to the index they create.
+      if not cls.get_by_key_name(member):
+        cls(key_name=member, names=names).put()
+
+    try:
+      db.run_in_transaction(_Txn)
+    except db.Error:
+      logging.warning('Error indexing %s for %s.', cls.kind(), member)
+    return names
+
+
+class TagMembership(BaseMembership):
+  """Tag names of a tagged entity; key_name is the str db.Key of the entity."""
+
+  @classmethod
+  def _QueryNames(cls, member):
     return [k.name() for k in
-            cls.all(keys_only=True).filter('users =', user)]
+            Tag.all(keys_only=True).filter('keys =', db.Key(member))]
+
+  @classmethod
+  def _FilterNames(cls, names, member):
+    names = list(names)
+    key = db.Key(member)
+    return [n for n, tag in zip(names, Tag.get_by_key_name(names))
+            if tag and key in tag.keys]
+
+
+class GroupMembership(BaseMembership):
+  """Group names of a user; key_name is the str user."""
+
+  @classmethod
+  def _QueryNames(cls, member):
+    return [k.name() for k in
+            Group.all(keys_only=True).filter('users =', member)]
+
+  @classmethod
+  def _FilterNames(cls, names, member):
+    names = list(names)
+    return [n for n, group in zip(names, Group.get_by_key_name(names))
+            if group and member in group.users]
 
 
 class BaseManifestModification(BaseModel):
@@ -1086,6 +2459,25 @@ class BaseManifestModification(BaseModel):
 
     model.DeleteMemcacheWrappedGetAllFilter((('%s =' % mod_type, target),))
 
+  @classmethod
+  def ResetModMemcaches(cls, mod_type_targets):
+    """Clear the memcache associated with many modification types at once.
+
+    Args:
+      mod_type_targets: iterable of (str mod_type, str target) tuples, as
+        passed to ResetModMemcache().
+    Raises:
+      ValueError: if a manifest mod_type is unknown
+    """
+    keys = []
+    for mod_type, target in mod_type_targets:
+      model = MANIFEST_MOD_MODELS.get(mod_type, None)
+      if not model:
+        raise ValueError
+      keys.append(model._GetMemcacheWrappedGetAllFilterKey(
+          (('%s =' % mod_type, target),)))
+    memcache.delete_multi(keys)
+
 
 class SiteManifestModification(BaseManifestModification):
   """Manifest modifications for dynamic manifest generation by site."""
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Search API index of Computer entities."""
+
+import hashlib
+import logging
+import re
+
+from google.appengine.api import search
+from google.appengine.ext import db
+from google.appengine.ext import deferred
+
+
+INDEX_NAME = 'computers'
+# Computer properties searchable by partial value.
+SEARCH_FIELDS = ['hostname', 'owner', 'serial']
+# Computer properties counted for every search; all searchable exactly too.
+FACETS = ['site', 'track', 'os_version', 'client_version']
+MIN_TOKEN_LENGTH = 2
+MAX_TOKEN_LENGTH = 32
+MAX_FACET_VALUES = 20
+
+_WORD_SPLIT_RE = re.compile(r'[^a-z0-9]+')
+
+
+def _GetWords(value):
+  """Returns a list of lowercase alphanumeric words in a str value."""
+  if not value:
+    return []
+  words = _WORD_SPLIT_RE.split(value.lower())
+  return [w[:MAX_TOKEN_LENGTH] for w in words if w]
+
+
+def _GetTokens(field, value):
+  """Returns a space separated str of tokens a field value can be found by.
+
+  Words of hostname and owner are found by any prefix, and serials, which
+  are often searched by their last few characters, by any substring.
+
+  Args:
+    field: str, one of SEARCH_FIELDS.
+    value: str, the Computer property value.
+  Returns:
+    str of tokens.
+  """
+  tokens = set()
+  for word in _GetWords(value):
+    tokens.add(word)
+    for end in xrange(MIN_TOKEN_LENGTH, len(word)):
+      tokens.add(word[:end])
+    if field == 'serial':
+      for start in xrange(1, len(word)):
+        for end in xrange(start + MIN_TOKEN_LENGTH, len(word) + 1):
+          tokens.add(word[start:end])
+  return ' '.join(sorted(tokens))
+
+
+def GetSignature(computer):
+  """Returns a str hash of the indexed values of a Computer."""
+  values = [computer.active]
+  values.extend(getattr(computer, f) for f in SEARCH_FIELDS + FACETS)
+  return hashlib.md5(repr(values)).hexdigest()
+
+
+def GetDocument(computer):
+  """Returns a search.Document for a Computer, with its str key as doc_id."""
+  fields = [
+      search.TextField(name=f, value=_GetTokens(f, getattr(computer, f)))
+      for f in SEARCH_FIELDS]
+  fields.append(
+      search.AtomField(name='active', value=str(int(bool(computer.active)))))
+  facets = []
+  for f in FACETS:
+    value = unicode(getattr(computer, f) or None)
+    fields.append(search.AtomField(name=f, value=value))
+    facets.append(search.AtomFacet(name=f, value=value))
+  return search.Document(
+      doc_id=str(computer.key()), fields=fields, facets=facets)
+
+
+def IndexComputers(computers):
+  """Puts Computer entities into the search index.
+
+  Computers that can't be indexed now are indexed in a deferred task.
+
+  Args:
+    computers: list of Computer entities.
+  """
+  index = search.Index(name=INDEX_NAME)
+  step = search.MAXIMUM_DOCUMENTS_PER_PUT_REQUEST
+  for i in xrange(0, len(computers), step):
+    batch = computers[i:i + step]
+    try:
+      index.put([GetDocument(c) for c in batch])
+    except search.Error:
+      logging.warning('Error indexing %d computers; deferring.', len(batch))
+      deferred.defer(_IndexComputerKeys, [str(c.key()) for c in batch])
+
+
+def _IndexComputerKeys(keys):
+  """Indexes the current state of Computer entities, given str keys."""
+  IndexComputers([c for c in db.get(keys) if c])
+
+
+def _GetQueryString(field, term, include_inactive):
+  """Returns a search query str, or None if term has nothing searchable.
+
+  Args:
+    field: str, one of SEARCH_FIELDS or FACETS to search in, or None to search
+      all SEARCH_FIELDS.
+    term: str, search term.
+    include_inactive: bool, True to include inactive computers.
+  """
+  if field in FACETS:
+    parts = ['%s:"%s"' % (field, term.replace('"', ''))]
+  else:
+    words = _GetWords(term)
+    if not words:
+      return None
+    if field:
+      parts = ['%s:%s' % (field, w) for w in words]
+    else:
+      parts = [
+          '(%s)' % ' OR '.join('%s:%s' % (f, w) for f in SEARCH_FIELDS)
+          for w in words]
+  if not include_inactive:
+    parts.append('active:1')
+  return ' '.join(parts)
+
+
+def Search(field, term, include_inactive=False, limit=20, cursor=None):
+  """Searches the index for computers.
+
+  Args:
+    field: str, one of SEARCH_FIELDS or FACETS to search in, or None to search
+      all SEARCH_FIELDS.
+    term: str, search term; words of it match partial SEARCH_FIELDS values.
+    include_inactive: bool, True to include inactive computers.
+    limit: int, max number of computers to return.
+    cursor: str, optional, web safe cursor of a previous Search() to resume.
+  Returns:
+    tuple of (
+        list of str Computer keys,
+        str web safe cursor of the next page or None,
+        int approximate number of matching computers,
+        dict of str facet name to list of (str value, int count) tuples)
+  """
+  query_string = _GetQueryString(field, term, include_inactive)
+  if not query_string:
+    return [], None, 0, {}
+
+  options = search.QueryOptions(
+      limit=limit, ids_only=True,
+      cursor=search.Cursor(web_safe_string=cursor or None))
+  facet_options = search.FacetOptions(discovery_value_limit=MAX_FACET_VALUES)
+  query = search.Query(
+      query_string=query_string, options=options, return_facets=FACETS,
+      facet_options=facet_options)
+  results = search.Index(name=INDEX_NAME).search(query)
+
+  facets = {}
+  for facet in results.facets:
+    facets[facet.name] = [(v.label, v.count) for v in facet.values]
+  next_cursor = None
+  if results.cursor:
+    next_cursor = results.cursor.web_safe_string
+  return (
+      [r.doc_id for r in results.results], next_cursor,
+      results.number_found, facets)
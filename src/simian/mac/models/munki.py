@@ -267,6 +267,24 @@ class PackageInfo(BaseMunkiModel):
   # this package into manifests.
   manifest_mod_access = db.StringListProperty()
 
+  # Whether put() should maintain the PackageInfoSummary of this entity.
+  _WRITE_SUMMARY = True
+  # KeyValueCache key of a token replaced on every put() and delete(), or
+  # None to not track changes.
+  _LIST_VERSION_KEY = 'pkgsinfo_list_version'
+
+  @classmethod
+  def GetListVersion(cls):
+    """Returns a str token which changes whenever any PackageInfo changes."""
+    version, _ = base.KeyValueCache.GetItem(cls._LIST_VERSION_KEY)
+    return version
+
+  def _BumpListVersion(self):
+    """Replaces the token returned by GetListVersion()."""
+    if self._LIST_VERSION_KEY:
+      base.KeyValueCache.SetItem(
+          self._LIST_VERSION_KEY, os.urandom(16).encode('hex'))
+
   def _GetDescription(self):
     """Returns only admin portion of the desc, omitting avg duration text."""
     desc = self.plist.get('description', None)
@@ -376,7 +394,17 @@ class PackageInfo(BaseMunkiModel):
       self.munki_name = self.plist.GetMunkiName()
     except plist_lib.PlistNotParsedError:
       self.munki_name = None
-    return super(PackageInfo, self).put(*args, **kwargs)
+    if not self._WRITE_SUMMARY:
+      ret = super(PackageInfo, self).put(*args, **kwargs)
+    else:
+      def _Put():
+        # the summary is a child, so both are written or neither is.
+        ret = super(PackageInfo, self).put(*args, **kwargs)
+        PackageInfoSummary.FromPackageInfo(self).put()
+        return ret
+      ret = db.run_in_transaction(_Put)
+    self._BumpListVersion()
+    return ret
 
   def delete(self, *args, **kwargs):
     """Deletes a PackageInfo and cleans up associated data in other models.
@@ -390,7 +418,10 @@ class PackageInfo(BaseMunkiModel):
     Returns:
       return value from superlass delete()
     """
+    summary_key = PackageInfoSummary.KeyForPackageInfo(self.key())
     ret = super(PackageInfo, self).delete(*args, **kwargs)
+    db.delete(summary_key)
+    self._BumpListVersion()
     for catalog in self.catalogs:
       Catalog.Generate(catalog, delay=1)
     if self.blobstore_key:
@@ -683,6 +714,119 @@ class PackageInfo(BaseMunkiModel):
       return sorted(pkgs, key=lambda d: unicode.lower(d.get('munki_name')))
 
 
+class PackageInfoSummary(base.BaseModel):
+  """Denormalized PackageInfo properties, for listings that skip plist parsing.
+
+  Each summary is a child of its PackageInfo and is rewritten in the same
+  transaction on every PackageInfo.put(). Summaries missing for PackageInfo
+  written otherwise are created by GetForPackageInfoKeys().
+  """
+
+  KEY_NAME = 'summary'
+
+  filename = db.StringProperty()
+  name = db.StringProperty()
+  munki_name = db.StringProperty()
+  catalogs = db.StringListProperty()
+  manifests = db.StringListProperty()
+  install_types = db.StringListProperty()
+  manifest_mod_access = db.StringListProperty()
+  created = db.DateTimeProperty()
+  mtime = db.DateTimeProperty()
+  # False if the PackageInfo plist is broken; plist properties below are unset.
+  plist_valid = db.BooleanProperty(default=True)
+  # properties copied from the pkginfo plist.
+  display_name = db.StringProperty()
+  version = db.StringProperty()
+  description = db.TextProperty()
+  installer_item_size = db.IntegerProperty(default=0)
+  force_install_after_date = db.DateTimeProperty()
+  autoremove = db.BooleanProperty(default=False)
+  forced_install = db.BooleanProperty(default=False)
+  unattended_install = db.BooleanProperty(default=False)
+  unattended_uninstall = db.BooleanProperty(default=False)
+  uninstallable = db.BooleanProperty(default=True)
+
+  PLIST_PROPERTIES = (
+      'display_name', 'version', 'installer_item_size',
+      'force_install_after_date', 'autoremove', 'forced_install',
+      'unattended_install', 'unattended_uninstall', 'uninstallable')
+
+  @classmethod
+  def KeyForPackageInfo(cls, pkginfo_key):
+    """Returns the db.Key of the summary for a PackageInfo db.Key."""
+    return db.Key.from_path(cls.kind(), cls.KEY_NAME, parent=pkginfo_key)
+
+  @classmethod
+  def FromPackageInfo(cls, pkginfo):
+    """Returns a new, unsaved summary of a saved PackageInfo entity."""
+    summary = cls(
+        key_name=cls.KEY_NAME, parent=pkginfo.key(),
+        filename=pkginfo.filename, name=pkginfo.name,
+        munki_name=pkginfo.munki_name, catalogs=pkginfo.catalogs,
+        manifests=pkginfo.manifests, install_types=pkginfo.install_types,
+        manifest_mod_access=pkginfo.manifest_mod_access,
+        created=pkginfo.created, mtime=pkginfo.mtime)
+    if not pkginfo.plist:
+      summary.plist_valid = False
+      return summary
+    for prop in cls.PLIST_PROPERTIES:
+      summary._SetPlistValue(prop, pkginfo.plist.get(prop), pkginfo.filename)
+    summary._SetPlistValue(
+        'description', pkginfo.description, pkginfo.filename)
+    return summary
+
+  def _SetPlistValue(self, prop, value, filename):
+    """Sets a property from a plist value, skipping values of the wrong type.
+
+    Args:
+      prop: str, property name.
+      value: plist value, or None to leave the property unset.
+      filename: str, PackageInfo filename, for logging.
+    """
+    if value is None:
+      return
+    if (isinstance(getattr(self.__class__, prop), db.StringProperty) and
+        isinstance(value, (int, long, float))):
+      value = unicode(value)
+    try:
+      setattr(self, prop, value)
+    except db.BadValueError, e:
+      logging.warning(
+          'Invalid %s in pkginfo %s not summarized: %s', prop, filename, e)
+
+  @classmethod
+  def GetForPackageInfoKeys(cls, pkginfo_keys):
+    """Returns summaries of PackageInfo entities, creating any missing ones.
+
+    Args:
+      pkginfo_keys: list of PackageInfo db.Key objects.
+    Returns:
+      list of PackageInfoSummary entities in the order of pkginfo_keys, omitting
+      any PackageInfo which no longer exists.
+    """
+    summaries = []
+    for batch in gae_util.BatchDatastoreOpAsync(
+        db.get_async, [cls.KeyForPackageInfo(k) for k in pkginfo_keys],
+        batch_size=100):
+      summaries.extend(batch)
+
+    # PackageInfo written before summaries existed get one on first listing.
+    missing = [k for k, s in zip(pkginfo_keys, summaries) if s is None]
+    if missing:
+      created = {}
+      for batch in gae_util.BatchDatastoreOpAsync(
+          db.get_async, missing, batch_size=100):
+        for pkginfo in batch:
+          if pkginfo:
+            created[pkginfo.key()] = cls.FromPackageInfo(pkginfo)
+      gae_util.BatchDatastoreOpAsync(db.put_async, created.values())
+      summaries = [
+          s or created.get(k) for k, s in zip(pkginfo_keys, summaries)]
+
+    return [s for s in summaries if s]
+
+
 class PackageInfoProposal(PackageInfo):
   """Proposed settings for a package."""
 
@@ -691,6 +835,9 @@ class PackageInfoProposal(PackageInfo):
   # status of proposal. One of 'proposed', 'approved', 'rejected'.
   status = db.StringProperty()
 
+  _WRITE_SUMMARY = False
+  _LIST_VERSION_KEY = None
+
   # properties that will get copied between PackageInfo and PackageInfoProposal
   # objects
   COMMON_PROPERTIES = ['catalogs', 'manifests', 'install_types', 'plist',
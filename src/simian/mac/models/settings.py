@@ -19,6 +19,15 @@
 from simian.mac.models import base
 
 SETTINGS = {
+    'admission_budgets': {
+        'type': 'string',
+        'title': 'Client Request Admission Budgets',
+        'comment': ('Comma separated endpoint=concurrent/per_second limits, '
+                    'e.g. reports=2/50; 0 is unlimited. Endpoints are auth, '
+                    'catalogs, manifests and reports, and are unlimited '
+                    'unless set here.'),
+        'default': '',
+    },
     'api_info_key': {
         'type': 'random_str',
         'title': 'API Info Key',
@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 """Top level __init__ for handlers package."""
 
-import datetime
 import httplib
 import logging
 import os
@@ -11,11 +10,13 @@ import urllib
 import webapp2
 
 from simian.auth import base as _auth_base
+from simian.mac.common import admission
+from simian.mac.common import util
 from simian.mac.munki import common
 
 
-
-HEADER_DATE_FORMAT = '%a, %d %b %Y %H:%M:%S GMT'
+HEADER_DATE_FORMAT = util.HEADER_DATE_FORMAT
+StrHeaderDateToDatetime = util.StrHeaderDateToDatetime
 
 
 class Error(Exception):
@@ -45,24 +46,6 @@ def IsBlobstore():
      os.environ.get('HTTP_USER_AGENT', None) is None)
 
 
-def StrHeaderDateToDatetime(str_header_dt):
-  """Converts a string header date to a datetime object.
-
-  Args:
-    str_header_dt: str date from header, i.e. If-Modified-Since.
-  Returns:
-    datetime.datetime object, or None if there's a parsing error.
-  """
-  if not str_header_dt:
-    return
-  try:
-    # NOTE(user): strptime is a py2.5+ feature.
-    return datetime.datetime.strptime(str_header_dt, HEADER_DATE_FORMAT)
-  except ValueError:
-    logging.exception(
-        'Error parsing If-Modified-Since date: %s', str_header_dt)
-
-
 def IsClientResourceExpired(resource_dt, str_header_dt):
   """Compares an If-Modified-Since header date to a passed datetime.
 
@@ -111,6 +94,37 @@ def GetClientIdForRequest(request, session=None, client_id_str=None):
 class AuthenticationHandler(webapp2.RequestHandler):
   """Class which handles NotAuthenticated exceptions."""
 
+  # str admission endpoint name; if set, requests are subject to admission
+  # control and rejected with a 503 when the endpoint is over budget.
+  ADMISSION_ENDPOINT = None
+  # if True, the handler calls Admit() itself, after answering the requests
+  # it can answer cheaply, e.g. with a 304.
+  ADMISSION_IN_HANDLER = False
+
+  def dispatch(self):
+    """Dispatches the request, if admission control admits it."""
+    self._admitted = False
+    try:
+      if (self.ADMISSION_ENDPOINT is None or self.ADMISSION_IN_HANDLER or
+          self.Admit()):
+        return super(AuthenticationHandler, self).dispatch()
+    finally:
+      if self._admitted:
+        admission.Release(self.ADMISSION_ENDPOINT)
+
+  def Admit(self):
+    """Admits the request to ADMISSION_ENDPOINT, or responds with a 503.
+
+    Returns:
+      True if the request was admitted, False if the handler must return.
+    """
+    if admission.Admit(self.ADMISSION_ENDPOINT):
+      self._admitted = True
+      return True
+    self.response.set_status(httplib.SERVICE_UNAVAILABLE)
+    self.response.headers['Retry-After'] = str(admission.GetRetryAfter())
+    return False
+
   def handle_exception(self, exception, debug_mode):
     """Handle an exception.
 
@@ -34,6 +34,8 @@ def CreateAuthTokenCookieStr(token):
 class Auth(handlers.AuthenticationHandler):
   """Handler for /auth URL."""
 
+  ADMISSION_ENDPOINT = 'auth'
+
   def GetAuth1Instance(self, ca_id=None):
     """Generate an instance of auth1 class and return it.
 
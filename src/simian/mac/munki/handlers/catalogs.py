@@ -25,6 +25,9 @@ from simian.mac.munki import handlers
 class Catalogs(handlers.AuthenticationHandler):
   """Handler for /catalogs/"""
 
+  ADMISSION_ENDPOINT = 'catalogs'
+  ADMISSION_IN_HANDLER = True
+
   def get(self, name):
     """Catalog get handler.
 
@@ -45,6 +48,8 @@ class Catalogs(handlers.AuthenticationHandler):
     if not handlers.IsClientResourceExpired(catalog.mtime, header_date_str):
       self.response.set_status(httplib.NOT_MODIFIED)
       return
+    if not self.Admit():
+      return
 
     self.response.headers['Last-Modified'] = catalog.mtime.strftime(
         handlers.HEADER_DATE_FORMAT)
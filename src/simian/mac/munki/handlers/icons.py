@@ -14,15 +14,229 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-"""serve icons from GCS."""
+"""serve icons from GCS.
+
+Icons are served with their sha256 as ETag, and hot icons are kept in
+instance memory for INSTANCE_CACHE_SECS. _icon_hashes.plist lists the sha256
+of every icon, as in a munki repo, so clients only fetch changed icons; the
+hashes are stored at upload time rather than read from GCS per request.
+"""
 import base64
+import collections
+import hashlib
 import httplib
 import logging
+import threading
+import time
 
 import cloudstorage as gcs
+from google.appengine.api import memcache
+from google.appengine.ext import db
+from google.appengine.ext import deferred
+
 from simian import settings
+from simian.mac import models
 from simian.mac.common import auth
+from simian.mac.common import util
 from simian.mac.munki import handlers
+from simian.mac.munki import plist
+
+
+ICON_CACHE_CONTROL = 'private, max-age=86400'
+HASHES_CACHE_CONTROL = 'private, no-cache'
+INSTANCE_CACHE_SECS = 300
+INSTANCE_CACHE_MAX_BYTES = 8 * 1024 * 1024
+# KeyValueCache key of the stored icon hashes.
+HASHES_KEY = 'icon_hashes'
+# Stored hashes are rebuilt from GCS when older than this, to pick up icons
+# changed without upload_icon.
+HASHES_REBUILD_SECS = 86400
+HASHES_REBUILD_LOCK_KEY = 'icon_hashes_rebuild'
+HASHES_REBUILD_LOCK_SECS = 600
+
+_cache_lock = threading.Lock()
+# str icon name to tuple of (float expiry time, str content, str sha256), in
+# least recently used order.
+_cache = collections.OrderedDict()
+_cache_bytes = [0]
+
+
+def GetIconPath(bucket, name):
+  """Returns the str GCS path of the icon of a package name."""
+  return '/%s/%s.png' % (bucket, base64.urlsafe_b64encode(name))
+
+
+def _EvictLocked(name):
+  """Removes an icon from the instance cache; _cache_lock must be held."""
+  entry = _cache.pop(name, None)
+  if entry:
+    _cache_bytes[0] -= len(entry[1])
+
+
+def ClearCache(name):
+  """Drops an icon from the instance cache.
+
+  Args:
+    name: str, package name of the icon.
+  """
+  with _cache_lock:
+    _EvictLocked(name)
+
+
+def GetIcon(bucket, name, now=None):
+  """Returns an icon, from the instance cache if possible.
+
+  Args:
+    bucket: str, GCS bucket of icons.
+    name: str, package name of the icon.
+    now: float, optional, supply an alternative time.time() value.
+  Returns:
+    tuple of (str png content, str sha256 hexdigest of content).
+  Raises:
+    gcs.NotFoundError: the icon does not exist.
+  """
+  if now is None:
+    now = time.time()
+  with _cache_lock:
+    entry = _cache.pop(name, None)
+    if entry and entry[0] > now:
+      _cache[name] = entry
+      return entry[1], entry[2]
+    if entry:
+      _cache_bytes[0] -= len(entry[1])
+
+  with gcs.open(GetIconPath(bucket, name), 'r') as gcs_file:
+    content = gcs_file.read()
+  sha256 = hashlib.sha256(content).hexdigest()
+
+  if len(content) <= INSTANCE_CACHE_MAX_BYTES:
+    with _cache_lock:
+      _EvictLocked(name)
+      _cache[name] = (now + INSTANCE_CACHE_SECS, content, sha256)
+      _cache_bytes[0] += len(content)
+      while _cache_bytes[0] > INSTANCE_CACHE_MAX_BYTES:
+        _EvictLocked(next(iter(_cache)))
+  return content, sha256
+
+
+def SetIconHash(name, sha256, now=None):
+  """Stores the sha256 of an uploaded icon in the stored icon hashes.
+
+  Args:
+    name: str, package name of the icon.
+    sha256: str, sha256 hexdigest of the icon content.
+    now: float, optional, supply an alternative time.time() value.
+  """
+  if now is None:
+    now = time.time()
+  filename = '%s.png' % name
+
+  def _Set():
+    entity = models.KeyValueCache.get_by_key_name(HASHES_KEY)
+    if not entity or not entity.blob_value:
+      return  # the first rebuild reads the icon from GCS.
+    stored = util.Deserialize(entity.blob_value)
+    stored['hashes'][filename] = sha256
+    stored['updated'][filename] = now
+    entity.blob_value = util.Serialize(stored)
+    entity.put()
+
+  db.run_in_transaction(_Set)
+  models.KeyValueCache.DeleteMemcacheWrap(HASHES_KEY)
+
+
+def RebuildIconHashes(bucket):
+  """Stores the sha256 of every icon in the bucket, reading each from GCS.
+
+  Args:
+    bucket: str, GCS bucket of icons.
+  """
+  started = time.time()
+  hashes = {}
+  for stat in gcs.listbucket('/%s/' % bucket):
+    object_name = stat.filename.rsplit('/', 1)[-1]
+    if not object_name.endswith('.png'):
+      continue
+    try:
+      name = base64.urlsafe_b64decode(object_name[:-len('.png')])
+    except TypeError:
+      logging.warning('Unexpected icon object: %s', stat.filename)
+      continue
+    try:
+      with gcs.open(stat.filename, 'r') as gcs_file:
+        hashes['%s.png' % name] = hashlib.sha256(gcs_file.read()).hexdigest()
+    except gcs.NotFoundError:
+      continue  # deleted since listing.
+
+  def _Store():
+    entity = models.KeyValueCache.get_by_key_name(HASHES_KEY)
+    if not entity:
+      entity = models.KeyValueCache(key_name=HASHES_KEY)
+    updated = {}
+    if entity.blob_value:
+      # icons uploaded while the bucket was read keep their uploaded hash.
+      stored = util.Deserialize(entity.blob_value)
+      for filename, mtime in stored['updated'].iteritems():
+        if mtime >= started:
+          hashes[filename] = stored['hashes'][filename]
+          updated[filename] = mtime
+    entity.blob_value = util.Serialize(
+        {'hashes': hashes, 'updated': updated, 'rebuilt': started})
+    entity.put()
+
+  db.run_in_transaction(_Store)
+  models.KeyValueCache.DeleteMemcacheWrap(HASHES_KEY)
+  memcache.delete(HASHES_REBUILD_LOCK_KEY)
+
+
+def GetIconHashes(bucket, now=None):
+  """Returns the stored sha256 of every icon in the bucket.
+
+  Hashes are stored as icons are uploaded, and rebuilt from GCS in a deferred
+  task when missing or older than HASHES_REBUILD_SECS, so requests never read
+  icons from GCS.
+
+  Args:
+    bucket: str, GCS bucket of icons.
+    now: float, optional, supply an alternative time.time() value.
+  Returns:
+    dict of str icon filename, e.g. 'Firefox.png', to str sha256 hexdigest.
+  """
+  if now is None:
+    now = time.time()
+  stored, _ = models.KeyValueCache.GetSerializedItem(HASHES_KEY)
+  if now - stored.get('rebuilt', 0) >= HASHES_REBUILD_SECS:
+    if memcache.add(
+        HASHES_REBUILD_LOCK_KEY, 1, time=HASHES_REBUILD_LOCK_SECS):
+      deferred.defer(RebuildIconHashes, bucket)
+  return stored.get('hashes', {})
+
+
+def _GetBucket(handler):
+  """Returns the icons GCS bucket, aborting the request if it's not set."""
+  try:
+    return settings.ICONS_GCS_BUCKET
+  except AttributeError:
+    logging.warning('Dedicated icons GCS bucket is not set.')
+    handler.abort(httplib.BAD_REQUEST)
+
+
+def _SetValidators(handler, sha256, cache_control):
+  """Sets ETag and Cache-Control headers of a response.
+
+  Args:
+    handler: webapp2.RequestHandler instance.
+    sha256: str, sha256 hexdigest of the response body.
+    cache_control: str, Cache-Control header value.
+  Returns:
+    True if the client already has this body, and the response is a 304.
+  """
+  handler.response.headers['ETag'] = '"%s"' % sha256
+  handler.response.headers['Cache-Control'] = cache_control
+  if sha256 in handler.request.if_none_match:
+    handler.response.set_status(httplib.NOT_MODIFIED)
+    return True
+  return False
 
 
 class Icons(handlers.AuthenticationHandler):
@@ -30,18 +244,34 @@ class Icons(handlers.AuthenticationHandler):
 
   def get(self, name):
     auth.DoAnyAuth()
-    try:
-      bucket = settings.ICONS_GCS_BUCKET
-    except AttributeError:
-      logging.warning('Dedicated icons GCS bucket is not set.')
-      self.abort(httplib.BAD_REQUEST)
+    bucket = _GetBucket(self)
 
     name = name.split('.')[0]
-    icon_path = '/%s/%s.png' % (bucket, base64.urlsafe_b64encode(name))
-
     try:
-      with gcs.open(icon_path, 'r') as gcs_file:
-        self.response.headers['Content-Type'] = 'image/png'
-        self.response.write(gcs_file.read())
+      content, sha256 = GetIcon(bucket, name)
     except gcs.NotFoundError:
       self.abort(httplib.NOT_FOUND)
+
+    if _SetValidators(self, sha256, ICON_CACHE_CONTROL):
+      return
+    self.response.headers['Content-Type'] = 'image/png'
+    self.response.write(content)
+
+
+class IconHashes(handlers.AuthenticationHandler):
+  """Handler for /icons/_icon_hashes.plist."""
+
+  def get(self):
+    auth.DoAnyAuth()
+    bucket = _GetBucket(self)
+
+    xml = '\n'.join([
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<plist version="1.0">',
+        plist.DictToXml(GetIconHashes(bucket)),
+        '</plist>'])
+    if _SetValidators(
+        self, hashlib.sha256(xml).hexdigest(), HASHES_CACHE_CONTROL):
+      return
+    self.response.headers['Content-Type'] = 'text/xml; charset=utf-8'
+    self.response.write(xml)
@@ -16,6 +16,7 @@
 #
 """Manifest URL handlers."""
 
+import hashlib
 import httplib
 import logging
 
@@ -27,6 +28,8 @@ from simian.mac.munki import handlers
 class Manifests(handlers.AuthenticationHandler):
   """Handler for /manifests/"""
 
+  ADMISSION_ENDPOINT = 'manifests'
+
   def get(self, client_id_str=''):
     """Manifest get handler.
 
@@ -57,5 +60,12 @@ class Manifests(handlers.AuthenticationHandler):
       self.response.set_status(httplib.SERVICE_UNAVAILABLE)
       return
 
+    # manifests are generated per request, so validate them by content.
+    etag = hashlib.sha256(plist_xml).hexdigest()
+    self.response.headers['ETag'] = '"%s"' % etag
+    if etag in self.request.if_none_match:
+      self.response.set_status(httplib.NOT_MODIFIED)
+      return
+
     self.response.headers['Content-Type'] = 'text/xml; charset=utf-8'
     self.response.out.write(plist_xml)
@@ -30,6 +30,10 @@ from simian.mac.munki import plist
 from simian.mac.munki.handlers import pkgs
 
 
+# Number of PackageInfo entities to fetch and write per batch when listing.
+LIST_FETCH_BATCH_SIZE = 100
+
+
 class PackageDoesNotExistError(plist.PlistError):
   """The package referenced in the pkginfo plist does not exist."""
 
@@ -93,30 +97,69 @@ class PackagesInfo(handlers.AuthenticationHandler):
       if hash_str:
         lock.Release()
     else:
-      query = models.PackageInfo.all()
-
       filename = self.request.get('filename')
-      if filename:
-        query.filter('filename', filename)
-
       install_types = self.request.get_all('install_types')
-      for install_type in install_types:
-        query.filter('install_types =', install_type)
-
       catalogs = self.request.get_all('catalogs')
-      for catalog in catalogs:
-        query.filter('catalogs =', catalog)
-
-      pkgs = []
-      for p in query:
-        pkg = {}
-        for k in p.properties():
-          if k != '_plist':
-            pkg[k] = getattr(p, k)
-        pkgs.append(pkg)
-      self.response.out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-      self.response.out.write(plist.GetXmlStr(pkgs))
+
+      etag = self._GetListEtag(filename, install_types, catalogs)
+      self.response.headers['ETag'] = etag
+      if self.request.headers.get('If-None-Match') == etag:
+        self.response.set_status(httplib.NOT_MODIFIED)
+        return
+
+      query = self._GetListQuery(filename, install_types, catalogs)
       self.response.headers['Content-Type'] = 'text/xml; charset=utf-8'
+      self.response.out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+      self.response.out.write('<array>')
+      while True:
+        batch = query.fetch(LIST_FETCH_BATCH_SIZE)
+        for p in batch:
+          pkg = {}
+          for k in p.properties():
+            if k != '_plist':
+              pkg[k] = getattr(p, k)
+          self.response.out.write('\n%s' % plist.GetXmlStr(pkg, indent_num=1))
+        if len(batch) < LIST_FETCH_BATCH_SIZE:
+          break
+        query.with_cursor(query.cursor())
+      self.response.out.write('\n</array>')
+
+  def _GetListQuery(self, filename, install_types, catalogs):
+    """Returns a PackageInfo query for a pkgsinfo list request.
+
+    Args:
+      filename: str, optional filename to filter on.
+      install_types: list of str install types to filter on.
+      catalogs: list of str catalogs to filter on.
+    Returns:
+      db.Query object.
+    """
+    query = models.PackageInfo.all()
+    if filename:
+      query.filter('filename', filename)
+    for install_type in install_types:
+      query.filter('install_types =', install_type)
+    for catalog in catalogs:
+      query.filter('catalogs =', catalog)
+    return query
+
+  def _GetListEtag(self, filename, install_types, catalogs):
+    """Returns an ETag for a pkgsinfo list request.
+
+    The ETag changes whenever any PackageInfo is put or deleted; see
+    PackageInfo.GetListVersion().
+
+    Args:
+      filename: str, optional filename to filter on.
+      install_types: list of str install types to filter on.
+      catalogs: list of str catalogs to filter on.
+    Returns:
+      str, quoted ETag.
+    """
+    etag = self._Hash(repr((
+        models.PackageInfo.GetListVersion(),
+        filename, install_types, catalogs)))
+    return '"%s"' % etag
 
   def _Hash(self, s):
     """Return a sha256 hash for a string.
@@ -73,6 +73,8 @@ def IsExitFeedbackIpAddress(ip_address):
 class Reports(handlers.AuthenticationHandler):
   """Handler for /reports/."""
 
+  ADMISSION_ENDPOINT = 'reports'
+
   def GetReportFeedback(self, uuid, report_type, **kwargs):
     """Inspect a report and provide a feedback status/command.
 
@@ -220,6 +222,7 @@ class Reports(handlers.AuthenticationHandler):
       to_put.append(entity)
 
     gae_util.BatchDatastoreOp(models.db.put, to_put)
+    models.InstallCountBucket.AddInstalls(to_put)
 
   def post(self):
     """Reports get handler.
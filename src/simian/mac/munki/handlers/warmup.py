@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Warmup URL handler."""
+
+import logging
+
+import webapp2
+
+from simian import settings
+from simian.auth import gaeserver
+from simian.mac import common
+from simian.mac import models
+from simian.mac import urls
+
+
+def ImportHandlers():
+  """Imports the handler modules of all lazily loaded munki routes."""
+  for route in urls.app.router.match_routes:
+    if isinstance(route.handler, basestring):
+      webapp2.import_string(route.handler)
+
+
+def LoadCaParameters():
+  """Loads and parses the default CA parameters, as /auth does."""
+  gaeserver.AuthSimianServer().LoadCaParameters(settings)
+
+
+def LoadSettings():
+  """Reads all settings, caching any that are stored in memcache."""
+  models.Settings.GetAll()
+
+
+def LoadCatalogs():
+  """Reads the catalogs and manifests of all tracks."""
+  for track in common.TRACKS:
+    models.Catalog.MemcacheWrappedGet(track)
+    models.Manifest.MemcacheWrappedGet(track)
+
+
+def LoadManifestModifications():
+  """Reads site and OS version manifest modifications of the fleet.
+
+  These are shared by many clients, so are read for every site and OS version
+  in the fleet summary counters.
+  """
+  counters, _ = models.ComputerSummaryShard.GetSummedCounters()
+  for counter in counters:
+    kind, _, value = counter.partition('|')
+    if kind == 'site':
+      models.SiteManifestModification.MemcacheWrappedGetAllFilter(
+          (('site =', value),))
+    elif kind == 'os':
+      models.OSVersionManifestModification.MemcacheWrappedGetAllFilter(
+          (('os_version =', value),))
+
+
+WARMUP_STEPS = [
+    ImportHandlers, LoadCaParameters, LoadSettings, LoadCatalogs,
+    LoadManifestModifications]
+
+
+class Warmup(webapp2.RequestHandler):
+  """Handler for /_ah/warmup, preparing new instances for client requests."""
+
+  def get(self):
+    """GET handler."""
+    for step in WARMUP_STEPS:
+      try:
+        step()
+      except Exception:  # pylint: disable=broad-except
+        # a failed step only leaves work for the first client requests.
+        logging.exception('Warmup step %s failed.', step.__name__)
@@ -63,6 +63,10 @@ INDENT_CHAR = '  '
 
 PLIST_CONTENT_TYPES = [list, dict, type(None)]
 
+# plist value types which can be safely shared between plist instances.
+IMMUTABLE_TYPES = (
+    basestring, int, long, float, bool, datetime.datetime, type(None))
+
 
 class Error(Exception):
   """Base Exception."""
@@ -133,6 +137,11 @@ class ApplePlist(object):
   # Passed to _ValidateBasic after parsing XML (see docs there).
   _VALIDATE_BASIC_CONFIG = {}
 
+  # True when _plist contents are shared with another instance by copy().
+  _shared = False
+  # True when _plist contents may have changed since parsing; see IsDirty().
+  _dirty = False
+
   # struct size strings for various int sizes
   INT_SIZE_FORMAT = {
       1: 'B',
@@ -168,14 +177,23 @@ class ApplePlist(object):
       self.LoadPlist(plist)
 
   def copy(self):  # pylint: disable=invalid-name
-    """Return a new instance of this plist with the same values."""
+    """Return a new instance of this plist with the same values.
+
+    The contents are shared copy-on-write: neither plist sees changes made
+    through the other, and no copying happens until a change is possible.
+    """
     if not hasattr(self, '_plist'):
       raise PlistNotParsedError
 
     # pylint: disable=protected-access
     new_plist = self.__class__()
-    new_plist._validation_hooks = self._validation_hooks
-    new_plist._plist = self._plist.copy()
+    if self._dirty:
+      # references to the contents may be held elsewhere; don't share them.
+      new_plist._plist = CopyContents(self._plist)
+    else:
+      new_plist._plist = self._plist
+      new_plist._shared = self._shared = True
+    new_plist._dirty = self._dirty
     new_plist._plist_xml = self._plist_xml
     new_plist._plist_xml_encoding = self._plist_xml_encoding
     new_plist._plist_bin = self._plist_bin
@@ -225,6 +243,8 @@ class ApplePlist(object):
   def Reset(self):
     """Reset all internal properties to empty."""
     self._changed = False
+    self._shared = False
+    self._dirty = False
     self._plist_bin = None
     self._plist_xml = None
     self._plist_xml_encoding = None
@@ -259,6 +279,13 @@ class ApplePlist(object):
         15: self._BinLoadUnused,
     }
 
+  def _MarkDirty(self):
+    """Notes that contents may change, first unsharing them if shared."""
+    if self._shared:
+      self._plist = CopyContents(self._plist)
+      self._shared = False
+    self._dirty = True
+
   def _NewMode(self, mode):
     """Push a new mode onto the mode stack, making it current.
 
@@ -428,25 +455,12 @@ class ApplePlist(object):
         return
 
     # if looking for values (mode in key,string,integer), then store them
-    # from this cdata.
-    if self._CurrentMode() == 'key':
-      self._NewValue(value)
-      self._NewMode('value')
-    elif self._CurrentMode() in ['string', 'mvalue']:
+    # from this cdata.  expat may deliver the cdata of a single element in
+    # several pieces, so collect them all and convert once the element ends.
+    if self._CurrentMode() in [
+        'key', 'string', 'integer', 'date', 'data', 'real', 'mvalue']:
       self._NewValue(value)  # put unicode conv logic here if ever needed
       self._NewMode('mvalue')
-    elif self._CurrentMode() == 'integer':
-      self._NewValue(int(value))
-      self._NewMode('value')
-    elif self._CurrentMode() == 'date':
-      self._NewValue(self._ParseDate(value))
-      self._NewMode('value')
-    elif self._CurrentMode() == 'data':
-      self._NewValue(value)
-      self._NewMode('mvalue')
-    elif self._CurrentMode() == 'real':
-      self._NewValue(float(value))
-      self._NewMode('value')
 
   def _EndElementHandler(self, name):
     """End of an element has occured.
@@ -480,9 +494,15 @@ class ApplePlist(object):
         value.insert(0, self._CurrentValue())
         self._ReleaseValue()
       value = ''.join(value)
-      # if this is a data node, now base64 decode it.
+      # convert the complete value according to its element type.
       if self._CurrentMode() == 'data':
         value = self._ParseData(value)
+      elif self._CurrentMode() == 'integer':
+        value = int(value)
+      elif self._CurrentMode() == 'date':
+        value = self._ParseDate(value)
+      elif self._CurrentMode() == 'real':
+        value = float(value)
     # if this element ending is an array or dict, we're done building
     # these structures.  pop the value off and keep it to store it.
     elif name in ['array', 'dict']:
@@ -909,8 +929,13 @@ class ApplePlist(object):
       self._object_offset[offset_no] = oft
       ofs += int_size
 
-  def Parse(self):
-    """Parse a Plist."""
+  def Parse(self, validate=True, encode_xml=True):
+    """Parse a Plist.
+
+    Args:
+      validate: bool, default True, run Validate() after parsing.
+      encode_xml: bool, default True, run EncodeXml() after parsing.
+    """
     if hasattr(self, '_plist'):
       raise PlistAlreadyParsedError
 
@@ -926,8 +951,10 @@ class ApplePlist(object):
     if not hasattr(self, '_plist'):
       raise MalformedPlistError('Plist not parsed; invalid XML?')
 
-    self.Validate()
-    self.EncodeXml()
+    if validate:
+      self.Validate()
+    if encode_xml:
+      self.EncodeXml()
 
   def AddValidationHook(self, method):
     """Adds a validation hook to run when Validate is called.
@@ -1000,6 +1027,7 @@ class ApplePlist(object):
     """
     if not hasattr(self, '_plist'):
       raise PlistNotParsedError
+    self._MarkDirty()
     return self._plist
 
   def SetContents(self, plist_obj):
@@ -1016,6 +1044,8 @@ class ApplePlist(object):
           'Plist contents type is not supported: %s' % type(plist_obj))
 
     self._plist = plist_obj
+    self._shared = False
+    self._dirty = True
     self._changed = True
     self._plist_xml = self.GetXml()
     self.Validate()
@@ -1093,6 +1123,18 @@ class ApplePlist(object):
     plist_xml = self.GetXml(indent_num=indent_num, xml_doc=False)
     return plist_xml
 
+  def IsDirty(self):
+    """Returns True if the contents may have changed since they were parsed.
+
+    Unlike HasChanged(), this is conservative: it is also True once a mutable
+    value such as a nested dict or list has been handed out, as that value
+    may have been modified in place.
+
+    Returns:
+      bool
+    """
+    return self._dirty
+
   def HasChanged(self):
     """Returns true if this plist has been changed since last call.
 
@@ -1151,13 +1193,16 @@ class ApplePlist(object):
     if not hasattr(self, '_plist'):
       raise PlistNotParsedError
 
-    return k in self._plist
+    # an empty <plist> node contains nothing.
+    return self._plist is not None and k in self._plist
 
   def __getitem__(self, k):
     """Standard python __getitem__ method."""
     if not hasattr(self, '_plist'):
       raise PlistNotParsedError
 
+    if not isinstance(self._plist[k], IMMUTABLE_TYPES):
+      self._MarkDirty()
     return self._plist[k]
 
   def __setitem__(self, k, v):
@@ -1165,6 +1210,7 @@ class ApplePlist(object):
     if not hasattr(self, '_plist'):
       raise PlistNotParsedError
 
+    self._MarkDirty()
     self._plist[k] = v
     self._changed = True
 
@@ -1173,6 +1219,7 @@ class ApplePlist(object):
     if not hasattr(self, '_plist'):
       raise PlistNotParsedError
 
+    self._MarkDirty()
     del self._plist[k]
     self._changed = True
 
@@ -1181,6 +1228,8 @@ class ApplePlist(object):
     if not hasattr(self, '_plist'):
       raise PlistNotParsedError
 
+    if type(self._plist) is list:
+      self._MarkDirty()  # array items may be mutable.
     for i in self._plist:
       yield i
 
@@ -1192,7 +1241,10 @@ class ApplePlist(object):
     # note: issubclass(classA,classA) is True, too.
     if not issubclass(other.__class__, self.__class__):
       return False
-    return self._plist == other.GetContents()
+    # compare contents directly; GetContents() would mark other dirty.
+    if not hasattr(other, '_plist'):
+      raise PlistNotParsedError
+    return self._plist == other._plist  # pylint: disable=protected-access
 
   def __ne__(self, other):
     return not self.__eq__(other)
@@ -1374,6 +1426,7 @@ class MunkiPackageInfoPlist(MunkiPlist):
     if not hasattr(self, '_plist'):
       raise PlistNotParsedError
 
+    self._MarkDirty()
     self._plist['description'] = description
     self._changed = True
 
@@ -1388,6 +1441,7 @@ class MunkiPackageInfoPlist(MunkiPlist):
     if not hasattr(self, '_plist'):
       raise PlistNotParsedError
 
+    self._MarkDirty()
     self._plist['display_name'] = display_name
     self._changed = True
 
@@ -1402,6 +1456,7 @@ class MunkiPackageInfoPlist(MunkiPlist):
     if not hasattr(self, '_plist'):
       raise PlistNotParsedError
 
+    self._MarkDirty()
     if unattended_install:
       self._plist['unattended_install'] = True
       # TODO(user): remove backwards compatibility at some point...
@@ -1427,6 +1482,7 @@ class MunkiPackageInfoPlist(MunkiPlist):
     if not hasattr(self, '_plist'):
       raise PlistNotParsedError
 
+    self._MarkDirty()
     if unattended_uninstall:
       self._plist['unattended_uninstall'] = True
       # TODO(user): remove backwards compatibility at some point...
@@ -1452,11 +1508,13 @@ class MunkiPackageInfoPlist(MunkiPlist):
     if not hasattr(self, '_plist'):
       raise PlistNotParsedError
 
+    self._MarkDirty()
     self._plist['catalogs'] = catalogs
     self._changed = True
 
   def RemoveDisplayName(self):
     """Removes the display_name key from the plist."""
+    self._MarkDirty()
     if 'display_name' in self._plist:
       del self._plist['display_name']
 
@@ -1479,10 +1537,112 @@ class AppleSoftwareCatalogPlist(ApplePlist):
     if not hasattr(self, '_plist'):
       raise PlistNotParsedError
 
+    self._MarkDirty()
     self._plist['catalogs'] = catalogs
     self._changed = True
 
 
+class _ItemStreamingPlist(ApplePlist):
+  """ApplePlist which hands off completed container items instead of storing.
+
+  Items of the array or dict found at path are removed from the object tree
+  as soon as each one is complete, so the tree never holds more than one.
+  """
+
+  def __init__(self, path=()):
+    super(_ItemStreamingPlist, self).__init__()
+    self._path = list(path)
+    self._items = []
+
+  def _EndElementHandler(self, name):
+    """End of an element has occured.
+
+    Args:
+      name: str, name of the element, like "dict"
+    """
+    super(_ItemStreamingPlist, self)._EndElementHandler(name)
+    depth = len(self._path)
+    if (self._current_mode[:1] != ['plist'] or
+        len(self._current_mode) != depth + 2 or
+        self._current_key != self._path or
+        len(self._current_value) != depth + 1):
+      return
+    container = self._current_value[depth]
+    if type(container) is list:
+      self._items.extend(container)
+      del container[:]
+    elif type(container) is dict:
+      while container:
+        self._items.append(container.popitem())
+
+  def PopItems(self):
+    """Returns and forgets the list of items completed so far."""
+    items = self._items
+    self._items = []
+    return items
+
+
+def IterParseItems(plist_xml, path=(), chunk_size=64 * 1024):
+  """Incrementally parses a XML plist, yielding items of one container.
+
+  Unlike ApplePlist.Parse(), the whole document is never materialized, and no
+  validation or re-encoding takes place. Use this for large documents such as
+  catalogs, where only one pkginfo dict needs to be held at a time.
+
+  Args:
+    plist_xml: str or unicode XML plist, or a file-like object to read it from.
+    path: sequence, optional, str dict keys leading from the top-level
+        element to the container to stream, e.g. ('Products',) for an Apple
+        Software Update catalog. Default is the top-level element itself.
+    chunk_size: int, number of bytes to feed the XML parser at a time.
+  Yields:
+    for an array container, each item value; for a dict container, each
+        (key, value) tuple.
+  Raises:
+    MalformedPlistError: the XML is not well-formed.
+  """
+  streaming_plist = _ItemStreamingPlist(path)
+  parser = streaming_plist._GetParser()  # pylint: disable=protected-access
+
+  if hasattr(plist_xml, 'read'):
+    read = plist_xml.read
+  else:
+    chunks = (plist_xml[i:i + chunk_size]
+              for i in xrange(0, len(plist_xml), chunk_size))
+    read = lambda unused_size: next(chunks, '')
+
+  while True:
+    chunk = read(chunk_size)
+    try:
+      parser.Parse(chunk, not chunk)
+    except xml.parsers.expat.ExpatError as e:
+      raise MalformedPlistError(str(e))
+    for item in streaming_plist.PopItems():
+      yield item
+    if not chunk:
+      break
+
+
+def CopyContents(value):
+  """Returns a copy of plist contents, recursively copying lists and dicts.
+
+  Args:
+    value: any plist value, typically the contents of a parsed plist.
+  Returns:
+    a copy of value that shares no mutable structure with it.
+  """
+  value_type = type(value)
+  if value_type is dict:
+    return dict((k, CopyContents(v)) for k, v in value.iteritems())
+  elif value_type is list:
+    return [CopyContents(v) for v in value]
+  elif value_type is set:
+    return set(value)
+  elif isinstance(value, ApplePlist):
+    return value.copy()
+  return value
+
+
 def EscapeString(s):
   """Given a string, return a XML-escaped version.
 
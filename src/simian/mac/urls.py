@@ -14,20 +14,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-"""Main module for Simian including wsgi URL mappings."""
+"""Main module for Simian including wsgi URL mappings.
+
+Handlers are given by name, so each handler module, and the auth, plist and
+crypto modules it depends on, is only imported once a request needs it.
+"""
 
 import webapp2
 
 from simian import settings
-from simian.mac.munki.handlers import applesus
-from simian.mac.munki.handlers import auth
-from simian.mac.munki.handlers import catalogs
-from simian.mac.munki.handlers import icons
-from simian.mac.munki.handlers import manifests
-from simian.mac.munki.handlers import pkgs
-from simian.mac.munki.handlers import pkgsinfo
-from simian.mac.munki.handlers import reports
-from simian.mac.munki.handlers import uploadfile
+from simian.mac.common import rpc_stats
+
+
+HANDLERS = 'simian.mac.munki.handlers.'
 
 
 class RedirectToAdmin(webapp2.RequestHandler):
@@ -40,29 +39,33 @@ class RedirectToAdmin(webapp2.RequestHandler):
 
 app = webapp2.WSGIApplication([
     # GET Apple Software Update Service catalog with header client-id.
-    (r'/applesus/?$', applesus.AppleSUS),
-    (r'/applesus/([^/]+)$', applesus.AppleSUS),
-    (r'/applesus/([^/]+)/([^/]+)?$', applesus.AppleSUS),
+    (r'/applesus/?$', HANDLERS + 'applesus.AppleSUS'),
+    (r'/applesus/([^/]+)$', HANDLERS + 'applesus.AppleSUS'),
+    (r'/applesus/([^/]+)/([^/]+)?$', HANDLERS + 'applesus.AppleSUS'),
     # GET munki catalogs.
-    (r'/catalogs/([\w\-\.]+)$', catalogs.Catalogs),
+    (r'/catalogs/([\w\-\.]+)$', HANDLERS + 'catalogs.Catalogs'),
     # GET munki manifests.
-    (r'/manifests/([\w\-\_\.\=\|\%]+)$', manifests.Manifests),
-    (r'/icons/([\w\-\_\.\=\|\%]+)$', icons.Icons),
+    (r'/manifests/([\w\-\_\.\=\|\%]+)$', HANDLERS + 'manifests.Manifests'),
+    # GET sha256 hashes of all icons, then icons.
+    (r'/icons/_icon_hashes\.plist$', HANDLERS + 'icons.IconHashes'),
+    (r'/icons/([\w\-\_\.\=\|\%]+)$', HANDLERS + 'icons.Icons'),
     # GET munki packages.
-    (r'/pkgs/([\w\-\. \%]+)$', pkgs.Packages),
-    (r'/pkgs\-userauth/([\w\-\. \%]+)$', pkgs.Packages),  # forces user auth.
+    (r'/pkgs/([\w\-\. \%]+)$', HANDLERS + 'pkgs.Packages'),
+    # forces user auth.
+    (r'/pkgs\-userauth/([\w\-\. \%]+)$', HANDLERS + 'pkgs.Packages'),
     # GET list of all munki packages.
-    (r'/pkgsinfo/?$', pkgsinfo.PackagesInfo),
+    (r'/pkgsinfo/?$', HANDLERS + 'pkgsinfo.PackagesInfo'),
     # GET munki pkginfo, PUT updated pkginfo
-    (r'/pkgsinfo/([\w\-\_\.\=\|\%]+)$', pkgsinfo.PackagesInfo),
+    (r'/pkgsinfo/([\w\-\_\.\=\|\%]+)$', HANDLERS + 'pkgsinfo.PackagesInfo'),
     # POST reports from munki.
-    (r'/reports$', reports.Reports),
+    (r'/reports$', HANDLERS + 'reports.Reports'),
     # PUT uploadfile from munki.
-    (r'/uploadfile/([\w\-]+)/([\w\-\.]+)$', uploadfile.UploadFile),
+    (r'/uploadfile/([\w\-]+)/([\w\-\.]+)$', HANDLERS + 'uploadfile.UploadFile'),
     # GET auth logout, POST munki auth.
-    (r'/auth/?$', auth.Auth),
-    (r'/repair/?$', pkgs.ClientRepair),
-    (r'/repair/([\w\-\_\.\=\|\%]+)$', pkgs.ClientRepair),
-    (r'/_ah/warmup', RedirectToAdmin),
+    (r'/auth/?$', HANDLERS + 'auth.Auth'),
+    (r'/repair/?$', HANDLERS + 'pkgs.ClientRepair'),
+    (r'/repair/([\w\-\_\.\=\|\%]+)$', HANDLERS + 'pkgs.ClientRepair'),
+    (r'/_ah/warmup', HANDLERS + 'warmup.Warmup'),
     (r'/?$', RedirectToAdmin),
 ], debug=settings.DEBUG)
+rpc_stats.Install(app)
@@ -0,0 +1,631 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Tool to simulate a fleet of Simian clients.
+
+Each simulated client makes the requests of a Munki run with the Simian client
+library: auth, a preflight report, the manifest, its catalogs, packages, an
+install report, a postflight report and logout. Clients arrive in a uniform,
+poisson or burst pattern, and failures can be injected into their requests or
+runs; latency, size and error counts are collected per step.
+
+Against a server, e.g. a dev_appserver, auth uses a client certificate and key
+signed by the server's CA:
+
+  fleet_simulator.py --server http://localhost:8080 --cert client.pem \
+      --key client.key --clients 1000 --concurrency 50 --arrival burst
+
+Tests can instead pass a TestbedTransport to FleetSimulator, which serves the
+requests with an in-process app using testbed stubs.
+"""
+
+import json
+import optparse
+import os
+import plistlib
+import Queue
+import random
+import StringIO
+import threading
+import time
+import urllib
+import uuid as uuid_lib
+
+from simian.client import client
+from simian.mac.client import flight_common
+
+
+STEPS = [
+    'auth', 'preflight', 'manifest', 'catalogs', 'pkgs', 'install_report',
+    'postflight', 'logout']
+ARRIVAL_PATTERNS = ['uniform', 'poisson', 'burst']
+PERCENTILES = [50, 90, 99]
+JSON_PREFIX = ')]}\',\n'
+OS_VERSIONS = ['10.11.6', '10.12.6', '10.13.1']
+SITES = ['site1', 'site2', 'site3']
+
+# Serializes requests to in-process apps, as handlers read auth cookies and
+# users from os.environ, which all threads share.
+_testbed_lock = threading.Lock()
+
+
+class Error(Exception):
+  """Base error."""
+
+
+class InjectedFailure(client.HTTPError):
+  """A request was failed by failure injection."""
+
+
+def GetArrivalTimes(pattern, count, duration, rand):
+  """Returns arrival times of clients.
+
+  Args:
+    pattern: str, one of ARRIVAL_PATTERNS.
+    count: int, number of clients.
+    duration: float, seconds over which clients arrive; burst ignores it.
+    rand: random.Random instance.
+  Returns:
+    sorted list of float seconds since the start of the simulation.
+  Raises:
+    Error: pattern is unknown.
+  """
+  if pattern == 'uniform':
+    return [duration * i / float(count) for i in xrange(count)]
+  elif pattern == 'poisson':
+    if not duration:
+      return [0.0] * count
+    rate = count / float(duration)
+    times = []
+    t = 0.0
+    for _ in xrange(count):
+      t += rand.expovariate(rate)
+      times.append(t)
+    return times
+  elif pattern == 'burst':
+    return [0.0] * count
+  raise Error('Unknown arrival pattern: %s' % pattern)
+
+
+def _GetPercentile(sorted_values, percentile):
+  """Returns the nearest-rank percentile of a sorted, non-empty list."""
+  index = max(0, int(len(sorted_values) * percentile / 100.0 + 0.5) - 1)
+  return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+class FleetStats(object):
+  """Thread-safe latency, size and error totals per step of client runs."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._ms = dict((step, []) for step in STEPS)
+    self._errors = dict.fromkeys(STEPS, 0)
+    self._bytes = dict.fromkeys(STEPS, 0)
+    self.clients = 0
+    self.completed = 0
+    self.failed = 0
+    self.abandoned = 0
+    self.exited = 0
+    self.seconds = 0
+
+  def Record(self, step, ms, size, error=False):
+    """Records a step of a client run.
+
+    Args:
+      step: str, one of STEPS.
+      ms: float, milliseconds the step took.
+      size: int, bytes sent and received in the step.
+      error: bool, True if the step failed.
+    """
+    with self._lock:
+      self._ms[step].append(ms)
+      self._bytes[step] += size
+      if error:
+        self._errors[step] += 1
+
+  def RecordRun(self, result):
+    """Records the result of a client run.
+
+    Args:
+      result: str, one of 'completed', 'failed', 'abandoned' or 'exited'.
+    """
+    with self._lock:
+      self.clients += 1
+      setattr(self, result, getattr(self, result) + 1)
+
+  def Summary(self):
+    """Returns a list of dicts of stats per step with any requests."""
+    summary = []
+    with self._lock:
+      for step in STEPS:
+        values = sorted(self._ms[step])
+        if not values:
+          continue
+        row = {
+            'step': step,
+            'count': len(values),
+            'errors': self._errors[step],
+            'max_ms': int(values[-1]),
+            'avg_bytes': self._bytes[step] / len(values),
+        }
+        for p in PERCENTILES:
+          row['p%d_ms' % p] = int(_GetPercentile(values, p))
+        summary.append(row)
+    return summary
+
+  def Format(self):
+    """Returns a str table of the stats."""
+    lines = [
+        ('%d clients in %ds: %d completed, %d failed, %d abandoned, '
+         '%d exited') % (
+            self.clients, self.seconds, self.completed, self.failed,
+            self.abandoned, self.exited),
+        '%-15s %7s %7s %s %7s %10s' % (
+            'step', 'count', 'errors',
+            ' '.join('%7s' % ('p%d_ms' % p) for p in PERCENTILES),
+            'max_ms', 'avg_bytes'),
+    ]
+    for row in self.Summary():
+      lines.append('%-15s %7d %7d %s %7d %10d' % (
+          row['step'], row['count'], row['errors'],
+          ' '.join('%7d' % row['p%d_ms' % p] for p in PERCENTILES),
+          row['max_ms'], row['avg_bytes']))
+    return '\n'.join(lines)
+
+
+class _TestbedResponse(object):
+  """httplib.HTTPResponse-like response of a TestbedConnection."""
+
+  def __init__(self, response):
+    self.status = response.status_int
+    self.reason = response.status.split(' ', 1)[-1]
+    self._headers = {}
+    for name, value in response.headerlist:
+      name = name.lower()
+      if name in self._headers:
+        value = '%s, %s' % (self._headers[name], value)
+      self._headers[name] = value
+    self._body = StringIO.StringIO(response.body)
+
+  def getheaders(self):
+    return self._headers.items()
+
+  def read(self, size=-1):
+    return self._body.read(size)
+
+
+class TestbedConnection(object):
+  """httplib.HTTPConnection-like connection to an in-process WSGI app."""
+
+  def __init__(self, app, remote_addr):
+    self._app = app
+    self._remote_addr = remote_addr
+    self._response = None
+
+  def request(self, method, url, body=None, headers=None):
+    import webapp2  # pylint: disable=g-import-not-at-top
+    if hasattr(body, 'read'):
+      body = body.read()
+    request = webapp2.Request.blank(
+        url, headers=headers, method=method, body=body or '',
+        remote_addr=self._remote_addr)
+    environ = {
+        'HTTP_COOKIE': request.environ.get('HTTP_COOKIE', ''),
+        'REMOTE_ADDR': self._remote_addr,
+        'USER_EMAIL': '',
+        'USER_ID': '',
+        'USER_IS_ADMIN': '0',
+    }
+    with _testbed_lock:
+      saved = dict((k, os.environ.get(k)) for k in environ)
+      os.environ.update(environ)
+      try:
+        self._response = _TestbedResponse(request.get_response(self._app))
+      finally:
+        for k, v in saved.iteritems():
+          if v is None:
+            del os.environ[k]
+          else:
+            os.environ[k] = v
+
+  def getresponse(self):
+    return self._response
+
+
+class TestbedTransport(object):
+  """Serves simulated client requests with an app using testbed stubs.
+
+  The testbed must be activated, with datastore and memcache stubs, before
+  the simulation runs.
+  """
+
+  def __init__(self, app=None):
+    if app is None:
+      from simian.mac import urls  # pylint: disable=g-import-not-at-top
+      app = urls.app
+    self._app = app
+
+  def Connect(self, remote_addr):
+    return TestbedConnection(self._app, remote_addr)
+
+  def IssueAuthToken(self, uuid):
+    """Returns a str auth token for a client, skipping the auth handshake."""
+    from simian.auth import gaeserver  # pylint: disable=g-import-not-at-top
+    with _testbed_lock:
+      return gaeserver.AuthSimianServer().SessionCreateUserAuthToken(uuid)
+
+
+class SimulatedClient(client.SimianAuthClient):
+  """Simian client making the requests of a Munki run for a fake computer."""
+
+  def __init__(
+      self, hostname, client_id, rand, failure_rate=0.0, transport=None,
+      cert=None, key=None):
+    """Constructor.
+
+    Args:
+      hostname: str, server URL.
+      client_id: dict client identifier, as from GetClientIdentifier().
+      rand: random.Random instance.
+      failure_rate: float, probability of failing any request attempt before
+        it is sent.
+      transport: TestbedTransport, optional, to serve requests in-process.
+      cert: str, PEM client certificate for auth, if no transport is used.
+      key: str, PEM private key of cert.
+    """
+    self.client_id = client_id
+    self.bytes = 0
+    self._rand = rand
+    self._failure_rate = failure_rate
+    self._transport = transport
+    self._cert = cert
+    self._key = key
+    self._remote_addr = '10.%d.%d.%d' % (
+        rand.randint(0, 255), rand.randint(0, 255), rand.randint(1, 254))
+    self._client_id_str = flight_common.DictToStr(client_id)
+    self._munki_headers = {
+        flight_common.MUNKI_CLIENT_ID_HEADER_KEY: self._client_id_str}
+    super(SimulatedClient, self).__init__(hostname=hostname)
+
+  def _GetPuppetSslDetails(self, cert_fname=None, interactive_user=False):
+    if not self._cert or not self._key:
+      return {}
+    return {
+        'cert': self._cert, 'priv_key': self._key,
+        'cn': self.client_id['uuid']}
+
+  def _Connect(self):
+    if self._transport:
+      return self._transport.Connect(self._remote_addr)
+    return super(SimulatedClient, self)._Connect()
+
+  def _DoRequestResponse(
+      self, method, url, body=None, headers=None, output_file=None):
+    if self._rand.random() < self._failure_rate:
+      raise InjectedFailure('%s %s' % (method, url))
+    if type(body) is dict:
+      self.bytes += len(urllib.urlencode(body))
+    elif isinstance(body, basestring):
+      self.bytes += len(body)
+    response = super(SimulatedClient, self)._DoRequestResponse(
+        method, url, body=body, headers=headers, output_file=output_file)
+    self.bytes += response.body_len or 0
+    return response
+
+  def Auth(self):
+    """Gets an auth token, with the auth handshake unless in-process."""
+    if self._transport:
+      self.SetAuthToken(
+          self._transport.IssueAuthToken(self.client_id['uuid']))
+    else:
+      self.GetAuthToken()
+
+  def Preflight(self):
+    """Posts a preflight report, returning the dict of server feedback."""
+    params = {
+        '_report_type': 'preflight',
+        'client_id': self._client_id_str,
+        'user_settings': '',
+        'json': '1',
+    }
+    response = self.PostReportBody(urllib.urlencode(params))
+    try:
+      feedback = json.loads(response[len(JSON_PREFIX):])
+    except ValueError:
+      feedback = None
+    if not isinstance(feedback, dict):
+      raise client.SimianServerError('Invalid preflight feedback')
+    return feedback
+
+  def FetchManifest(self):
+    """Returns the manifest of the client, as a dict."""
+    body = self._SimianRequest(
+        'GET', '/manifests/%s' % self.client_id['track'],
+        headers=dict(self._munki_headers))
+    return plistlib.readPlistFromString(body)
+
+  def FetchCatalogs(self, names):
+    """Returns a list of pkginfo dicts in the named catalogs."""
+    pkginfos = []
+    for name in names:
+      body = self._SimianRequest(
+          'GET', '/catalogs/%s' % urllib.quote(name),
+          headers=dict(self._munki_headers))
+      pkginfos.extend(plistlib.readPlistFromString(body))
+    return pkginfos
+
+  def FetchPackages(self, pkginfos):
+    """Downloads the packages of pkginfos, discarding their contents."""
+    for pkginfo in pkginfos:
+      self._SimianRequest(
+          'GET', '/pkgs/%s' % urllib.quote(pkginfo['installer_item_location']),
+          headers=dict(self._munki_headers), output_filename=os.devnull)
+
+  def PostInstallReport(self, pkginfos, items):
+    """Posts an install report of items installs, cycling through pkginfos."""
+    installs = []
+    for i in xrange(items):
+      pkginfo = pkginfos[i % len(pkginfos)] if pkginfos else {}
+      installs.append(flight_common.DictToStr({
+          'name': pkginfo.get('name', 'simulated%d' % i),
+          'version': pkginfo.get('version', '1.0'),
+          'applesus': False,
+          'status': 0,
+          'time': time.time(),
+          'duration_seconds': self._rand.randint(1, 600),
+          'download_kbytes_per_sec': self._rand.randint(100, 10000),
+          'unattended': True,
+      }))
+    self.PostReport('install_report', {
+        'on_corp': self.client_id['on_corp'],
+        'installs': installs,
+        'removals': [],
+        'problem_installs': [],
+    })
+
+  def Postflight(self):
+    """Posts a postflight report."""
+    self.PostReport('postflight', {
+        'client_id': self._client_id_str,
+        'pkgs_to_install': [],
+        'apple_updates_to_install': [],
+    })
+
+  def Logout(self):
+    """Logs out the auth token."""
+    if not self.LogoutAuthToken():
+      raise client.SimianServerError('Logout failed')
+
+
+class FleetSimulator(object):
+  """Runs simulated clients against a server and collects FleetStats."""
+
+  def __init__(
+      self, server, clients=100, concurrency=10, duration=60,
+      arrival='uniform', failure_rate=0.0, abandon_rate=0.0,
+      install_report_items=5, pkgs_per_client=1, track='stable', cert=None,
+      key=None, transport=None, seed=None):
+    """Constructor.
+
+    Args:
+      server: str, server URL.
+      clients: int, number of clients to run.
+      concurrency: int, max number of clients running at once; later
+        arrivals wait for a free slot.
+      duration: float, seconds over which clients arrive.
+      arrival: str, one of ARRIVAL_PATTERNS.
+      failure_rate: float, probability of failing each request attempt.
+      abandon_rate: float, probability of a client stopping its run before a
+        random step after auth, like a computer going to sleep.
+      install_report_items: int, installs in each install report.
+      pkgs_per_client: int, max packages each client downloads.
+      track: str, track of all clients.
+      cert: str, PEM client certificate for auth against a server.
+      key: str, PEM private key of cert.
+      transport: TestbedTransport, optional, to serve requests in-process.
+      seed: optional, seed for reproducible clients and failures.
+    """
+    self.server = server
+    self.clients = clients
+    self.concurrency = concurrency
+    self.duration = duration
+    self.arrival = arrival
+    self.failure_rate = failure_rate
+    self.abandon_rate = abandon_rate
+    self.install_report_items = install_report_items
+    self.pkgs_per_client = pkgs_per_client
+    self.track = track
+    self.cert = cert
+    self.key = key
+    self.transport = transport
+    self.seed = seed
+    self.stats = FleetStats()
+
+  def _GetClientId(self, index, rand):
+    """Returns a dict client identifier of a simulated computer."""
+    return {
+        'uuid': str(uuid_lib.UUID(int=rand.getrandbits(128))),
+        'owner': 'simuser%d' % index,
+        'hostname': 'sim-%06d' % index,
+        'serial': 'SIM%09d' % index,
+        'config_track': self.track,
+        'track': self.track,
+        'applesus': True,
+        'mgmt_enabled': True,
+        'site': rand.choice(SITES),
+        'os_version': rand.choice(OS_VERSIONS),
+        'client_version': '2.5.sim',
+        'on_corp': rand.choice(['0', '1']),
+        'last_notified_datetime': None,
+        'runtype': 'auto',
+        'uptime': float(rand.randint(60, 30 * 86400)),
+        'root_disk_free': rand.randint(1, 500) * 2 ** 30,
+        'user_disk_free': None,
+    }
+
+  def _Step(self, c, step, fn, *args):
+    """Runs and records one step of a client run, returning its result."""
+    c.bytes = 0
+    start = time.time()
+    try:
+      result = fn(*args)
+    except client.Error:
+      self.stats.Record(step, (time.time() - start) * 1000, c.bytes, True)
+      raise
+    self.stats.Record(step, (time.time() - start) * 1000, c.bytes)
+    return result
+
+  def RunClient(self, index):
+    """Runs one simulated client.
+
+    Args:
+      index: int, index of the client, unique within the fleet.
+    Returns:
+      str result, one of 'completed', 'failed', 'abandoned' or 'exited'.
+    """
+    rand = random.Random('%s-%d' % (self.seed, index))
+    c = SimulatedClient(
+        self.server, self._GetClientId(index, rand), rand,
+        failure_rate=self.failure_rate, transport=self.transport,
+        cert=self.cert, key=self.key)
+    stop_before = None
+    if rand.random() < self.abandon_rate:
+      stop_before = rand.choice(STEPS[1:])
+
+    try:
+      for step in STEPS:
+        if step == stop_before:
+          return 'abandoned'
+        if step == 'auth':
+          self._Step(c, step, c.Auth)
+        elif step == 'preflight':
+          if self._Step(c, step, c.Preflight).get('exit'):
+            return 'exited'
+        elif step == 'manifest':
+          manifest = self._Step(c, step, c.FetchManifest)
+        elif step == 'catalogs':
+          catalog = self._Step(
+              c, step, c.FetchCatalogs,
+              manifest.get('catalogs') or [self.track])
+        elif step == 'pkgs':
+          managed = set(manifest.get('managed_installs', []))
+          pkginfos = [p for p in catalog if p.get('name') in managed]
+          self._Step(
+              c, step, c.FetchPackages, pkginfos[:self.pkgs_per_client])
+        elif step == 'install_report':
+          self._Step(
+              c, step, c.PostInstallReport, pkginfos,
+              self.install_report_items)
+        elif step == 'postflight':
+          self._Step(c, step, c.Postflight)
+        elif step == 'logout':
+          self._Step(c, step, c.Logout)
+    except client.Error:
+      return 'failed'
+    return 'completed'
+
+  def _Worker(self, arrivals, start):
+    """Runs clients from a queue of arrivals until it is empty."""
+    while True:
+      try:
+        offset, index = arrivals.get_nowait()
+      except Queue.Empty:
+        return
+      delay = start + offset - time.time()
+      if delay > 0:
+        time.sleep(delay)
+      self.stats.RecordRun(self.RunClient(index))
+
+  def Run(self):
+    """Runs the fleet.
+
+    Returns:
+      FleetStats of the run.
+    """
+    rand = random.Random(self.seed)
+    arrivals = Queue.Queue()
+    times = GetArrivalTimes(self.arrival, self.clients, self.duration, rand)
+    for index, offset in enumerate(times):
+      arrivals.put((offset, index))
+
+    start = time.time()
+    threads = []
+    for _ in xrange(min(self.concurrency, self.clients)):
+      t = threading.Thread(target=self._Worker, args=(arrivals, start))
+      t.daemon = True
+      t.start()
+      threads.append(t)
+    for t in threads:
+      t.join()
+    self.stats.seconds = time.time() - start
+    return self.stats
+
+
+def main():
+  optparser = optparse.OptionParser()
+  optparser.add_option(
+      '-s', '--server', dest='server', help='Server URL.')
+  optparser.add_option(
+      '--cert', dest='cert', help='Client certificate PEM file.')
+  optparser.add_option(
+      '--key', dest='key', help='Client private key PEM file.')
+  optparser.add_option(
+      '-n', '--clients', dest='clients', type='int', default=100,
+      help='Number of clients to simulate.')
+  optparser.add_option(
+      '-c', '--concurrency', dest='concurrency', type='int', default=10,
+      help='Max number of clients running at once.')
+  optparser.add_option(
+      '-d', '--duration', dest='duration', type='float', default=60,
+      help='Seconds over which clients arrive.')
+  optparser.add_option(
+      '-a', '--arrival', dest='arrival', default='uniform',
+      choices=ARRIVAL_PATTERNS, help='Arrival pattern of clients.')
+  optparser.add_option(
+      '--failure-rate', dest='failure_rate', type='float', default=0.0,
+      help='Probability of failing each request attempt.')
+  optparser.add_option(
+      '--abandon-rate', dest='abandon_rate', type='float', default=0.0,
+      help='Probability of a client abandoning its run.')
+  optparser.add_option(
+      '--install-report-items', dest='install_report_items', type='int',
+      default=5, help='Installs in each install report.')
+  optparser.add_option(
+      '--pkgs-per-client', dest='pkgs_per_client', type='int', default=1,
+      help='Max packages each client downloads.')
+  optparser.add_option(
+      '-t', '--track', dest='track', default='stable', help='Client track.')
+  optparser.add_option(
+      '--seed', dest='seed', help='Random seed, for reproducible runs.')
+  options, _ = optparser.parse_args()
+
+  if not options.server or not options.cert or not options.key:
+    optparser.error('--server, --cert and --key are required.')
+
+  simulator = FleetSimulator(
+      options.server, clients=options.clients,
+      concurrency=options.concurrency, duration=options.duration,
+      arrival=options.arrival, failure_rate=options.failure_rate,
+      abandon_rate=options.abandon_rate,
+      install_report_items=options.install_report_items,
+      pkgs_per_client=options.pkgs_per_client, track=options.track,
+      cert=open(options.cert, 'r').read(), key=open(options.key, 'r').read(),
+      seed=options.seed)
+  print simulator.Run().Format()
+
+
+if __name__ == '__main__':
+  main()
@@ -18,7 +18,10 @@
 
 import httplib
 import logging
+import os
+import shutil
 import sys
+import tempfile
 
 
 from pyfakefs import fake_filesystem
@@ -709,11 +712,13 @@ class HttpsClientTest(basetest.TestCase):
       self.client.Do(method, url, body, headers, output_filename)
 
       inorder_calls.assert_has_calls([
-          mock.call.sleep(0), do_request_response_call,
-          mock.call.sleep(5), do_request_response_call])
+          do_request_response_call,
+          mock.call.sleep(mock.ANY), do_request_response_call])
+      self.assertEqual(1, mock_sleep.call_count)
 
+  @mock.patch.object(client.random, 'uniform', side_effect=lambda a, b: b)
   @mock.patch.object(client.time, 'sleep')
-  def testDoWithRetryHttp500(self, mock_sleep):
+  def testDoWithRetryHttp500(self, mock_sleep, _):
     """Test Do() with a HTTP 500, thus a retry."""
     method = 'GET'
     url = 'url'
@@ -737,15 +742,16 @@ class HttpsClientTest(basetest.TestCase):
 
     expected = []
     for i in xrange(0, client.DEFAULT_HTTP_ATTEMPTS):
-      expected += [
-          mock.call.sleep(i * 5),
-          mock.call._DoRequestResponse(
-              method, url, body=body, headers={},
-              output_file=output_file)]
+      if i:
+        expected.append(mock.call.sleep(
+            client.BACKOFF_BASE_SECS * 2 ** (i - 1)))
+      expected.append(mock.call._DoRequestResponse(
+          method, url, body=body, headers={}, output_file=output_file))
     inorder_calls.assert_has_calls(expected)
 
+  @mock.patch.object(client.random, 'uniform', side_effect=lambda a, b: b)
   @mock.patch.object(client.time, 'sleep')
-  def testDoWithRetryHttpError(self, mock_sleep):
+  def testDoWithRetryHttpError(self, mock_sleep, _):
     """Test Do() with a HTTP 500, thus a retry, but ending with HTTPError."""
     method = 'GET'
     url = 'url'
@@ -772,13 +778,78 @@ class HttpsClientTest(basetest.TestCase):
 
     expected = []
     for i in xrange(0, client.DEFAULT_HTTP_ATTEMPTS):
-      expected += [
-          mock.call.sleep(i * 5),
-          mock.call._DoRequestResponse(
-              method, url, body=body, headers={},
-              output_file=output_file)]
+      if i:
+        expected.append(mock.call.sleep(
+            client.BACKOFF_BASE_SECS * 2 ** (i - 1)))
+      expected.append(mock.call._DoRequestResponse(
+          method, url, body=body, headers={}, output_file=output_file))
     inorder_calls.assert_has_calls(expected)
 
+  @mock.patch.object(client.time, 'sleep')
+  def testDoWithRetryAfter(self, mock_sleep):
+    """Test Do() with a HTTP 503 with a Retry-After header."""
+    busy = client.Response(status=503, headers={'Retry-After': '30'})
+    ok = client.Response(status=200)
+
+    with mock.patch.object(
+        self.client, '_DoRequestResponse', side_effect=[busy, ok]):
+      self.assertEqual(ok, self.client.Do('GET', 'url'))
+
+    delay = mock_sleep.call_args[0][0]
+    self.assertTrue(30 <= delay <= 30 + client.BACKOFF_BASE_SECS)
+
+  @mock.patch.object(client.time, 'sleep')
+  def testDoWithRetryAfterTooLong(self, mock_sleep):
+    """Test Do() with a Retry-After longer than MAX_RETRY_AFTER_SECS."""
+    busy = client.Response(
+        status=429,
+        headers=[('retry-after', str(client.MAX_RETRY_AFTER_SECS + 1))])
+
+    with mock.patch.object(
+        self.client, '_DoRequestResponse', return_value=busy) as m:
+      self.assertEqual(busy, self.client.Do('GET', 'url'))
+
+    self.assertEqual(1, m.call_count)
+    self.assertFalse(mock_sleep.called)
+
+  @mock.patch.object(client.time, 'sleep')
+  def testDoWithRetryBudgetExhausted(self, mock_sleep):
+    """Test Do() stops retrying once the retry budget is used up."""
+    self.client._retry_budget = 2
+    error = client.Response(status=500)
+
+    with mock.patch.object(
+        self.client, '_DoRequestResponse', return_value=error) as m:
+      self.client.Do('GET', 'url')
+      self.assertEqual(3, m.call_count)
+      self.client.Do('GET', 'url')
+      self.assertEqual(4, m.call_count)
+
+    self.assertEqual(2, mock_sleep.call_count)
+
+  def testGetRetryDelayBackoff(self):
+    """Test _GetRetryDelay() caps the exponential backoff."""
+    with mock.patch.object(
+        client.random, 'uniform', side_effect=lambda a, b: b):
+      self.assertEqual(
+          [client.BACKOFF_BASE_SECS * 2 ** i for i in xrange(3)],
+          [self.client._GetRetryDelay(n, 100) for n in xrange(1, 4)])
+      self.assertEqual(
+          client.BACKOFF_MAX_SECS, self.client._GetRetryDelay(50, 100))
+    self.assertEqual(None, self.client._GetRetryDelay(4, 4))
+
+  def testGetRetryAfter(self):
+    """Test GetRetryAfter()."""
+    self.assertEqual(None, client.GetRetryAfter(None))
+    self.assertEqual(None, client.GetRetryAfter({'Retry-After': 'soon'}))
+    self.assertEqual(120, client.GetRetryAfter({'retry-after': ' 120'}))
+    self.assertEqual(
+        60, client.GetRetryAfter(
+            {'Retry-After': 'Thu, 01 Jan 1970 00:02:00 GMT'}, now=60))
+    self.assertEqual(
+        0, client.GetRetryAfter(
+            {'Retry-After': 'Thu, 01 Jan 1970 00:02:00 GMT'}, now=600))
+
   def testDoWithOutputFilename(self):
     """Test Do() where an output_filename is supplied."""
     method = 'GET'
@@ -1068,14 +1139,73 @@ class SimianClientTest(basetest.TestCase):
     name = 'name'
     self.GenericStubTest(
         self.client.GetCatalog, [name],
-        '_SimianRequest', 'GET', '/catalog/%s' % name)
+        '_ConditionalGet', '/catalogs/%s' % name)
 
   def testGetManifest(self):
     """Test GetManifest()."""
     name = 'name'
     self.GenericStubTest(
         self.client.GetManifest, [name],
-        '_SimianRequest', 'GET', '/manifest/%s' % name)
+        '_ConditionalGet', '/manifests/%s' % name)
+
+  def testConditionalGet(self):
+    """Test _ConditionalGet() revalidating a cached response."""
+    url = '/catalogs/stable'
+    responses = [
+        client.Response(
+            status=200, body='catalog',
+            headers=[('etag', '"abc"'), ('last-modified', 'lm')]),
+        client.Response(status=304),
+    ]
+
+    with mock.patch.object(
+        self.client, 'Do', side_effect=responses) as do_mock:
+      self.assertEqual('catalog', self.client._ConditionalGet(url))
+      self.assertEqual('catalog', self.client._ConditionalGet(url))
+
+    self.assertEqual(
+        [mock.call('GET', url, headers={}),
+         mock.call('GET', url, headers={
+             'If-None-Match': '"abc"', 'If-Modified-Since': 'lm'})],
+        do_mock.call_args_list)
+
+  def testConditionalGetWithoutValidators(self):
+    """Test _ConditionalGet() with a response that can't be revalidated."""
+    with mock.patch.object(
+        self.client, 'Do',
+        return_value=client.Response(status=200, body='body', headers={})):
+      self.assertEqual('body', self.client._ConditionalGet('/url'))
+    self.assertEqual({}, self.client._response_cache)
+
+  def testConditionalGetWithError(self):
+    """Test _ConditionalGet() with an error status returned."""
+    with mock.patch.object(
+        self.client, 'Do', return_value=client.Response(status=304)):
+      self.assertRaises(
+          client.SimianServerError, self.client._ConditionalGet, '/url')
+
+  def testResponseCacheOnDisk(self):
+    """Test _SaveCachedResponse() and _LoadCachedResponse() with a path."""
+    tmp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, tmp_dir)
+    self.client.response_cache_path = os.path.join(tmp_dir, 'cache')
+    cached = {'etag': '"abc"', 'last_modified': None, 'body': 'a\nb'}
+    self.client._SaveCachedResponse('/url', cached)
+
+    self.client._response_cache = {}
+    self.assertEqual(cached, self.client._LoadCachedResponse('/url'))
+    self.assertEqual(None, self.client._LoadCachedResponse('/other'))
+
+  def testResponseCacheWhenUntrusted(self):
+    """Test _LoadCachedResponse() with a cache file of another user."""
+    self.client.response_cache_path = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.client.response_cache_path)
+    self.client._SaveCachedResponse('/url', {'etag': 'x', 'body': ''})
+    self.client._response_cache = {}
+
+    with mock.patch.object(
+        client.os, 'geteuid', return_value=os.geteuid() + 1):
+      self.assertEqual(None, self.client._LoadCachedResponse('/url'))
 
   def testGetPackage(self):
     """Test GetPackage()."""
@@ -138,6 +138,8 @@ class AdminGroupsTest(test.AppengineTest):
 
     self.assertTrue(resp.location.endswith(redirect_url))
     self.assertIn('user7', models.Group.get_by_key_name('test group').users)
+    self.assertEqual(
+        ['test group'], models.Group.GetAllGroupNamesForUser('user7'))
 
   def testPostChangeRemove(self, render_mock, *unused_args):
     """Test post() change action, remove user."""
@@ -157,6 +159,10 @@ class AdminGroupsTest(test.AppengineTest):
 
     self.assertTrue(resp.location.endswith(redirect_url))
     self.assertNotIn('user4', models.Group.get_by_key_name('test group').users)
+    self.assertEqual([], models.Group.GetAllGroupNamesForUser('user4'))
+    self.assertEqual(
+        ['test group', 'test group2'],
+        models.Group.GetAllGroupNamesForUser('user1'))
 
   def testPostChangeNoGroup(self, render_mock, *unused_args):
     """Test post() change action, group doesn't exist."""
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""packages module tests."""
+
+import httplib
+
+import mock
+import webtest
+
+from google.apputils import basetest
+
+from simian.mac import admin
+from simian.mac import models
+from simian.mac.admin import main as gae_main
+from simian.mac.common import auth
+from tests.simian.mac.common import test
+
+
+PLIST = (
+    '<plist><dict><key>name</key><string>%(name)s</string>'
+    '<key>version</key><string>1.0</string>'
+    '<key>installer_item_hash</key><string>hash</string>'
+    '<key>installer_item_location</key><string>%(name)s.dmg</string>'
+    '<key>catalogs</key><array><string>unstable</string></array>'
+    '<key>installer_item_size</key><integer>2</integer>'
+    '<key>unattended_install</key><true/></dict></plist>')
+
+
+@mock.patch.object(auth, 'DoUserAuth')
+@mock.patch.object(auth, 'IsAdminUser', return_value=True)
+@mock.patch.object(auth, 'IsSupportUser', return_value=True)
+@mock.patch.object(auth, 'HasPermission', return_value=True)
+class PackagesTest(test.AppengineTest):
+
+  def setUp(self):
+    super(PackagesTest, self).setUp()
+    self.testapp = webtest.TestApp(gae_main.app)
+
+  def _PutPackage(self, name, catalogs):
+    models.PackageInfo(
+        key_name='%s.dmg' % name, filename='%s.dmg' % name, name=name,
+        catalogs=catalogs, _plist=PLIST % {'name': name}).put()
+
+  @mock.patch.object(admin.AdminHandler, 'Render')
+  def testDisplayPackagesList(self, render_mock, *_):
+    self._PutPackage('foo', ['unstable'])
+    self._PutPackage('bar', ['unstable', 'testing'])
+    self._PutPackage('untracked', [])
+    models.PackageInfoProposal(
+        key_name='foo.dmg', filename='foo.dmg',
+        catalogs=['unstable', 'testing']).put()
+
+    self.testapp.get('/admin/packages', status=httplib.OK)
+
+    args = test.GetArgFromCallHistory(render_mock, arg_index=1)
+    packages = args['packages']
+    self.assertEqual(
+        ['bar-1.0', 'foo-1.0'], [p['munki_name'] for p in packages])
+    self.assertEqual(2048, packages[0]['file_size'])
+    self.assertTrue(packages[0]['unattended'])
+    self.assertEqual(
+        models.PackageInfoProposal.get_by_key_name('foo.dmg').catalog_matrix,
+        packages[1]['catalogs'])
+
+
+def main(unused_argv):
+  basetest.main()
+
+
+if __name__ == '__main__':
+  basetest.main()
@@ -15,9 +15,19 @@
 # limitations under the License.
 #
 
+import datetime
+
+import mock
+import webtest
+
 from google.apputils import basetest
 
+from simian.mac import admin
+from simian.mac import models
+from simian.mac.admin import main as gae_main
 from simian.mac.admin import release_report
+from simian.mac.common import auth
+from tests.simian.mac.common import test
 
 
 class ReleaseReportModelTest(basetest.TestCase):
@@ -33,5 +43,89 @@ class ReleaseReportModelTest(basetest.TestCase):
     self.assertEqual(None, release_report.GetOSXMajorVersion(None))
 
 
+class ReleaseReportTest(test.AppengineTest):
+
+  def _LogPackage(self, filename, catalogs, mtime):
+    log = models.AdminPackageLog(
+        filename=filename, catalogs=catalogs, mtime=mtime)
+    log.put()
+
+  def _PutPackage(self, filename, catalogs):
+    plist = open(
+        'src/tests/simian/mac/common/testdata/testpackage.plist').read()
+    models.PackageInfo(
+        key_name=filename, filename=filename, _plist=plist,
+        catalogs=catalogs, manifests=catalogs,
+        install_types=['managed_installs']).put()
+
+  def testPackageReleaseHistory(self):
+    """Test AdminPackageLog.put() maintains PackageReleaseHistory."""
+    now = datetime.datetime.utcnow()
+    promoted = now - datetime.timedelta(days=1)
+    self._LogPackage('promoted', ['unstable'], now - datetime.timedelta(5))
+    self._LogPackage('promoted', ['unstable', 'stable'], promoted)
+    self._LogPackage('promoted', ['unstable', 'stable'], now)
+    self._LogPackage('uploaded_to_stable', ['stable'], now)
+    self._LogPackage('demoted', ['unstable', 'stable'], now)
+    self._LogPackage('demoted', ['unstable'], now)
+    models.AdminPackageProposalLog(
+        filename='proposal', catalogs=['stable']).put()
+
+    history = models.PackageReleaseHistory.get_by_key_name('promoted')
+    self.assertEqual(promoted, history.stable_since)
+    self.assertEqual(
+        None,
+        models.PackageReleaseHistory.get_by_key_name(
+            'uploaded_to_stable').stable_since)
+    self.assertEqual(
+        ['promoted'],
+        models.PackageReleaseHistory.GetPromotedSince(
+            now - datetime.timedelta(days=2)))
+    self.assertEqual(
+        [],
+        models.PackageReleaseHistory.GetPromotedSince(now))
+    self.assertEqual(
+        None, models.PackageReleaseHistory.get_by_key_name('proposal'))
+
+  def testPackageReleaseHistorySeededFromEarlierLogs(self):
+    """Test release history of packages logged before it was kept."""
+    now = datetime.datetime.utcnow()
+    with mock.patch.object(
+        models.AdminPackageLog, '_UPDATE_RELEASE_HISTORY', False):
+      self._LogPackage('promoted', ['unstable'], now - datetime.timedelta(5))
+      self._LogPackage('stable', ['stable'], now - datetime.timedelta(5))
+    self._LogPackage('promoted', ['unstable', 'stable'], now)
+    self._LogPackage('stable', ['unstable', 'stable'], now)
+
+    self.assertEqual(
+        now,
+        models.PackageReleaseHistory.get_by_key_name('promoted').stable_since)
+    self.assertEqual(
+        None,
+        models.PackageReleaseHistory.get_by_key_name('stable').stable_since)
+
+  @mock.patch.object(release_report, 'settings')
+  @mock.patch.object(auth, 'DoUserAuth')
+  @mock.patch.object(admin.AdminHandler, 'Render')
+  def testDisplayReleaseReport(self, render_mock, *_):
+    now = datetime.datetime.utcnow()
+    old = now - datetime.timedelta(days=30)
+    self._LogPackage('new', ['unstable'], old)
+    self._LogPackage('new', ['unstable', 'stable'], now)
+    self._PutPackage('new', ['unstable', 'stable'])
+    self._LogPackage('old', ['unstable'], old - datetime.timedelta(days=1))
+    self._LogPackage('old', ['unstable', 'stable'], old)
+    self._PutPackage('old', ['unstable', 'stable'])
+    self._LogPackage('reverted', ['unstable'], old)
+    self._LogPackage('reverted', ['unstable', 'stable'], now)
+    self._PutPackage('reverted', ['unstable'])
+
+    webtest.TestApp(gae_main.app).get('/admin/release_report')
+
+    args = test.GetArgFromCallHistory(render_mock, arg_index=1)
+    self.assertEqual(1, len(args['report_items']))
+    self.assertEqual('testpackage', args['report_items'][0]['package_name'])
+
+
 if __name__ == '__main__':
   basetest.main()
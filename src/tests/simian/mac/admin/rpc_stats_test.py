@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""rpc_stats admin module tests."""
+
+import httplib
+
+import mock
+import webtest
+
+from google.apputils import basetest
+
+from simian.mac import admin
+from simian.mac.admin import main as gae_main
+from simian.mac.common import auth
+from simian.mac.common import rpc_stats
+from tests.simian.mac.common import test
+
+
+@mock.patch.object(auth, 'DoUserAuth')
+class RpcStatsTest(test.AppengineTest):
+
+  def setUp(self):
+    super(RpcStatsTest, self).setUp()
+    self.testapp = webtest.TestApp(gae_main.app)
+
+  @mock.patch.object(admin.AdminHandler, 'IsAdminUser', return_value=True)
+  @mock.patch.object(admin.AdminHandler, 'Render')
+  def testGet(self, render_mock, *_):
+    """Test get() renders the stats of munki and API routes."""
+    with mock.patch.object(
+        rpc_stats, 'GetRouteStats', return_value=[]) as stats_mock:
+      self.testapp.get('/admin/rpc_stats')
+
+    routes = stats_mock.call_args[0][0]
+    self.assertIn('catalogs.Catalogs', routes)
+    self.assertIn('dynamic_manifest.DynamicManifest', routes)
+    args = test.GetArgFromCallHistory(render_mock, arg_index=1)
+    self.assertEqual('rpc_stats', args['report_type'])
+
+  @mock.patch.object(admin.AdminHandler, 'IsAdminUser', return_value=False)
+  def testGetNotAdmin(self, *_):
+    """Test get() for non-admin users."""
+    self.testapp.get('/admin/rpc_stats', status=httplib.FORBIDDEN)
+
+
+if __name__ == '__main__':
+  basetest.main()
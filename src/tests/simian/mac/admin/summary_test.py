@@ -20,6 +20,8 @@ import uuid
 import mock
 import stubout
 
+from google.appengine.api import memcache
+from google.appengine.ext import deferred
 from google.appengine.ext import testbed
 
 from google.apputils import app
@@ -90,15 +92,11 @@ class SummaryModuleTest(basetest.TestCase):
         connections_on_corp=0, connections_off_corp=100, uptime=90000.0,
         root_disk_free=0, user_disk_free=10, preflight_datetime=today).put()
 
-    reports_cache = models.ReportsCache()
-    trending = {
-        'success': {'packages': [('emacs', 10, 61.1)], 'total': 100},
-        'failure': {'packages': [('vim', 10, 61.1)], 'total': 50},
-        }
-
-    reports_cache.SetTrendingInstalls(1, trending)
-    trending['failure']['packages'].append(('office', 132, 99.9))
-    reports_cache.SetTrendingInstalls(24, trending)
+    models.InstallCountBucket.AddInstalls([
+        models.InstallLog(package='emacs', status='0'),
+        models.InstallLog(package='vim', status='1'),
+    ])
+    self._RunDeferredTasks()
 
   def tearDown(self):
     super(SummaryModuleTest, self).tearDown()
@@ -117,6 +115,161 @@ class SummaryModuleTest(basetest.TestCase):
     self.assertEqual(3, s['active'][14])
     self.assertAlmostEqual(98.0582, s['conns_off_corp_percent'], 3)
 
+  def _RunDeferredTasks(self):
+    taskqueue_stub = self.testbed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+    for task in taskqueue_stub.get_filtered_tasks():
+      deferred.run(task.payload)
+    taskqueue_stub.FlushQueue('default')
+    memcache.flush_all()
+
+  def testGetComputerSummaryFromCounters(self):
+    computers = models.Computer.all().filter('active =', True).fetch(500)
+    computer_summary = summary.GetComputerSummary(computers)
+    self._RunDeferredTasks()
+    counters, _ = models.ComputerSummaryShard.GetSummedCounters()
+    self.assertEqual(
+        summary.PrepareComputerSummaryForTemplate(computer_summary),
+        summary.PrepareComputerSummaryForTemplate(
+            summary.GetComputerSummaryFromCounters(counters)))
+
+  def testGetComputerSummaryFromCountersWindowsAreConsistent(self):
+    self._RunDeferredTasks()
+    counters, _ = models.ComputerSummaryShard.GetSummedCounters()
+    s = summary.GetComputerSummaryFromCounters(
+        counters, now=datetime.datetime.utcnow() + datetime.timedelta(days=3))
+    self.assertEqual(
+        [3, 3, 2, 0], [s['active'][days] for days in summary.ACTIVE_DAY_COUNTS])
+
+  def testSummaryCountersFollowComputerChanges(self):
+    c = models.Computer.all().filter('hostname =', 'xyz-macbook').get()
+    c.os_version = '10.12'
+    c.connections_off_corp += 1
+    c.put()
+    models.Computer.MarkInactive()
+    self._RunDeferredTasks()
+
+    counters, _ = models.ComputerSummaryShard.GetSummedCounters()
+    s = summary.GetComputerSummaryFromCounters(counters)
+    self.assertEqual({'10.11': 2, '10.12': 1}, s['os_versions'])
+    self.assertEqual(3, s['active'][30])
+    self.assertEqual(2, s['tracks']['stable'][30])
+
+  def testSummaryCountersNotChangedByConnections(self):
+    self._RunDeferredTasks()
+    c = models.Computer.all().filter('hostname =', 'xyz-macbook').get()
+    c.connections_off_corp += 1
+    c.preflight_datetime = datetime.datetime.utcnow()
+    with mock.patch.object(models.db, 'run_in_transaction') as txn:
+      c.put()
+    self.assertFalse(txn.called)
+
+    taskqueue_stub = self.testbed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+    self.assertEqual([], taskqueue_stub.get_filtered_tasks())
+
+  def testComputerPutWithStaleCopyAppliesDeltaOnce(self):
+    c1 = models.Computer.all().filter('hostname =', 'xyz-macbook').get()
+    c2 = models.Computer.get(c1.key())
+    c1.os_version = '10.12'
+    c1.put()
+    c2.os_version = '10.12'
+    c2.put()
+    self._RunDeferredTasks()
+
+    counters, _ = models.ComputerSummaryShard.GetSummedCounters()
+    self.assertEqual(1, counters['os|10.12'])
+    self.assertEqual(2, counters['os|10.11'])
+    self.assertNotIn('os|10.10', counters)
+
+  def testGetTrendingInstalls(self):
+    now = datetime.datetime(2017, 5, 1, 12, 30)
+    installs = []
+    for i in range(10):
+      installs.append(models.InstallLog(package='package1', status='0'))
+      installs.append(models.InstallLog(package='package1', status='1'))
+      installs.append(models.InstallLog(package='package2', status='-1'))
+      if i % 2:
+        installs.append(models.InstallLog(package='package3', status='-1'))
+        installs.append(models.InstallLog(package='package4', status='0'))
+    models.InstallCountBucket.AddInstalls(installs[:20], now=now)
+    models.InstallCountBucket.AddInstalls(
+        installs[20:], now=now - datetime.timedelta(minutes=20))
+    # outside of the 1 hour window.
+    models.InstallCountBucket.AddInstalls(
+        [models.InstallLog(package='package5', status='0')],
+        now=now - datetime.timedelta(hours=3))
+    self._RunDeferredTasks()
+
+    expected_trending = {
+        'success': {
+            'packages': [
+                ('package1', 10, 66.666666666666657),
+                ('package4', 5, 33.333333333333329),
+            ],
+            'total': 15,
+        },
+        'failure': {
+            'packages': [
+                ('package2', 10, 40.0),
+                ('package1', 10, 40.0),
+                ('package3', 5, 20.0),
+            ],
+            'total': 25,
+        },
+    }
+    self.assertEqual(
+        expected_trending, summary.GetTrendingInstalls(1, now=now))
+
+    trending = summary.GetTrendingInstalls(4, now=now)
+    self.assertEqual(16, trending['success']['total'])
+    self.assertEqual(
+        ('package5', 1, 6.25), trending['success']['packages'][-1])
+
+  def testGetTrendingInstallsFromRollups(self):
+    now = datetime.datetime(2017, 5, 3, 12, 30)
+    for hours_ago in [1, 20, 30, 40, 60]:
+      models.InstallCountBucket.AddInstalls(
+          [models.InstallLog(package='package1', status='0')],
+          now=now - datetime.timedelta(hours=hours_ago))
+    self._RunDeferredTasks()
+    models.InstallCountBucket.Rollup(now=now)
+
+    # 2017-05-02 is a closed day within the 48 hour lookback.
+    self.assertTrue(models.InstallCountBucket.get_by_key_name('2017-05-02_day'))
+    self.assertFalse(
+        models.InstallCountBucket.get_by_key_name('2017-05-03_day'))
+    self.assertEqual(
+        4, summary.GetTrendingInstalls(48, now=now)['success']['total'])
+
+    # a late update for a rolled up hour lands in its rollups.
+    models.InstallCountBucket.Add(
+        datetime.datetime(2017, 5, 2, 4), {'success': {'package2': 1}})
+    memcache.flush_all()
+    trending = summary.GetTrendingInstalls(48, now=now)
+    self.assertEqual(5, trending['success']['total'])
+    self.assertEqual(
+        ('package2', 1, 20.0), trending['success']['packages'][-1])
+    self.assertEqual(
+        1, summary.GetTrendingInstalls(2, now=now)['success']['total'])
+
+  @mock.patch.object(auth, 'IsGroupMember', return_value=False)
+  @mock.patch.object(auth, 'IsAdminUser', return_value=True)
+  @mock.patch.object(summary.Summary, 'Render')
+  @mock.patch.dict(summary.settings.__dict__, {'CLIENT_SITE_ENABLED': False})
+  def testCachedSummaryTrendingInstalls(self, render, *_):
+    resp = gae_main.app.get_response('/admin/')
+    self.assertEqual(httplib.OK, resp.status_int)
+    params = test.GetArgFromCallHistory(render, arg_index=1)
+    self.assertEqual(
+        summary.TRENDING_INSTALLS_HOURS,
+        [hours for hours, _ in params['trending_installs']])
+    self.assertEqual(
+        [('emacs', 1, 100.0)],
+        params['trending_installs'][0][1]['success']['packages'])
+
+    gae_main.app.get_response('/admin/?trending-hours=12')
+    params = test.GetArgFromCallHistory(render, call_index=1, arg_index=1)
+    self.assertEqual([12], [hours for hours, _ in params['trending_installs']])
+
   @mock.patch.dict(summary.settings.__dict__, {
       'ALLOW_SELF_REPORT': False, 'AUTH_DOMAIN': 'example.com'})
   @mock.patch.object(auth, 'IsGroupMember', return_value=False)
@@ -165,6 +318,61 @@ class SummaryModuleTest(basetest.TestCase):
 
     self.assertTrue('/admin/host/' in resp.headers['Location'])
 
+  @mock.patch.object(auth, 'IsGroupMember', return_value=False)
+  @mock.patch.object(auth, 'IsAdminUser', return_value=True)
+  @mock.patch.object(summary.Summary, 'Render')
+  @mock.patch.dict(summary.settings.__dict__, {'CLIENT_SITE_ENABLED': False})
+  def testPartialOwnerSearch(self, render, *_):
+    resp = gae_main.app.get_response(
+        '/admin/?filter-type=owner&filter=zero&include-inactive=1')
+    self.assertEqual(httplib.OK, resp.status_int)
+
+    params = test.GetArgFromCallHistory(render, arg_index=1)
+    self.assertEqual(3, len(params['computers']))
+    self.assertEqual(3, params['results_found'])
+    facets = dict(params['facets'])
+    self.assertItemsEqual([('MTV', 3)], facets['site'])
+    self.assertItemsEqual([('stable', 2), ('unstable', 1)], facets['track'])
+
+  @mock.patch.object(auth, 'IsGroupMember', return_value=False)
+  @mock.patch.object(auth, 'IsAdminUser', return_value=True)
+  @mock.patch.object(summary.Summary, 'Render')
+  @mock.patch.dict(summary.settings.__dict__, {'CLIENT_SITE_ENABLED': False})
+  def testAnySearch(self, render, *_):
+    resp = gae_main.app.get_response('/admin/?filter-type=any&filter=host')
+    self.assertEqual(httplib.OK, resp.status_int)
+    params = test.GetArgFromCallHistory(render, arg_index=1)
+    # host2 is inactive.
+    self.assertItemsEqual(
+        ['host1', 'host10'], [c.hostname for c in params['computers']])
+
+  def testComputerSearchPaging(self):
+    keys, cursor, found, _ = models.computer_search.Search(
+        None, 'zerocool', include_inactive=True, limit=2)
+    self.assertEqual(3, found)
+    self.assertEqual(2, len(keys))
+    more_keys, cursor, _, _ = models.computer_search.Search(
+        None, 'zerocool', include_inactive=True, limit=2, cursor=cursor)
+    self.assertEqual(1, len(more_keys))
+    self.assertEqual(None, cursor)
+    self.assertFalse(set(keys) & set(more_keys))
+
+  def testComputerSearchFollowsComputerChanges(self):
+    computer = models.Computer.all().filter('hostname =', 'xyz-macbook').get()
+    computer.serial = 'C02ABC123XYZ'
+    computer.put()
+
+    keys, _, found, _ = models.computer_search.Search('serial', '123x')
+    self.assertEqual(1, found)
+    self.assertEqual([str(computer.key())], keys)
+
+    computer.preflight_datetime = datetime.datetime(2000, 1, 1)
+    computer.put()
+    self.assertEqual(
+        0, models.computer_search.Search('serial', '123x')[2])
+    self.assertEqual(1, models.computer_search.Search(
+        'serial', '123x', include_inactive=True)[2])
+
   @mock.patch.object(auth, 'IsGroupMember', return_value=False)
   @mock.patch.dict(summary.settings.__dict__, {
       'ALLOW_SELF_REPORT': True, 'AUTH_DOMAIN': 'example.com'})
@@ -88,6 +88,81 @@ class TagsModuleTest(test.AppengineTest):
     self.assertEqual(1, len(tags))
     self.assertEqual(1, len(tags[0].keys))
     self.assertEqual(uuid, tags[0].keys[0].name())
+    self.assertEqual(
+        [tagname], models.Tag.GetAllTagNamesForEntity(models.Computer(
+            key_name=uuid)))
+
+    self.testapp.post(
+        '/admin/tags',
+        {'action': 'change', 'tag': tagname, 'add': 0, 'uuid': uuid},
+        status=httplib.FOUND)
+    self.assertEqual(
+        [], models.Tag.GetAllTagNamesForKey(
+            models.db.Key.from_path('Computer', uuid)))
+
+  @mock.patch.object(auth, 'IsAdminUser', return_value=True)
+  @mock.patch.object(xsrf, 'XsrfTokenValidate', return_value=True)
+  def testDeleteTagUpdatesMembership(self, *_):
+    key = models.db.Key.from_path('Computer', 'id1')
+    models.Tag(key_name='t1', keys=[key]).put()
+    models.Tag(key_name='t2', keys=[key]).put()
+    self.assertEqual(['t1', 't2'], models.Tag.GetAllTagNamesForKey(key))
+
+    self.testapp.post(
+        '/admin/tags', {'action': 'delete', 'tag': 't1'},
+        status=httplib.FOUND)
+    self.assertEqual(['t2'], models.Tag.GetAllTagNamesForKey(key))
+
+  def testGetAllTagNamesForKeyWithoutMembership(self):
+    key = models.db.Key.from_path('Computer', 'id1')
+    models.Tag(key_name='t1', keys=[key]).put()
+    models.TagMembership.get_by_key_name(str(key)).delete()
+
+    self.assertEqual(['t1'], models.Tag.GetAllTagNamesForKey(key))
+    self.assertEqual(
+        ['t1'], models.TagMembership.get_by_key_name(str(key)).names)
+
+  def testPutTagWithoutMembership(self):
+    key = models.db.Key.from_path('Computer', 'id1')
+    models.Tag(key_name='t1', keys=[key]).put()
+    models.TagMembership.get_by_key_name(str(key)).delete()
+
+    models.Tag(key_name='t2', keys=[key]).put()
+    self.assertEqual(['t1', 't2'], models.Tag.GetAllTagNamesForKey(key))
+
+  def testPutTagOnlyUpdatesItsName(self):
+    key = models.db.Key.from_path('Computer', 'id1')
+    models.Tag(key_name='t1', keys=[key]).put()
+    # an index written by a concurrent update of another tag is kept.
+    models.TagMembership(key_name=str(key), names=['other', 't1']).put()
+
+    models.Tag(key_name='t2', keys=[key]).put()
+    self.assertEqual(
+        ['other', 't1', 't2'], models.Tag.GetAllTagNamesForKey(key))
+    models.Tag(key_name='t1', keys=[]).put()
+    self.assertEqual(['other', 't2'], models.Tag.GetAllTagNamesForKey(key))
+
+  def testPutTagEnqueuesMembershipUpdate(self):
+    key = models.db.Key.from_path('Computer', 'id1')
+    models.Tag(key_name='t1', keys=[key]).put()
+    models.TagMembership.get_by_key_name(str(key)).delete()
+    models.TagMembership(key_name=str(key), names=[]).put()
+
+    self.RunAllDeferredTasks()
+    self.RunAllDeferredTasks()
+    self.assertEqual(['t1'], models.Tag.GetAllTagNamesForKey(key))
+
+  def testPutTagWithManyMembersDefersMembership(self):
+    keys = [models.db.Key.from_path('Computer', 'id%d' % i)
+            for i in xrange(models.TagMembership.INLINE_UPDATES + 1)]
+    models.Tag(key_name='t1', keys=keys).put()
+    self.assertEqual(None, models.TagMembership.get_by_key_name(str(keys[0])))
+
+    self.RunAllDeferredTasks()
+    self.RunAllDeferredTasks()
+    for key in keys:
+      self.assertEqual(
+          ['t1'], models.TagMembership.get_by_key_name(str(key)).names)
 
   @mock.patch.object(auth, 'IsAdminUser', return_value=True)
   @mock.patch.object(xsrf, 'XsrfTokenValidate', return_value=False)
@@ -17,6 +17,7 @@
 """Munki dynamic_manifest module tests."""
 
 import httplib
+import json
 import logging
 import urllib
 
@@ -41,7 +42,9 @@ class DynamicManifestHandlersTest(test.RequestHandlerTest):
 
   def tearDown(self):
     super(DynamicManifestHandlersTest, self).tearDown()
-    dyn_man.models.MANIFEST_MOD_MODELS = self._original_mod_models
+    # restore in place, as models.base holds a reference to the same dict.
+    dyn_man.models.MANIFEST_MOD_MODELS.clear()
+    dyn_man.models.MANIFEST_MOD_MODELS.update(self._original_mod_models)
 
   def GetTestClassInstance(self):
     return dyn_man.DynamicManifest()
@@ -440,6 +443,106 @@ class NewDynamicManifestHandlersTest(test.AppengineTest):
     self.assertEqual([], mod.manifests)
     self.assertEqual(install_types, mod.install_types)
 
+  @mock.patch.object(auth, 'IsAdminUser', return_value=True)
+  def testBulkPost(self, *_):
+    testapp = webtest.TestApp(gae_main.app)
+    models.BaseManifestModification.GenerateInstance(
+        'uuid', 'uuid3', 'OldPkg', install_types=['managed_installs']).put()
+    # cache the current mods, to check the cache is reset.
+    self.assertEqual(
+        1, len(models.UuidManifestModification.MemcacheWrappedGetAllFilter(
+            (('uuid =', 'uuid3'),))))
+
+    mods = [
+        {'mod_type': 'uuid', 'target': 'uuid%d' % i, 'pkg_name': 'FooPkg',
+         'install_types': ['managed_installs'], 'manifests': ['stable']}
+        for i in range(3)]
+    mods.append({'action': 'delete', 'mod_type': 'uuid', 'target': 'uuid3',
+                 'pkg_name': 'OldPkg'})
+    mods.append({'mod_type': 'owner', 'target': 'foouser',
+                 'pkg_name': 'FooPkg', 'install_types': ['optional_installs'],
+                 'manifests': ['stable']})
+
+    dyn_man.settings.API_INFO_KEY = 'key'
+    resp = testapp.post(
+        '/api/dynamic_manifest/bulk', json.dumps({'mods': mods}),
+        headers={'X-Simian-API-Info-Key': 'key'})
+
+    self.assertEqual(
+        {'put': 4, 'deleted': 1, 'mutate': True}, json.loads(resp.body))
+    uuid_mods = models.UuidManifestModification.all().fetch(None)
+    self.assertItemsEqual(
+        ['uuid0', 'uuid1', 'uuid2'], [m.target for m in uuid_mods])
+    for m in uuid_mods:
+      self.assertEqual('FooPkg', m.value)
+      self.assertEqual(['stable'], m.manifests)
+    owner_mod = models.OwnerManifestModification.all().get()
+    self.assertEqual([], owner_mod.manifests)
+    self.assertEqual(
+        [], models.UuidManifestModification.MemcacheWrappedGetAllFilter(
+            (('uuid =', 'uuid3'),)))
+
+  @mock.patch.object(auth, 'IsAdminUser', return_value=True)
+  def testBulkPostInvalidMod(self, *_):
+    testapp = webtest.TestApp(gae_main.app)
+    mods = [
+        {'mod_type': 'uuid', 'target': 'uuid0', 'pkg_name': 'FooPkg',
+         'install_types': ['managed_installs']},
+        {'mod_type': 'crazytype', 'target': 'foo', 'pkg_name': 'FooPkg',
+         'install_types': ['managed_installs']},
+    ]
+
+    dyn_man.settings.API_INFO_KEY = 'key'
+    resp = testapp.post(
+        '/api/dynamic_manifest/bulk', json.dumps({'mods': mods}),
+        headers={'X-Simian-API-Info-Key': 'key'}, status=httplib.BAD_REQUEST)
+
+    self.assertIn('mod 1: invalid mod_type', resp.body)
+    self.assertEqual(0, models.UuidManifestModification.all().count())
+
+  @mock.patch.object(auth, 'IsAdminUser', return_value=True)
+  def testBulkPostInvalidValueTypes(self, *_):
+    testapp = webtest.TestApp(gae_main.app)
+    valid = {'mod_type': 'uuid', 'target': 'uuid0', 'pkg_name': 'FooPkg',
+             'install_types': ['managed_installs']}
+    invalid = [
+        ({'target': ['uuid0']}, 'target string is required'),
+        ({'pkg_name': 1}, 'must be strings'),
+        ({'pkg_alias': {}}, 'must be strings'),
+        ({'install_types': [1]}, 'install_types list is required'),
+        ({'manifests': 'stable'}, 'manifests must be a list of strings'),
+        ({'target': 'uuid0\nuuid1'}, 'multi-line'),
+    ]
+
+    dyn_man.settings.API_INFO_KEY = 'key'
+    for change, error in invalid:
+      mod = dict(valid)
+      mod.update(change)
+      resp = testapp.post(
+          '/api/dynamic_manifest/bulk', json.dumps({'mods': [valid, mod]}),
+          headers={'X-Simian-API-Info-Key': 'key'},
+          status=httplib.BAD_REQUEST)
+      self.assertIn('mod 1: ', resp.body)
+      self.assertIn(error, resp.body)
+    self.assertEqual(0, models.UuidManifestModification.all().count())
+
+  @mock.patch.object(auth, 'IsAdminUser', return_value=True)
+  def testBulkPostWithoutMutate(self, *_):
+    testapp = webtest.TestApp(gae_main.app)
+    mods = [
+        {'mod_type': 'uuid', 'target': 'uuid0', 'pkg_name': 'FooPkg',
+         'install_types': ['managed_installs']},
+    ]
+
+    dyn_man.settings.API_INFO_KEY = 'key'
+    resp = testapp.post(
+        '/api/dynamic_manifest/bulk?mutate=false', json.dumps({'mods': mods}),
+        headers={'X-Simian-API-Info-Key': 'key'})
+
+    self.assertEqual(
+        {'put': 1, 'deleted': 0, 'mutate': False}, json.loads(resp.body))
+    self.assertEqual(0, models.UuidManifestModification.all().count())
+
 
 logging.basicConfig(filename='/dev/null')
 
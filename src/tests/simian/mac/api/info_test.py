@@ -16,25 +16,62 @@
 #
 """info module tests."""
 
-import mox
-import stubout
+import datetime
+import unittest
+
+import mock
+import webapp2
 
 from google.apputils import app
 from google.apputils import basetest
 from simian.mac.api import info
+from tests.simian.mac.common import test
 
 
-class InfoModuleTest(mox.MoxTestBase):
+class InfoHandlerTest(test.AppengineTest):
 
   def setUp(self):
-    mox.MoxTestBase.setUp(self)
-    self.stubs = stubout.StubOutForTesting()
+    super(InfoHandlerTest, self).setUp()
+    self.c = info.InfoHandler(webapp2.Request.blank('/'), webapp2.Response())
+
+  @mock.patch.object(info.InfoHandler, '_GetAppleSusPromoCalendar')
+  @mock.patch.object(info.applesus, 'GetAppleSUSPromotionSchedule')
+  def testDisplayAppleSusPromoCalendarRendersOncePerVersion(
+      self, schedule_mock, render_mock):
+    """Test _DisplayAppleSusPromoCalendar() caches the rendered feed."""
+    schedule_mock.return_value = {'version': 'v1', 'products': {}}
+    render_mock.return_value = 'cal1'
+
+    self.c._DisplayAppleSusPromoCalendar()
+    self.c._DisplayAppleSusPromoCalendar()
+    self.assertEqual(1, render_mock.call_count)
+    self.assertEqual('cal1cal1', self.c.response.body)
+
+    schedule_mock.return_value = {'version': 'v2', 'products': {}}
+    render_mock.return_value = 'cal2'
+    self.c._DisplayAppleSusPromoCalendar()
+    self.assertEqual(2, render_mock.call_count)
+    self.assertEqual('text/calendar', self.c.response.headers['Content-Type'])
+
+  @unittest.skipIf(info.icalendar is None, 'icalendar is not installed.')
+  def testGetAppleSusPromoCalendar(self):
+    """Test _GetAppleSusPromoCalendar()."""
+    now = datetime.date(2016, 9, 12)
+    products = {
+        'pid1': {'name': 'Foo', 'version': '1', 'stable': now,
+                 'testing': datetime.date(2016, 9, 10)},
+        'pid2': {'name': 'Bar', 'version': '2',
+                 'testing': datetime.date(2016, 9, 13)},
+    }
 
-  def tearDown(self):
-    self.mox.UnsetStubs()
-    self.stubs.UnsetAll()
+    cal = self.c._GetAppleSusPromoCalendar(products, now)
 
-# TODO(user): Add tests for info.InfoHandler class.
+    self.assertEqual(2, cal.count('BEGIN:VEVENT'))
+    self.assertIn('20160912-simian-applesus', cal)
+    self.assertIn('20160913-simian-applesus', cal)
+    self.assertNotIn('20160910-simian-applesus', cal)
+    self.assertIn('Foo 1 (pid1)', cal)
+    self.assertIn('Bar 2 (pid2)', cal)
 
 
 def main(unused_argv):
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Packages API module tests."""
+
+import datetime
+import httplib
+import json
+
+import mock
+import webtest
+
+from google.apputils import app
+from google.apputils import basetest
+
+from simian.mac import models
+from simian.mac.api import packages
+from simian.mac.api import urls as gae_main
+from tests.simian.mac.common import test
+
+
+PLIST = (
+    '<plist><dict><key>name</key><string>%(name)s</string>'
+    '<key>version</key><string>1.0</string>'
+    '<key>installer_item_hash</key><string>hash</string>'
+    '<key>installer_item_location</key><string>%(name)s.dmg</string>'
+    '<key>catalogs</key><array><string>unstable</string></array>'
+    '</dict></plist>')
+
+
+@mock.patch.object(packages, 'API_INFO_KEY', 'apikey')
+class PackagesAPITest(test.AppengineTest):
+
+  def setUp(self):
+    super(PackagesAPITest, self).setUp()
+    self.testapp = webtest.TestApp(gae_main.app)
+    self.mtime = datetime.datetime(2017, 1, 1, 10, 0, 0, 500)
+    for i in range(5):
+      name = 'pkg%d' % i
+      p = models.PackageInfo(
+          key_name='%s.dmg' % name, filename='%s.dmg' % name, name=name,
+          catalogs=['unstable'], _plist=PLIST % {'name': name},
+          mtime=self.mtime + datetime.timedelta(hours=i))
+      p.put(avoid_mtime_update=True)
+
+  def testGet(self):
+    resp = self.testapp.get('/api/packages', {'key': 'apikey'})
+
+    output = json.loads(resp.body)
+    self.assertEqual(5, len(output))
+    self.assertEqual('pkg0-1.0', output['pkg0.dmg']['munki_name'])
+    self.assertTrue(output['pkg0.dmg']['uninstallable'])
+    self.assertEqual(None, output['pkg0.dmg']['display_name'])
+    self.assertEqual(
+        'Sun, 01 Jan 2017 14:00:00 GMT', resp.headers['Last-Modified'])
+    self.assertNotIn('X-Simian-Next-Cursor', resp.headers)
+
+  def testGetUnauthorized(self):
+    self.testapp.get(
+        '/api/packages', {'key': 'wrong'}, status=httplib.UNAUTHORIZED)
+
+  def testGetPaged(self):
+    """Test get() with limit, following cursors until all are returned."""
+    params = {'key': 'apikey', 'limit': 2}
+    filenames = []
+    for _ in range(3):
+      resp = self.testapp.get('/api/packages', params)
+      filenames.extend(sorted(json.loads(resp.body)))
+      params['cursor'] = resp.headers.get('X-Simian-Next-Cursor')
+      if not params['cursor']:
+        break
+
+    self.assertEqual(['pkg%d.dmg' % i for i in range(5)], filenames)
+
+  def testGetSince(self):
+    since = (self.mtime + datetime.timedelta(hours=2)).isoformat()
+    resp = self.testapp.get('/api/packages', {'key': 'apikey', 'since': since})
+
+    self.assertEqual(['pkg3.dmg', 'pkg4.dmg'], sorted(json.loads(resp.body)))
+
+  def testGetIfModifiedSince(self):
+    resp = self.testapp.get('/api/packages', {'key': 'apikey'})
+    headers = {'If-Modified-Since': resp.headers['Last-Modified']}
+
+    self.testapp.get(
+        '/api/packages', {'key': 'apikey'}, headers=headers,
+        status=httplib.NOT_MODIFIED)
+
+    models.PackageInfo.get_by_key_name('pkg1.dmg').put()
+    resp = self.testapp.get(
+        '/api/packages', {'key': 'apikey'}, headers=headers)
+    self.assertEqual(['pkg1.dmg'], json.loads(resp.body).keys())
+
+  def testGetInvalidParams(self):
+    for params in ({'since': 'yesterday'}, {'limit': 'x'}, {'limit': 0},
+                   {'cursor': 'bogus'}):
+      params['key'] = 'apikey'
+      self.testapp.get('/api/packages', params, status=httplib.BAD_REQUEST)
+
+
+def main(unused_argv):
+  basetest.main()
+
+
+if __name__ == '__main__':
+  app.run()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""admission module tests."""
+
+import httplib
+
+import mock
+import webtest
+
+from google.apputils import app
+from google.apputils import basetest
+
+from simian.mac import models
+from simian.mac.common import admission
+from simian.mac.common import auth
+from simian.mac.munki import handlers
+from tests.simian.mac.common import test
+from simian.mac.urls import app as gae_app
+
+
+class AdmissionTest(test.AppengineTest):
+
+  def setUp(self):
+    super(AdmissionTest, self).setUp()
+    admission._running.clear()
+    budgets = dict(admission.DEFAULT_BUDGETS)
+    budgets.update({'slow': (1, 0), 'busy': (0, 2)})
+    patcher = mock.patch.object(admission, '_budgets', [1e12, budgets])
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def testParseBudgets(self):
+    """Test ParseBudgets()."""
+    budgets = admission.ParseBudgets(' reports=3/40, bad, auth=x/1,new=0/5')
+    self.assertEqual((3, 40), budgets['reports'])
+    self.assertEqual(admission.DEFAULT_BUDGETS['auth'], budgets['auth'])
+    self.assertEqual((0, 5), budgets['new'])
+    self.assertEqual(admission.DEFAULT_BUDGETS, admission.ParseBudgets(None))
+
+  def testGetBudgets(self):
+    """Test GetBudgets() re-reads settings after BUDGETS_CACHE_SECS."""
+    admission._budgets[:] = [0, {}]
+    with mock.patch.object(admission, 'settings') as settings:
+      settings.ADMISSION_BUDGETS = 'reports=5/0'
+      self.assertEqual((5, 0), admission.GetBudgets(now=1000)['reports'])
+      settings.ADMISSION_BUDGETS = 'reports=6/0'
+      self.assertEqual((5, 0), admission.GetBudgets(now=1001)['reports'])
+      self.assertEqual(
+          (6, 0), admission.GetBudgets(
+              now=1000 + admission.BUDGETS_CACHE_SECS)['reports'])
+
+  def testAdmitConcurrent(self):
+    """Test Admit() with a concurrency budget."""
+    self.assertTrue(admission.Admit('slow'))
+    self.assertFalse(admission.Admit('slow'))
+    admission.Release('slow')
+    self.assertTrue(admission.Admit('slow'))
+
+  def testAdmitRate(self):
+    """Test Admit() with a per second budget."""
+    results = [admission.Admit('busy', now=100) for _ in range(3)]
+    self.assertEqual([True, True, False], results)
+    self.assertEqual(2, admission._running['busy'])
+    self.assertTrue(admission.Admit('busy', now=101))
+
+  def testAdmitUnknownEndpoint(self):
+    """Test Admit() of an endpoint without a budget."""
+    for _ in range(10):
+      self.assertTrue(admission.Admit('other'))
+
+  def testDefaultBudgetsUnlimited(self):
+    """Test admission control is opt-in."""
+    for budget in admission.ParseBudgets('').itervalues():
+      self.assertEqual((0, 0), budget)
+
+
+@mock.patch.object(auth, 'DoAnyAuth')
+class AdmissionHandlerTest(test.AppengineTest):
+
+  def setUp(self):
+    super(AdmissionHandlerTest, self).setUp()
+    self.testapp = webtest.TestApp(gae_app)
+    admission._running.clear()
+    self.addCleanup(admission._running.clear)
+    models.Catalog(key_name='stable', _plist='<plist/>').put()
+    self.mtime = models.Catalog.get_by_key_name('stable').mtime
+
+  def testOverBudget(self, *_):
+    """Test a rejected request gets a 503 with a Retry-After."""
+    with mock.patch.object(admission, 'Admit', return_value=False):
+      resp = self.testapp.get(
+          '/catalogs/stable', status=httplib.SERVICE_UNAVAILABLE)
+    retry_after = int(resp.headers['Retry-After'])
+    self.assertTrue(
+        admission.RETRY_AFTER_MIN_SECS <= retry_after <=
+        admission.RETRY_AFTER_MAX_SECS)
+    self.assertEqual('', resp.body)
+
+  def testAdmitted(self, *_):
+    """Test an admitted request is released once it completes."""
+    with mock.patch.object(admission, 'GetBudgets', return_value={
+        'catalogs': (1, 0)}):
+      self.testapp.get('/catalogs/stable', status=httplib.OK)
+      self.testapp.get('/catalogs/stable', status=httplib.OK)
+    self.assertEqual(0, admission._running['catalogs'])
+
+  def testNotModifiedWhenBusy(self, *_):
+    """Test a conditional request is served while the endpoint is busy."""
+    admission._running['catalogs'] = 1
+    with mock.patch.object(admission, 'GetBudgets', return_value={
+        'catalogs': (1, 0)}):
+      self.testapp.get('/catalogs/stable', status=httplib.SERVICE_UNAVAILABLE)
+      self.testapp.get(
+          '/catalogs/stable',
+          headers={'If-Modified-Since': self.mtime.strftime(
+              handlers.HEADER_DATE_FORMAT)},
+          status=httplib.NOT_MODIFIED)
+      # a stale or dummy validator doesn't bypass the budget.
+      self.testapp.get(
+          '/catalogs/stable', headers={'If-Modified-Since': 'dummy'},
+          status=httplib.SERVICE_UNAVAILABLE)
+    self.assertEqual(1, admission._running['catalogs'])
+
+  def testConditionalRequestNotAdmittedWithoutCheapValidator(self, *_):
+    """Test conditional requests are budgeted on endpoints without a 304."""
+    admission._running['manifests'] = 1
+    with mock.patch.object(admission, 'GetBudgets', return_value={
+        'manifests': (1, 0)}):
+      self.testapp.get(
+          '/manifests/stable', headers={'If-None-Match': '"abc"'},
+          status=httplib.SERVICE_UNAVAILABLE)
+
+
+def main(unused_argv):
+  basetest.main()
+
+
+if __name__ == '__main__':
+  app.run()
@@ -217,6 +217,59 @@ class AppleModuleTest(mox.MoxTestBase, test.AppengineTest):
     self.assertEqual(d, None)
     self.mox.VerifyAll()
 
+  def testGenerateAppleSUSPromotionSchedule(self):
+    """Test GenerateAppleSUSPromotionSchedule()."""
+    models = applesus.models
+    models.AppleSUSProduct(
+        key_name='unstable', product_id='unstable', name='U', version='1',
+        tracks=[applesus.common.UNSTABLE]).put()
+    models.AppleSUSProduct(
+        key_name='testing', product_id='testing', name='T', version='2',
+        tracks=[applesus.common.UNSTABLE, applesus.common.TESTING]).put()
+    models.AppleSUSProduct(
+        key_name='override', product_id='override', manual_override=True,
+        tracks=[applesus.common.UNSTABLE]).put()
+    models.AppleSUSProduct(
+        key_name='deprecated', product_id='deprecated', deprecated=True,
+        tracks=[applesus.common.UNSTABLE]).put()
+
+    self.mox.ReplayAll()
+    stored = applesus.GenerateAppleSUSPromotionSchedule()
+    schedule = applesus.GetAppleSUSPromotionSchedule()
+    self.mox.VerifyAll()
+
+    self.assertEqual(stored['version'], schedule['version'])
+    products = schedule['products']
+    self.assertEqual(set(['unstable', 'testing']), set(products))
+    unstable = models.AppleSUSProduct.get_by_key_name('unstable')
+    self.assertEqual(
+        applesus.GetAutoPromoteDate(applesus.common.TESTING, unstable),
+        products['unstable'][applesus.common.TESTING])
+    self.assertEqual(
+        applesus.GetAutoPromoteDate(applesus.common.STABLE, unstable),
+        products['unstable'][applesus.common.STABLE])
+    self.assertNotIn(applesus.common.TESTING, products['testing'])
+    self.assertEqual('T', products['testing']['name'])
+
+    # regenerating an unchanged schedule keeps the same version.
+    self.assertEqual(
+        stored['version'],
+        applesus.GenerateAppleSUSPromotionSchedule()['version'])
+
+  def testGetAppleSUSPromotionScheduleGeneratesWhenMissing(self):
+    """Test GetAppleSUSPromotionSchedule() with no stored schedule."""
+    self.mox.StubOutWithMock(applesus, 'GenerateAppleSUSPromotionSchedule')
+    applesus.GenerateAppleSUSPromotionSchedule().AndReturn(
+        {'version': 'v', 'products': {'pid': {'testing': '2011-07-26'}}})
+
+    self.mox.ReplayAll()
+    schedule = applesus.GetAppleSUSPromotionSchedule()
+    self.mox.VerifyAll()
+
+    self.assertEqual(
+        datetime.date(2011, 7, 26),
+        schedule['products']['pid'][applesus.common.TESTING])
+
   def testGetNextWeekdayDate(self):
     """Tests GetNextWeekdayDate().
 
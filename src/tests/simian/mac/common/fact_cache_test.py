@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""fact_cache module tests."""
+
+import os
+import shutil
+import tempfile
+
+import mock
+
+from google.apputils import app
+from google.apputils import basetest
+from simian.mac.common import fact_cache
+
+
+class FactCacheTest(basetest.TestCase):
+
+  def setUp(self):
+    super(FactCacheTest, self).setUp()
+    self.tmp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tmp_dir)
+    self.path = os.path.join(self.tmp_dir, 'fact_cache.json')
+    self.triggers = {'boot': 'b1'}
+    patcher = mock.patch.dict(
+        fact_cache.TRIGGERS, {'boot': lambda: self.triggers['boot']})
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.probe = mock.Mock(return_value={'fact': 'value'})
+
+  def _Get(self, now, ttl=60):
+    return fact_cache.FactCache(self.path).Get(
+        'name', self.probe, ttl, triggers=('boot',), now=now)
+
+  def testGetCachesAcrossInstances(self):
+    """Test Get() with a fresh cached fact."""
+    self.assertEqual({'fact': 'value'}, self._Get(100))
+    self.assertEqual({'fact': 'value'}, self._Get(150))
+    self.assertEqual(1, self.probe.call_count)
+
+  def testGetWhenExpired(self):
+    """Test Get() with a cached fact older than its ttl."""
+    self._Get(100)
+    self._Get(160)
+    self.assertEqual(2, self.probe.call_count)
+
+  def testGetWhenTriggerChanged(self):
+    """Test Get() with a cached fact whose trigger has changed."""
+    self._Get(100)
+    self.triggers['boot'] = 'b2'
+    self._Get(101)
+    self._Get(102)
+    self.assertEqual(2, self.probe.call_count)
+
+  def testGetDoesNotCacheEmptyValues(self):
+    """Test Get() with a failing probe."""
+    self.probe.return_value = {}
+    self.assertEqual({}, self._Get(100))
+    self._Get(101)
+    self.assertEqual(2, self.probe.call_count)
+    self.assertFalse(os.path.exists(self.path))
+
+  def testGetWhenUntrusted(self):
+    """Test Get() with a cache file of another user."""
+    self._Get(100)
+    with mock.patch.object(
+        fact_cache.os, 'geteuid', return_value=os.geteuid() + 1):
+      self._Get(101)
+    self.assertEqual(2, self.probe.call_count)
+
+  def testGetWhenCorrupt(self):
+    """Test Get() with an unreadable cache file."""
+    with open(self.path, 'w') as f:
+      f.write('{broken')
+    self.assertEqual({'fact': 'value'}, self._Get(100))
+    self.assertEqual({'fact': 'value'}, self._Get(101))
+    self.assertEqual(1, self.probe.call_count)
+
+  def testGetWhenDisabled(self):
+    """Test Get() without a cache path."""
+    cache = fact_cache.FactCache(None)
+    cache.Get('name', self.probe, 60)
+    cache.Get('name', self.probe, 60)
+    self.assertEqual(2, self.probe.call_count)
+
+  def testInvalidate(self):
+    """Test Invalidate()."""
+    self._Get(100)
+    fact_cache.FactCache(self.path).Invalidate('name')
+    self._Get(101)
+    self.assertEqual(2, self.probe.call_count)
+
+  def testGetFactSourcesState(self):
+    """Test GetFactSourcesState() with changing fact sources."""
+    facts_d = os.path.join(self.tmp_dir, 'facts.d')
+    os.makedirs(os.path.join(facts_d, 'sub'))
+    settings_cfg = os.path.join(self.tmp_dir, 'settings.cfg')
+    with open(os.path.join(facts_d, 'sub', 'site.txt'), 'w') as f:
+      f.write('site=a')
+    with mock.patch.object(
+        fact_cache, 'FACT_SOURCE_PATHS', (facts_d, settings_cfg)):
+      state = fact_cache.GetFactSourcesState()
+      self.assertEqual(state, fact_cache.GetFactSourcesState())
+
+      with open(os.path.join(facts_d, 'sub', 'site.txt'), 'w') as f:
+        f.write('site=b')
+      changed = fact_cache.GetFactSourcesState()
+      self.assertNotEqual(state, changed)
+
+      with open(settings_cfg, 'w') as f:
+        f.write('configtrack = "stable"')
+      self.assertNotEqual(changed, fact_cache.GetFactSourcesState())
+
+
+def main(unused_argv):
+  basetest.main()
+
+
+if __name__ == '__main__':
+  app.run()
@@ -158,6 +158,18 @@ class SystemProfileTest(mox.MoxTestBase):
     self.assertEqual({}, self.sp.GetProfile())
     self.mox.VerifyAll()
 
+  def testGetProfileCached(self):
+    """Test GetProfile() with a cached profile."""
+    self.sp._include_only = ['system', 'network']
+    self.mox.StubOutWithMock(hw.fact_cache, 'Get')
+    hw.fact_cache.Get(
+        'system_profile_network,system', self.sp._ProbeProfile,
+        hw.PROFILE_CACHE_TTL, triggers=mox.IgnoreArg()).AndReturn(
+            {'serial_number': 'foo'})
+    self.mox.ReplayAll()
+    self.assertEqual({'serial_number': 'foo'}, self.sp.GetProfile())
+    self.mox.VerifyAll()
+
   def testGetProfileWhenReady(self):
     """Test GetProfile()."""
     self.sp._profile = 'foo'
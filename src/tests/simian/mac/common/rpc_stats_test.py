@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""rpc_stats module tests."""
+
+import time
+
+import mock
+import webapp2
+import webtest
+
+from google.appengine.api import memcache
+
+from google.apputils import basetest
+from simian.mac.common import rpc_stats
+from tests.simian.mac.common import test
+
+
+class MemcacheHandler(webapp2.RequestHandler):
+
+  def get(self):
+    memcache.set('foo', 'bar')
+    self.response.write(memcache.get('foo'))
+
+
+class RpcStatsModuleTest(basetest.TestCase):
+
+  def testGetPercentile(self):
+    """Test _GetPercentile()."""
+    buckets = [0] * (len(rpc_stats.LATENCY_BUCKETS_MS) + 1)
+    buckets[0] = 90
+    buckets[3] = 9
+    buckets[-1] = 1
+    self.assertEqual(10, rpc_stats._GetPercentile(buckets, 100, 50))
+    self.assertEqual(10, rpc_stats._GetPercentile(buckets, 100, 90))
+    self.assertEqual(100, rpc_stats._GetPercentile(buckets, 100, 99))
+    self.assertEqual(None, rpc_stats._GetPercentile(buckets, 100, 100))
+
+  def testGetBucket(self):
+    """Test _GetBucket()."""
+    self.assertEqual(0, rpc_stats._GetBucket(0))
+    self.assertEqual(1, rpc_stats._GetBucket(11))
+    self.assertEqual(
+        len(rpc_stats.LATENCY_BUCKETS_MS), rpc_stats._GetBucket(99999999))
+
+
+class RpcStatsTest(test.AppengineTest):
+
+  def setUp(self):
+    super(RpcStatsTest, self).setUp()
+    rpc_stats._pending.clear()
+    rpc_stats._last_flush[0] = time.time()
+    app = webapp2.WSGIApplication([(r'/foo', MemcacheHandler)])
+    rpc_stats.Install(app)
+    self.testapp = webtest.TestApp(app)
+
+  @mock.patch.object(rpc_stats, 'settings')
+  def testDebugHeader(self, settings_mock):
+    """Test the debug header lists the RPCs of a request."""
+    settings_mock.DEBUG = True
+    resp = self.testapp.get('/foo')
+
+    self.assertEqual('bar', resp.body)
+    self.assertEqual(
+        'memcache=2/', resp.headers[rpc_stats.DEBUG_HEADER][:11])
+
+  @mock.patch.object(rpc_stats, 'settings')
+  def testNoDebugHeader(self, settings_mock):
+    """Test the debug header is only set in debug mode."""
+    settings_mock.DEBUG = False
+    resp = self.testapp.get('/foo')
+
+    self.assertNotIn(rpc_stats.DEBUG_HEADER, resp.headers)
+
+  def testGetRouteStats(self):
+    """Test GetRouteStats() sums flushed requests."""
+    now = time.time()
+    self.testapp.get('/foo')
+    self.testapp.get('/foo')
+    rpc_stats.Flush(now=now)
+    self.testapp.get('/foo')
+    rpc_stats.Flush(now=now + rpc_stats.WINDOW_SECS)
+
+    routes = rpc_stats.GetRouteNames([self.testapp.app])
+    self.assertEqual(['rpc_stats_test.MemcacheHandler'], routes)
+
+    stats = rpc_stats.GetRouteStats(
+        routes, now=now + rpc_stats.WINDOW_SECS)
+    self.assertEqual(1, len(stats))
+    self.assertEqual(3, stats[0]['count'])
+    self.assertEqual(2, stats[0]['avg_rpcs'])
+    self.assertTrue(stats[0]['avg_bytes'] > 0)
+    self.assertEqual(
+        rpc_stats.PERCENTILES, [p for p, _ in stats[0]['percentiles']])
+
+    later = now + rpc_stats.WINDOW_SECS * (rpc_stats.WINDOWS + 1)
+    self.assertEqual([], rpc_stats.GetRouteStats(routes, now=later))
+
+
+def main(unused_argv):
+  basetest.main()
+
+
+if __name__ == '__main__':
+  basetest.main()
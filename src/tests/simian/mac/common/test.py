@@ -93,6 +93,7 @@ class RequestHandlerTest(test_base.RequestHandlerTest):
     self.testbed.init_taskqueue_stub()
     self.testbed.init_user_stub()
     self.testbed.init_mail_stub()
+    self.testbed.init_search_stub()
     settings.ADMINS = ['admin@example.com']
 
   def tearDown(self):
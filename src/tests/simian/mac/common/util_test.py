@@ -93,6 +93,17 @@ class UtilModuleTest(basetest.TestCase):
     """Test Deserialize()."""
     self.assertRaises(util.DeserializeError, util.Deserialize, None)
 
+  def testStrHeaderDateToDatetime(self):
+    """Tests StrHeaderDateToDatetime()."""
+    header_dt_str = 'Wed, 06 Oct 2010 03:23:34 GMT'
+    dt = datetime.datetime(2010, 10, 06, 03, 23, 34)  # same date
+    r = util.StrHeaderDateToDatetime(header_dt_str)
+    self.assertEqual(dt, r)
+
+  def testStrHeaderDateToDatetimeNone(self):
+    """Tests StrHeaderDateToDatetime()."""
+    self.assertEqual(None, util.StrHeaderDateToDatetime(''))
+
   def testUrlUnquote(self):
     """Test UrlUnquote()."""
     self.assertEqual(util.UrlUnquote('foo'), 'foo')
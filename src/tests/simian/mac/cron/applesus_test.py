@@ -265,16 +265,15 @@ class AppleSUSCatalogSyncTest(test.AppengineTest):
     for p in ['product2', 'product3', 'product7', 'deprecateme', 'andme']:
       models.AppleSUSProduct(product_id=p).put()
 
-    def PlistStub(plist):
-      m = mock.Mock()
+    def IterParseItemsStub(plist, path):
+      self.assertEqual(('Products',), path)
       if 'parseerror' in plist:
-        m.Parse.side_effect = applesus.plist.Error
-      else:
-        prefix = 'fooplist-'
-        assert plist.startswith(prefix)
-        m.get.return_value = test_products[plist[len(prefix):]]
-      return m
-    self.stubs.Set(applesus.plist, 'ApplePlist', PlistStub)
+        raise applesus.plist.Error
+      prefix = 'fooplist-'
+      assert plist.startswith(prefix)
+      for product in test_products[plist[len(prefix):]]:
+        yield product, {}
+    self.stubs.Set(applesus.plist, 'IterParseItems', IterParseItemsStub)
 
     out = self.catalog_sync._DeprecateOrphanedProducts()
     expected_deprecated = ['andme', 'deprecateme', 'product2']
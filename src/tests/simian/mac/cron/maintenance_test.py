@@ -82,6 +82,42 @@ class AuthSessionCleanupTest(basetest.TestCase):
     self.assertEqual(valid_session_name, sessions[0].key().name())
 
 
+class MarkComputersInactiveTest(test.AppengineTest):
+
+  def testGet(self):
+    """Test get()."""
+    self.testapp = webtest.TestApp(gae_app)
+    now = datetime.datetime.utcnow()
+    models.Computer(
+        key_name='stale', active=True,
+        preflight_datetime=now - datetime.timedelta(days=60)).put(
+            update_active=False)
+    models.Computer(
+        key_name='fresh', active=True, preflight_datetime=now).put()
+
+    self.testapp.get('/cron/maintenance/mark_computers_inactive')
+    self.RunAllDeferredTasks()
+
+    self.assertFalse(models.Computer.get_by_key_name('stale').active)
+    self.assertTrue(models.Computer.get_by_key_name('fresh').active)
+
+  def testMarkInactiveResumesFromCursor(self):
+    """Test Computer.MarkInactive() with a small batch_size."""
+    old = datetime.datetime.utcnow() - datetime.timedelta(days=60)
+    for i in range(3):
+      models.Computer(
+          key_name='stale%d' % i, active=True, preflight_datetime=old).put(
+              update_active=False)
+
+    count, cursor = models.Computer.MarkInactive(batch_size=2)
+    self.assertEqual(2, count)
+    self.assertTrue(cursor)
+    count, cursor = models.Computer.MarkInactive(cursor=cursor, batch_size=2)
+    self.assertEqual(1, count)
+    self.assertEqual(None, cursor)
+    self.assertEqual(0, models.Computer.AllActive().count())
+
+
 class UpdateAverageInstallDurationsTest(test.RequestHandlerTest):
 
   def GetTestClassInstance(self):
@@ -182,6 +218,21 @@ class VerifyPackagesCleanupTest(test.AppengineTest):
       keys.append(str(b.key()))
     self.assertEqual([goodblob_key], keys)
 
+  def testDiffBlobsAndPackages(self):
+    """Test _DiffBlobsAndPackages() with a PackageInfo lacking a blob key."""
+    blobstore_stub = self.testbed.get_stub(testbed.BLOBSTORE_SERVICE_NAME)
+    blobstore_stub.CreateBlob('good', 'content')
+    blobstore_stub.CreateBlob('orphaned', 'content')
+
+    models.PackageInfo(filename='no_blob_key').put()
+    models.PackageInfo(filename='good', blobstore_key='good').put()
+    models.PackageInfo(filename='missing', blobstore_key='missing').put()
+
+    orphaned, missing = maint.VerifyPackages._DiffBlobsAndPackages()
+
+    self.assertEqual(['orphaned'], orphaned)
+    self.assertEqual(['missing'], missing)
+
 
 logging.basicConfig(filename='/dev/null')
 
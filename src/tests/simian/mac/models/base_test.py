@@ -362,6 +362,73 @@ class ModelsModuleTest(mox.MoxTestBase):
         entities, models.BaseModel.MemcacheWrappedGetAllFilter(filters))
     self.mox.VerifyAll()
 
+  def testBasePlistModelPlistCache(self):
+    """Test BasePlistModel parses unchanged plists only once."""
+
+    class _PlistModel(models.BasePlistModel):
+      pass
+
+    self.stubs.Set(models, '_plist_cache', models._PlistCache(1024 * 1024))
+    xml = ('%s<dict><key>foo</key><array><string>bar</string></array>'
+           '</dict>%s' % (models.plist_lib.PLIST_HEAD,
+                          models.plist_lib.PLIST_FOOT))
+    parse = models.plist_lib.ApplePlist.Parse
+    parse_calls = []
+
+    def CountingParse(plist_self, *args, **kwargs):
+      parse_calls.append(plist_self)
+      return parse(plist_self, *args, **kwargs)
+
+    self.stubs.Set(models.plist_lib.ApplePlist, 'Parse', CountingParse)
+
+    first = _PlistModel(_plist=xml)
+    second = _PlistModel(_plist=xml)
+    first.plist['foo'].append('zoo')
+
+    self.assertEqual(['bar'], second.plist['foo'])
+    self.assertEqual(['bar', 'zoo'], first.plist['foo'])
+    self.assertEqual(1, len(parse_calls))
+
+  def testPlistCacheEvictsBySize(self):
+    """Test _PlistCache keeps plists within its byte budget."""
+    per_byte = models.PLIST_CACHE_BYTES_PER_XML_BYTE
+    cache = models._PlistCache(100 * per_byte)
+    plist = models.plist_lib.ApplePlist('%s<dict/>%s' % (
+        models.plist_lib.PLIST_HEAD, models.plist_lib.PLIST_FOOT))
+    plist.Parse()
+    cache.Set('a', plist, 40)
+    cache.Set('b', plist, 40)
+    cache.Get('a')
+    cache.Set('c', plist, 40)
+    cache.Set('huge', plist, 101)
+
+    self.assertNotEqual(None, cache.Get('a'))
+    self.assertEqual(None, cache.Get('b'))
+    self.assertNotEqual(None, cache.Get('c'))
+    self.assertEqual(None, cache.Get('huge'))
+
+  def testBasePlistModelPutReusesXmlWhenNotDirty(self):
+    """Test BasePlistModel.put() only serializes a possibly modified plist."""
+
+    class _PlistModel(models.BasePlistModel):
+      pass
+
+    self.stubs.Set(models.db.Model, 'put', lambda *args, **kwargs: None)
+    xml = ('%s  <dict>\n    <key>foo</key>\n    <string>bar</string>\n'
+           '  </dict>%s' % (models.plist_lib.PLIST_HEAD,
+                            models.plist_lib.PLIST_FOOT))
+    entity = _PlistModel(_plist=xml)
+    self.assertEqual('bar', entity.plist['foo'])
+
+    self.mox.StubOutWithMock(entity.plist, 'GetXml')
+    entity.plist.GetXml().AndReturn(xml)
+
+    self.mox.ReplayAll()
+    entity.put()
+    entity.plist['foo'] = 'zoo'
+    entity.put()
+    self.mox.VerifyAll()
+
   def testPackageAliasResolvePackageName(self):
     """Test PackageAlias.ResolvePackageName() classmethod."""
     pkg_alias = 'unknown'
@@ -24,6 +24,7 @@ import stubout
 import mox
 import stubout
 
+from google.appengine.ext import db
 from google.appengine.ext import testbed
 
 from simian.mac.common import datastore_locks
@@ -833,6 +834,99 @@ class PackageInfoTest(mox.MoxTestBase):
     self.assertTrue('https://foo.com/admin/package/file%20name.dmg' in body)
 
 
+class PackageInfoSummaryTest(test.AppengineTest):
+  """Test PackageInfoSummary class."""
+
+  PLIST = (
+      '<plist><dict><key>name</key><string>foo</string>'
+      '<key>version</key><string>1.0</string>'
+      '<key>installer_item_hash</key><string>hash</string>'
+      '<key>installer_item_location</key><string>foo.dmg</string>'
+      '<key>catalogs</key><array><string>unstable</string></array>'
+      '<key>installer_item_size</key><integer>10</integer>'
+      '<key>unattended_install</key><true/>'
+      '<key>description</key><string>foo desc</string></dict></plist>')
+
+  def testPutWritesSummary(self):
+    """Test PackageInfo.put() writes a summary, and delete() removes it."""
+    p = models.PackageInfo(
+        key_name='foo.dmg', filename='foo.dmg', name='foo',
+        catalogs=['unstable'], _plist=self.PLIST)
+    p.put()
+
+    s = models.PackageInfoSummary.get(
+        models.PackageInfoSummary.KeyForPackageInfo(p.key()))
+    self.assertEqual('foo.dmg', s.filename)
+    self.assertEqual('foo-1.0', s.munki_name)
+    self.assertEqual(['unstable'], s.catalogs)
+    self.assertEqual('1.0', s.version)
+    self.assertEqual(10, s.installer_item_size)
+    self.assertTrue(s.unattended_install)
+    self.assertFalse(s.unattended_uninstall)
+    self.assertTrue(s.uninstallable)
+    self.assertEqual('foo desc', s.description)
+
+    p.catalogs = ['unstable', 'testing']
+    p.put()
+    s = models.PackageInfoSummary.get(s.key())
+    self.assertEqual(['unstable', 'testing'], s.catalogs)
+
+    with mock.patch.object(models.Catalog, 'Generate'):
+      p.delete()
+    self.assertEqual(0, models.PackageInfoSummary.all().count())
+
+  def testFromPackageInfoWithInvalidValues(self):
+    """Test FromPackageInfo() coerces or skips plist values of bad types."""
+    xml = self.PLIST.replace(
+        '<string>1.0</string>', '<integer>2</integer>').replace(
+            '<key>description</key>',
+            '<key>autoremove</key><string>yes</string>'
+            '<key>description</key>')
+    p = models.PackageInfo(
+        key_name='foo.dmg', filename='foo.dmg', _plist=xml)
+    p.put()
+
+    s = models.PackageInfoSummary.get(
+        models.PackageInfoSummary.KeyForPackageInfo(p.key()))
+    self.assertEqual('2', s.version)
+    self.assertFalse(s.autoremove)
+    self.assertEqual(10, s.installer_item_size)
+
+  def testPutIsAtomic(self):
+    """Test PackageInfo.put() saves nothing if the summary put fails."""
+    p = models.PackageInfo(
+        key_name='foo.dmg', filename='foo.dmg', _plist=self.PLIST)
+    with mock.patch.object(
+        models.PackageInfoSummary, 'put', side_effect=db.Error):
+      self.assertRaises(db.Error, p.put)
+    self.assertEqual(None, models.PackageInfo.get_by_key_name('foo.dmg'))
+
+  def testProposalPutDoesNotWriteSummary(self):
+    """Test PackageInfoProposal.put() does not write a summary."""
+    models.PackageInfoProposal(
+        key_name='foo.dmg', filename='foo.dmg', _plist=self.PLIST).put()
+    self.assertEqual(0, models.PackageInfoSummary.all().count())
+
+  def testGetForPackageInfoKeysCreatesMissing(self):
+    """Test GetForPackageInfoKeys() with PackageInfo lacking summaries."""
+    keys = []
+    for i in range(3):
+      p = models.PackageInfo(
+          key_name='foo%d.dmg' % i, filename='foo%d.dmg' % i,
+          _plist=self.PLIST)
+      p.put()
+      keys.append(p.key())
+    models.PackageInfoSummary.get(
+        models.PackageInfoSummary.KeyForPackageInfo(keys[1])).delete()
+    keys.append(models.PackageInfo(key_name='deleted.dmg').key())
+
+    summaries = models.PackageInfoSummary.GetForPackageInfoKeys(keys)
+
+    self.assertEqual(
+        ['foo0.dmg', 'foo1.dmg', 'foo2.dmg'], [s.filename for s in summaries])
+    self.assertEqual(3, models.PackageInfoSummary.all().count())
+
+
 def main(unused_argv):
   basetest.main()
 
@@ -16,6 +16,7 @@
 #
 """Munki common module tests."""
 
+import calendar
 import datetime
 import logging
 
@@ -23,8 +24,11 @@ import mox
 import stubout
 
 import tests.appenginesdk
+from google.appengine.api import memcache
+from google.appengine.ext import testbed
 from google.apputils import app
 from simian.mac import models
+from simian.mac.admin import maintenance
 from tests.simian.mac.common import test
 from simian.mac.munki import common
 
@@ -313,6 +317,8 @@ class CommonModuleTest(test.RequestHandlerTest):
 
     self.mox.StubOutWithMock(common.deferred, 'defer')
 
+    common.deferred.defer(
+        models.ComputerSummaryShard.Add, mox.IgnoreArg(), _transactional=True)
     common.deferred.defer(
         common._SaveFirstConnection, client_id=client_id,
         computer_key=mox.IgnoreArg(), _countdown=300, _queue='first')
@@ -535,10 +541,8 @@ class CommonModuleTest(test.RequestHandlerTest):
     mode = common.PANIC_MODES[0]
     k = '%s%s' % (common.PANIC_MODE_PREFIX, mode)
 
-    self.mox.StubOutWithMock(
-        common.models.KeyValueCache, 'get_by_key_name')
-    self.mox.StubOutWithMock(
-        common.models.KeyValueCache, 'ResetMemcacheWrap')
+    # stub the whole model; stubbing its inherited classmethods would leave
+    # them bound to KeyValueCache for its subclasses.
     self.mox.StubOutWithMock(
         common.models, 'KeyValueCache')
     mock_entity = self.mox.CreateMockAnything()
@@ -562,10 +566,8 @@ class CommonModuleTest(test.RequestHandlerTest):
     mode = common.PANIC_MODES[0]
     k = '%s%s' % (common.PANIC_MODE_PREFIX, mode)
 
-    self.mox.StubOutWithMock(
-        common.models.KeyValueCache, 'get_by_key_name')
-    self.mox.StubOutWithMock(
-        common.models.KeyValueCache, 'ResetMemcacheWrap')
+    # stub the whole model; stubbing its inherited classmethods would leave
+    # them bound to KeyValueCache for its subclasses.
     self.mox.StubOutWithMock(
         common.models, 'KeyValueCache')
     mock_entity = self.mox.CreateMockAnything()
@@ -735,6 +737,9 @@ class CommonModuleTest(test.RequestHandlerTest):
     self.mox.StubOutWithMock(common.models.db.Key, 'from_path')
     common.models.db.Key.from_path('Computer', client_id['uuid']).AndReturn('k')
     common.models.Tag.GetAllTagNamesForKey('k').AndReturn(computer_tags)
+    self.mox.StubOutWithMock(common.models.Group, 'GetAllGroupNamesForUser')
+    common.models.Group.GetAllGroupNamesForUser(
+        client_id['owner']).AndReturn([])
     tag_mod_one = self.mox.CreateMockAnything()
     tag_mod_one.enabled = False
     tag_mods = [tag_mod_one]
@@ -822,6 +827,9 @@ class CommonModuleTest(test.RequestHandlerTest):
         (('uuid =', client_id['uuid']),)).AndReturn([])
     common.models.db.Key.from_path('Computer', client_id['uuid']).AndReturn('k')
     common.models.Tag.GetAllTagNamesForKey('k').AndReturn(['tag'])
+    self.mox.StubOutWithMock(common.models.Group, 'GetAllGroupNamesForUser')
+    common.models.Group.GetAllGroupNamesForUser(
+        client_id['owner']).AndReturn([])
     common.models.TagManifestModification.MemcacheWrappedGetAllFilter(
         (('tag_key_name =', 'tag'),)).AndReturn([])
 
@@ -892,6 +900,9 @@ class CommonModuleTest(test.RequestHandlerTest):
         (('uuid =', client_id['uuid']),)).AndRaise([])
     common.models.db.Key.from_path('Computer', client_id['uuid']).AndReturn('k')
     common.models.Tag.GetAllTagNamesForKey('k').AndReturn([])
+    self.mox.StubOutWithMock(common.models.Group, 'GetAllGroupNamesForUser')
+    common.models.Group.GetAllGroupNamesForUser(
+        client_id['owner']).AndReturn([])
 
     self.mox.ReplayAll()
     self.assertTrue(
@@ -1207,6 +1218,106 @@ class CommonModuleTest(test.RequestHandlerTest):
 logging.basicConfig(filename='/dev/null')
 
 
+class MsuUserSummaryTest(test.AppengineTest):
+  """Tests MSU user summary buckets maintained by WriteComputerMSULog()."""
+
+  def setUp(self):
+    super(MsuUserSummaryTest, self).setUp()
+    self.now = datetime.datetime(2017, 5, 10, 12, 0)
+    self._WriteLog('uuid1', 'user1', 'launched', self.now)
+    self._WriteLog('uuid1', 'user1', 'cancelled', self.now)
+    self._WriteLog(
+        'uuid2', 'user1', 'launched', self.now - datetime.timedelta(days=9))
+    # not counted, as MSU was never launched on uuid3.
+    self._WriteLog('uuid3', 'user2', 'cancelled', self.now)
+
+  def _WriteLog(self, uuid, user, event, mtime):
+    common.WriteComputerMSULog(uuid, {
+        'event': event, 'source': 'user', 'user': user, 'desc': '',
+        'time': calendar.timegm(mtime.utctimetuple()),
+    })
+
+  def _RunDeferredTasks(self):
+    taskqueue = self.testbed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+    while taskqueue.GetTasks('default'):
+      self.RunAllDeferredTasks()
+
+  def _GetSummary(self, since_days=None):
+    self._RunDeferredTasks()
+    memcache.flush_all()
+    summary, _ = models.MsuUserSummaryBucket.GetSummary(
+        since_days=since_days, now=self.now)
+    return dict((k, v) for k, v in summary.iteritems() if v)
+
+  def testGetSummary(self):
+    self.assertEqual({
+        'launched': 2, 'cancelled': 1, 'total_events': 3, 'total_uuids': 2,
+        'total_users': 1, 'total_users_3_events': 1,
+    }, self._GetSummary())
+    self.assertEqual({
+        'launched': 1, 'cancelled': 1, 'total_events': 2, 'total_uuids': 1,
+        'total_users': 1, 'total_users_2_events': 1,
+    }, self._GetSummary(since_days=1))
+
+  def testGetSummaryAllTimeMatchesDays(self):
+    self._WriteLog(
+        'uuid4', 'user3', 'launched', self.now - datetime.timedelta(days=20))
+    self.assertEqual(self._GetSummary(since_days=30), self._GetSummary())
+    self.assertTrue(
+        models.MsuUserSummaryBucket.all().filter('day =', None).get())
+
+  def testEventMovesToNewDay(self):
+    self._WriteLog('uuid2', 'user1', 'launched', self.now)
+    self.assertEqual({
+        'launched': 2, 'cancelled': 1, 'total_events': 3, 'total_uuids': 2,
+        'total_users': 1, 'total_users_3_events': 1,
+    }, self._GetSummary(since_days=1))
+
+  def testEventMovesToOtherUser(self):
+    self._WriteLog('uuid3', 'user2', 'launched', self.now)
+    self._WriteLog(
+        'uuid1', 'user2', 'cancelled', self.now + datetime.timedelta(hours=1))
+    self.assertEqual({
+        'launched': 3, 'cancelled': 1, 'total_events': 4, 'total_uuids': 3,
+        'total_users': 2, 'total_users_2_events': 2,
+    }, self._GetSummary())
+
+  def testRebuildMsuUserSummary(self):
+    expected = self._GetSummary()
+    models.db.delete(list(models.MsuUserSummaryBucket.all(keys_only=True)))
+    models.db.delete(list(models.MsuUserState.all(keys_only=True)))
+    self.assertEqual({}, self._GetSummary())
+
+    maintenance.RebuildMsuUserSummary()
+    self._RunDeferredTasks()
+    self.assertEqual(expected, self._GetSummary())
+    self.assertEqual((1, None), models.MsuUserSummaryBucket.GetGenerations())
+    self.assertEqual(
+        [], list(models.MsuUserSummaryBucket.all().filter('generation <', 1)))
+
+  def testRebuildMsuUserSummaryWithConcurrentPuts(self):
+    generation = models.MsuUserSummaryBucket.StartGeneration()
+    self._WriteLog('uuid3', 'user2', 'launched', self.now)
+    self._WriteLog('uuid4', 'user3', 'launched', self.now)
+    maintenance.RebuildMsuUserSummary(generation=generation)
+    self._WriteLog('uuid5', 'user4', 'launched', self.now)
+    self._WriteLog('uuid1', 'user1', 'launched', self.now)
+
+    self.assertEqual({
+        'launched': 5, 'cancelled': 2, 'total_events': 7, 'total_uuids': 5,
+        'total_users': 4, 'total_users_3_events': 1,
+        'total_users_2_events': 1, 'total_users_1_events': 2,
+    }, self._GetSummary())
+    self.assertEqual(
+        (generation, None), models.MsuUserSummaryBucket.GetGenerations())
+
+  def testUserStateHasAllLogs(self):
+    for i in xrange(5):
+      self._WriteLog('uuid%d' % (i + 10), 'user1', 'launched', self.now)
+    state = models.MsuUserState.get_by_key_name('user1')
+    self.assertEqual(8, len(state.GetLogs()))
+
+
 def main(unused_argv):
   test.main(unused_argv)
 
@@ -33,17 +33,6 @@ class HandlersTest(test.RequestHandlerTest):
   def GetTestClassModule(self):
     return handlers
 
-  def testStrHeaderDateToDatetime(self):
-    """Tests StrHeaderDateToDatetime()."""
-    header_dt_str = 'Wed, 06 Oct 2010 03:23:34 GMT'
-    dt = datetime.datetime(2010, 10, 06, 03, 23, 34)  # same date
-    r = handlers.StrHeaderDateToDatetime(header_dt_str)
-    self.assertEqual(dt, r)
-
-  def testStrHeaderDateToDatetimeNone(self):
-    """Tests StrHeaderDateToDatetime()."""
-    self.assertEqual(None, handlers.StrHeaderDateToDatetime(''))
-
   def testIsClientResourceExpiredWithEmptyDate(self):
     """Tests IsClientResourceExpired() with empty header str date."""
     self.assertTrue(handlers.IsClientResourceExpired(None, ''))
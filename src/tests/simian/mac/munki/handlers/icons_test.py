@@ -15,7 +15,9 @@
 # limitations under the License.
 #
 import base64
+import hashlib
 import httplib
+import time
 
 
 import mock
@@ -23,11 +25,13 @@ import stubout
 import webtest
 
 import cloudstorage as gcs
+from google.appengine.ext import testbed
 from google.apputils import app
 from google.apputils import basetest
 
 from simian import settings
 from simian.mac.common import auth
+from simian.mac.munki.handlers import icons
 from tests.simian.mac.common import test
 from simian.mac.urls import app as gae_app
 
@@ -38,6 +42,12 @@ class IconsModuleTest(test.AppengineTest):
   def setUp(self):
     super(IconsModuleTest, self).setUp()
     self.testapp = webtest.TestApp(gae_app)
+    icons._cache.clear()
+    icons._cache_bytes[0] = 0
+
+  def _WriteIcon(self, name, content):
+    with gcs.open(icons.GetIconPath('test', name), 'w') as f:
+      f.write(content)
 
   def testNotFound(self, *_):
     settings.ICONS_GCS_BUCKET = 'test'
@@ -53,6 +63,126 @@ class IconsModuleTest(test.AppengineTest):
     resp = self.testapp.get('/icons/filename.png', status=httplib.OK)
 
     self.assertEqual(content, resp.body)
+    self.assertEqual(
+        '"%s"' % hashlib.sha256(content).hexdigest(), resp.headers['ETag'])
+    self.assertEqual(icons.ICON_CACHE_CONTROL, resp.headers['Cache-Control'])
+
+  def testNotModified(self, *_):
+    settings.ICONS_GCS_BUCKET = 'test'
+    self._WriteIcon('filename', 'IMAGE_CONTENT')
+    etag = '"%s"' % hashlib.sha256('IMAGE_CONTENT').hexdigest()
+
+    resp = self.testapp.get(
+        '/icons/filename.png', headers={'If-None-Match': etag},
+        status=httplib.NOT_MODIFIED)
+
+    self.assertEqual('', resp.body)
+    self.assertEqual(etag, resp.headers['ETag'])
+
+  def testInstanceCache(self, *_):
+    settings.ICONS_GCS_BUCKET = 'test'
+    self._WriteIcon('filename', 'OLD')
+    self.assertEqual('OLD', icons.GetIcon('test', 'filename', now=100)[0])
+    self._WriteIcon('filename', 'NEW')
+
+    self.assertEqual('OLD', icons.GetIcon('test', 'filename', now=101)[0])
+    self.assertEqual(
+        'NEW', icons.GetIcon(
+            'test', 'filename', now=101 + icons.INSTANCE_CACHE_SECS)[0])
+    icons.ClearCache('filename')
+    self._WriteIcon('filename', 'NEWER')
+    self.assertEqual('NEWER', icons.GetIcon('test', 'filename', now=102)[0])
+
+  def testInstanceCacheEvictsLeastRecentlyUsed(self, *_):
+    self._WriteIcon('a', 'A' * 6)
+    self._WriteIcon('b', 'B' * 6)
+    self._WriteIcon('c', 'C' * 6)
+
+    with mock.patch.object(icons, 'INSTANCE_CACHE_MAX_BYTES', 12):
+      icons.GetIcon('test', 'a')
+      icons.GetIcon('test', 'b')
+      icons.GetIcon('test', 'a')
+      icons.GetIcon('test', 'c')
+
+    self.assertEqual(['a', 'c'], icons._cache.keys())
+    self.assertEqual(12, icons._cache_bytes[0])
+
+  def testIconHashes(self, *_):
+    settings.ICONS_GCS_BUCKET = 'test'
+    self._WriteIcon('Firefox', 'FIREFOX')
+    self._WriteIcon('Chrome', 'CHROME')
+    # not stored yet; the hashes are rebuilt in a deferred task.
+    self.assertEqual({}, icons.GetIconHashes('test'))
+    self.RunAllDeferredTasks()
+
+    resp = self.testapp.get('/icons/_icon_hashes.plist', status=httplib.OK)
+
+    self.assertIn('<key>Chrome.png</key>', resp.body)
+    self.assertIn(
+        '<string>%s</string>' % hashlib.sha256('FIREFOX').hexdigest(),
+        resp.body)
+    self.assertEqual(
+        {'Chrome.png': hashlib.sha256('CHROME').hexdigest(),
+         'Firefox.png': hashlib.sha256('FIREFOX').hexdigest()},
+        icons.GetIconHashes('test'))
+
+    self.testapp.get(
+        '/icons/_icon_hashes.plist',
+        headers={'If-None-Match': resp.headers['ETag']},
+        status=httplib.NOT_MODIFIED)
+
+  def testIconHashesDoesNotReadIcons(self, *_):
+    self._WriteIcon('Firefox', 'FIREFOX')
+    icons.RebuildIconHashes('test')
+    self._WriteIcon('Chrome', 'CHROME')
+    icons.SetIconHash('Chrome', hashlib.sha256('CHROME').hexdigest())
+
+    with mock.patch.object(icons.gcs, 'open') as m:
+      hashes = icons.GetIconHashes('test')
+
+    self.assertFalse(m.called)
+    self.assertEqual(
+        hashlib.sha256('CHROME').hexdigest(), hashes['Chrome.png'])
+    self.assertEqual(0, len(self.testbed.get_stub(
+        testbed.TASKQUEUE_SERVICE_NAME).GetTasks('default')))
+
+  def testIconHashesRebuiltWhenOld(self, *_):
+    self._WriteIcon('Firefox', 'FIREFOX')
+    icons.RebuildIconHashes('test')
+    self._WriteIcon('Firefox', 'FIREFOX2')
+    now = time.time() + icons.HASHES_REBUILD_SECS
+
+    self.assertEqual(
+        hashlib.sha256('FIREFOX').hexdigest(),
+        icons.GetIconHashes('test', now=now)['Firefox.png'])
+    # only one rebuild is deferred at a time.
+    icons.GetIconHashes('test', now=now)
+    self.RunAllDeferredTasks()
+    self.assertEqual(
+        hashlib.sha256('FIREFOX2').hexdigest(),
+        icons.GetIconHashes('test')['Firefox.png'])
+
+  def testRebuildIconHashesKeepsUploadsDuringRebuild(self, *_):
+    self._WriteIcon('Firefox', 'FIREFOX')
+    icons.RebuildIconHashes('test')
+    listbucket = icons.gcs.listbucket
+
+    def _ListAndUpload(path):
+      stats = list(listbucket(path))
+      self._WriteIcon('Firefox', 'FIREFOX2')
+      icons.SetIconHash('Firefox', hashlib.sha256('FIREFOX2').hexdigest())
+      return stats
+
+    with mock.patch.object(
+        icons.gcs, 'listbucket', side_effect=_ListAndUpload):
+      with mock.patch.object(
+          icons.gcs, 'open', return_value=mock.MagicMock()) as m:
+        m.return_value.__enter__.return_value.read.return_value = 'FIREFOX'
+        icons.RebuildIconHashes('test')
+
+    self.assertEqual(
+        hashlib.sha256('FIREFOX2').hexdigest(),
+        icons.GetIconHashes('test')['Firefox.png'])
 
 
 def main(unused_argv):
@@ -121,6 +121,8 @@ class HandlersTest(test.RequestHandlerTest):
     self.mox.StubOutWithMock(models.Tag, 'GetAllTagNamesForKey')
     models.db.Key.from_path('Computer', uuid).AndReturn('k')
     models.Tag.GetAllTagNamesForKey('k').AndReturn(computer_tags)
+    self.mox.StubOutWithMock(models.Group, 'GetAllGroupNamesForUser')
+    models.Group.GetAllGroupNamesForUser(owner).AndReturn([])
     self.mox.StubOutWithMock(
         models.TagManifestModification,
         'MemcacheWrappedGetAllFilter')
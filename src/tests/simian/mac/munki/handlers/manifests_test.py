@@ -16,6 +16,7 @@
 #
 """Munki manifests module tests."""
 
+import hashlib
 import httplib
 import logging
 
@@ -46,6 +47,9 @@ class HandlersTest(test.RequestHandlerTest):
         self.request, session=session, client_id_str='').AndReturn(client_id)
     manifests.common.GetComputerManifest(
         client_id=client_id, packagemap=False).AndReturn(plist_xml)
+    self.request.if_none_match = []
+    self.response.headers['ETag'] = '"%s"' % hashlib.sha256(
+        plist_xml).hexdigest()
     self.response.headers['Content-Type'] = 'text/xml; charset=utf-8'
     self.response.out.write(plist_xml).AndReturn(None)
 
@@ -53,6 +57,29 @@ class HandlersTest(test.RequestHandlerTest):
     self.c.get()
     self.mox.VerifyAll()
 
+  def testGetNotModified(self):
+    """Tests Manifests.get() with the client's manifest ETag."""
+    client_id = {'track': 'track'}
+    session = 'session'
+    plist_xml = 'manifest xml'
+    etag = hashlib.sha256(plist_xml).hexdigest()
+
+    self.mox.StubOutWithMock(manifests.handlers, 'GetClientIdForRequest')
+    self.mox.StubOutWithMock(manifests.common, 'GetComputerManifest')
+
+    self.MockDoAnyAuth(and_return=session)
+    manifests.handlers.GetClientIdForRequest(
+        self.request, session=session, client_id_str='').AndReturn(client_id)
+    manifests.common.GetComputerManifest(
+        client_id=client_id, packagemap=False).AndReturn(plist_xml)
+    self.request.if_none_match = [etag]
+    self.response.headers['ETag'] = '"%s"' % etag
+    self.response.set_status(httplib.NOT_MODIFIED)
+
+    self.mox.ReplayAll()
+    self.c.get()
+    self.mox.VerifyAll()
+
   def testGetSuccessWhenManifestNotFoundError(self):
     """Tests Manifests.get()."""
     client_id = {'track': 'track'}
@@ -23,13 +23,92 @@ import mock
 import stubout
 import mox
 import stubout
+import webtest
 
 from simian.mac.common import datastore_locks
 from google.apputils import app
 from google.apputils import basetest
 from simian.mac import models
 from tests.simian.mac.common import test
+from simian.mac.munki import plist
 from simian.mac.munki.handlers import pkgsinfo
+from simian.mac.urls import app as gae_app
+
+
+PLIST = (
+    '<plist><dict><key>name</key><string>%(name)s</string>'
+    '<key>version</key><string>1.0</string>'
+    '<key>installer_item_hash</key><string>hash</string>'
+    '<key>installer_item_location</key><string>%(name)s.dmg</string>'
+    '<key>catalogs</key><array><string>unstable</string></array>'
+    '</dict></plist>')
+
+
+@mock.patch.object(pkgsinfo.auth, 'DoAnyAuth')
+@mock.patch.object(pkgsinfo.auth, 'IsAdminUser', return_value=True)
+class PackagesInfoListTest(test.AppengineTest):
+  """Test listing PackagesInfo with no filename."""
+
+  def setUp(self):
+    super(PackagesInfoListTest, self).setUp()
+    self.testapp = webtest.TestApp(gae_app)
+    for i, catalogs in enumerate([['unstable'], ['unstable', 'testing'], []]):
+      name = 'pkg%d' % i
+      models.PackageInfo(
+          key_name='%s.dmg' % name, filename='%s.dmg' % name, name=name,
+          catalogs=catalogs, install_types=['managed_installs'],
+          _plist=PLIST % {'name': name}).put()
+
+  @mock.patch.object(pkgsinfo, 'LIST_FETCH_BATCH_SIZE', 2)
+  def testGet(self, *_):
+    resp = self.testapp.get('/pkgsinfo/')
+
+    pkgs = plist.MunkiPlist('<plist>%s</plist>' % resp.body.split('\n', 1)[1])
+    pkgs.Parse()
+    self.assertEqual(
+        ['pkg0', 'pkg1', 'pkg2'], sorted(p['name'] for p in pkgs.GetContents()))
+    self.assertNotIn('_plist', pkgs.GetContents()[0])
+    self.assertEqual('text/xml; charset=utf-8', resp.headers['Content-Type'])
+
+  def testGetWithQueryParams(self, *_):
+    resp = self.testapp.get(
+        '/pkgsinfo/?catalogs=unstable&catalogs=testing'
+        '&install_types=managed_installs')
+
+    self.assertEqual(
+        '<?xml version="1.0" encoding="UTF-8"?>\n%s' % plist.GetXmlStr([
+            dict((k, getattr(p, k)) for k in p.properties() if k != '_plist')
+            for p in [models.PackageInfo.get_by_key_name('pkg1.dmg')]]),
+        resp.body)
+
+  def testGetEmpty(self, *_):
+    resp = self.testapp.get('/pkgsinfo/?catalogs=stable')
+    self.assertEqual(
+        '<?xml version="1.0" encoding="UTF-8"?>\n<array>\n</array>', resp.body)
+
+  def testGetEtag(self, *_):
+    etag = self.testapp.get('/pkgsinfo/').headers['ETag']
+    self.testapp.get(
+        '/pkgsinfo/', headers={'If-None-Match': etag},
+        status=httplib.NOT_MODIFIED)
+    self.assertNotEqual(
+        etag, self.testapp.get('/pkgsinfo/?catalogs=unstable').headers['ETag'])
+
+    models.PackageInfo.get_by_key_name('pkg2.dmg').put()
+    self.testapp.get(
+        '/pkgsinfo/', headers={'If-None-Match': etag}, status=httplib.OK)
+
+    etag = self.testapp.get('/pkgsinfo/').headers['ETag']
+    with mock.patch.object(models.Catalog, 'Generate'):
+      models.PackageInfo.get_by_key_name('pkg2.dmg').delete()
+    self.testapp.get(
+        '/pkgsinfo/', headers={'If-None-Match': etag}, status=httplib.OK)
+
+    etag = self.testapp.get('/pkgsinfo/').headers['ETag']
+    models.PackageInfo.get_by_key_name('pkg1.dmg').put(
+        avoid_mtime_update=True)
+    self.testapp.get(
+        '/pkgsinfo/', headers={'If-None-Match': etag}, status=httplib.OK)
 
 
 class MunkiPackageInfoPlistStrictTest(mox.MoxTestBase):
@@ -193,50 +272,6 @@ class PackagesInfoTest(test.RequestHandlerTest):
         'x')
     self.mox.VerifyAll()
 
-  def testGetSuccessWithQueryParams(self):
-    """Test get() pkg list with success."""
-    install_types = ['managed_installs', 'managed_updates']
-    catalogs = ['stable', 'testing']
-    mock_pkg = self.mox.CreateMockAnything()
-    mock_pkg_properties = ['name', 'foo']
-    mock_pkg.name = 'fooname'
-    mock_pkg.foo = 'foofoo'
-    pkgs = [{'name': mock_pkg.name, 'foo': mock_pkg.foo}]
-
-    self.mox.StubOutWithMock(pkgsinfo.plist, 'GetXmlStr')
-
-    mock_user = self.mox.CreateMockAnything()
-    self.MockDoAnyAuth(and_return=mock_user)
-    mock_user.email().AndReturn('foo@example.com')
-    self.mox.StubOutWithMock(pkgsinfo.auth, 'IsAdminUser')
-    self.mox.StubOutWithMock(pkgsinfo.auth, 'IsSupportUser')
-    pkgsinfo.auth.IsAdminUser('foo@example.com').AndReturn(False)
-    pkgsinfo.auth.IsSupportUser('foo@example.com').AndReturn(True)
-
-    mock_query = self.MockModelStatic('PackageInfo', 'all')
-    self.request.get('filename').AndReturn('')
-    self.request.get_all('install_types').AndReturn(install_types)
-    self.request.get_all('catalogs').AndReturn(catalogs)
-    for t in install_types:
-      mock_query.filter('install_types =', t)
-    for t in catalogs:
-      mock_query.filter('catalogs =', t)
-
-    mock_iter = self.mox.CreateMockAnything()
-    mock_query.__iter__().AndReturn(mock_iter)
-    mock_iter.next().AndReturn(mock_pkg)
-    mock_pkg.properties().AndReturn(mock_pkg_properties)
-    mock_iter.next().AndRaise(StopIteration)
-
-    self.response.out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-    pkgsinfo.plist.GetXmlStr(pkgs).AndReturn('XML')
-    self.response.out.write('XML')
-    self.response.headers['Content-Type'] = 'text/xml; charset=utf-8'
-
-    self.mox.ReplayAll()
-    self.c.get(None)
-    self.mox.VerifyAll()
-
   def testPutFailInputNotParseable(self):
     """Test put() with input that isn't parseable as a plist."""
     filename = 'pkgname.dmg'
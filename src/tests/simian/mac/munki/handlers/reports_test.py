@@ -397,6 +397,8 @@ class HandlersTest(test.RequestHandlerTest):
 
     self.mox.StubOutWithMock(reports.gae_util, 'BatchDatastoreOp')
     reports.gae_util.BatchDatastoreOp(reports.models.db.put, mox.IsA(list))
+    self.mox.StubOutWithMock(reports.models.InstallCountBucket, 'AddInstalls')
+    reports.models.InstallCountBucket.AddInstalls(mox.IsA(list))
 
     self.request.get_all('removals').AndReturn([])
     self.request.get_all('problem_installs').AndReturn([])
@@ -496,6 +498,8 @@ class HandlersTest(test.RequestHandlerTest):
 
     self.mox.StubOutWithMock(reports.gae_util, 'BatchDatastoreOp')
     reports.gae_util.BatchDatastoreOp(reports.models.db.put, mox.IsA(list))
+    self.mox.StubOutWithMock(reports.models.InstallCountBucket, 'AddInstalls')
+    reports.models.InstallCountBucket.AddInstalls(mox.IsA(list))
 
     self.request.get_all('removals').AndReturn([])
     self.request.get_all('problem_installs').AndReturn([])
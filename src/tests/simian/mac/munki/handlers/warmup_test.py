@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""warmup module tests."""
+
+import httplib
+import logging
+
+import mock
+import webtest
+
+from google.appengine.api import memcache
+
+from google.apputils import app
+from google.apputils import basetest
+
+from simian.mac import models
+from simian.mac.munki.handlers import warmup
+from tests.simian.mac.common import test
+from simian.mac.urls import app as gae_app
+
+
+class WarmupModuleTest(test.AppengineTest):
+
+  def setUp(self):
+    super(WarmupModuleTest, self).setUp()
+    self.testapp = webtest.TestApp(gae_app)
+
+  def testGet(self):
+    """Test get() caches catalogs, manifests and manifest modifications."""
+    models.Catalog(key_name='stable', _plist='<plist/>').put()
+    models.Manifest(key_name='stable', _plist='<plist/>').put()
+    models.SiteManifestModification(site='nyc', value='pkg').put()
+    memcache.flush_all()
+
+    with mock.patch.object(
+        models.ComputerSummaryShard, 'GetSummedCounters',
+        return_value=({'site|nyc': 1, 'track|stable': 1}, None)):
+      self.testapp.get('/_ah/warmup', status=httplib.OK)
+
+    self.assertTrue(memcache.get('mwg_Catalog_stable'))
+    self.assertTrue(memcache.get('mwg_Manifest_stable'))
+    self.assertTrue(memcache.get(
+        models.SiteManifestModification._GetMemcacheWrappedGetAllFilterKey(
+            (('site =', 'nyc'),))))
+
+  def testGetStepFailure(self):
+    """Test get() runs all steps when one fails."""
+    failing = mock.Mock(side_effect=ValueError, __name__='Failing')
+    passing = mock.Mock(__name__='Passing')
+
+    with mock.patch.object(warmup, 'WARMUP_STEPS', [failing, passing]):
+      with mock.patch.object(warmup.logging, 'exception') as log:
+        self.testapp.get('/_ah/warmup', status=httplib.OK)
+
+    passing.assert_called_once_with()
+    log.assert_called_once_with(mock.ANY, 'Failing')
+
+  def testImportHandlers(self):
+    """Test ImportHandlers() imports all string handlers."""
+    with mock.patch.object(warmup.webapp2, 'import_string') as import_string:
+      warmup.ImportHandlers()
+    import_string.assert_any_call('simian.mac.munki.handlers.catalogs.Catalogs')
+    import_string.assert_any_call('simian.mac.munki.handlers.warmup.Warmup')
+
+
+logging.basicConfig(filename='/dev/null')
+
+
+def main(unused_argv):
+  basetest.main()
+
+
+if __name__ == '__main__':
+  app.run()
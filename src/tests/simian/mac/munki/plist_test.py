@@ -78,6 +78,33 @@ class PlistModuleTest(mox.MoxTestBase):
     self.assertEqual('escaped', plist.EscapeString('notescaped'))
     self.mox.VerifyAll()
 
+  def testIterParseItemsArray(self):
+    """Test IterParseItems() with a top-level array, in small chunks."""
+    xml = ('%s<array>\n  <dict><key>name</key><string>foo</string></dict>\n'
+           '  <dict><key>name</key><string>bar</string>'
+           '<key>v</key><array><integer>1</integer></array></dict>\n'
+           '</array>%s' % (plist.PLIST_HEAD, plist.PLIST_FOOT))
+    items = list(plist.IterParseItems(xml, chunk_size=7))
+    self.assertEqual([{'name': 'foo'}, {'name': 'bar', 'v': [1]}], items)
+
+  def testIterParseItemsPath(self):
+    """Test IterParseItems() with a path to a nested dict."""
+    xml = ('%s<dict><key>CatalogVersion</key><integer>2</integer>'
+           '<key>Products</key><dict>'
+           '<key>041-0001</key><dict><key>PostDate</key><string>a</string>'
+           '</dict><key>041-0002</key><dict/>'
+           '</dict></dict>%s' % (plist.PLIST_HEAD, plist.PLIST_FOOT))
+    items = sorted(plist.IterParseItems(xml, path=('Products',)))
+    self.assertEqual(
+        [('041-0001', {'PostDate': 'a'}), ('041-0002', {})], items)
+
+  def testIterParseItemsMalformed(self):
+    """Test IterParseItems() with XML that is not well-formed."""
+    xml = '%s<array><string>foo</string>' % plist.PLIST_HEAD
+    items = plist.IterParseItems(xml)
+    self.assertEqual('foo', items.next())
+    self.assertRaises(plist.MalformedPlistError, list, items)
+
 
 class ApplePlistTest(mox.MoxTestBase):
 
@@ -109,6 +136,17 @@ class ApplePlistTest(mox.MoxTestBase):
     self.assertRaises(plist.MalformedPlistError, self.apl.Parse)
     self.mox.VerifyAll()
 
+  def testParseWithoutValidateOrEncodeXml(self):
+    """Test Parse() with validation and re-encoding skipped."""
+    self.mox.StubOutWithMock(self.apl, 'Validate')
+    self.mox.StubOutWithMock(self.apl, 'EncodeXml')
+    self.apl.LoadPlist('%s<dict/>%s' % (plist.PLIST_HEAD, plist.PLIST_FOOT))
+
+    self.mox.ReplayAll()
+    self.apl.Parse(validate=False, encode_xml=False)
+    self.assertEqual({}, self.apl.GetContents())
+    self.mox.VerifyAll()
+
   def testParseDate(self):
     """Test _ParseDate()."""
     mock_dt = 'dt'
@@ -872,6 +910,57 @@ AAAAAAAAfA==""")
     self.apl.SetContents(d)
     self.assertEqual(self.apl._plist, d, str(self.apl._plist))
 
+  def testCopy(self):
+    """Test copy() shares contents copy-on-write."""
+    self.apl.LoadPlist(
+        '%s<dict><key>foo</key><array><string>bar</string></array>'
+        '<key>name</key><string>baz</string></dict>%s' % (
+            plist.PLIST_HEAD, plist.PLIST_FOOT))
+    self.apl.Parse()
+    copied = self.apl.copy()
+    self.assertTrue(copied._plist is self.apl._plist)
+
+    self.assertEqual('baz', copied['name'])
+    self.assertTrue(copied._plist is self.apl._plist)
+
+    copied['foo'].append('zoo')
+    copied['name'] = 'new'
+    self.assertEqual({'foo': ['bar', 'zoo'], 'name': 'new'}, copied._plist)
+    self.assertEqual({'foo': ['bar'], 'name': 'baz'}, self.apl.GetContents())
+
+  def testIsDirty(self):
+    """Test IsDirty()."""
+    self.apl.LoadPlist(
+        '%s<dict><key>foo</key><array><string>bar</string></array>'
+        '<key>name</key><string>baz</string></dict>%s' % (
+            plist.PLIST_HEAD, plist.PLIST_FOOT))
+    self.apl.Parse()
+    self.assertFalse(self.apl.IsDirty())
+    self.assertEqual('baz', self.apl['name'])
+    self.assertTrue('foo' in self.apl)
+    self.apl.GetXml()
+    self.assertFalse(self.apl.IsDirty())
+    self.apl['foo'].append('zoo')
+    self.assertTrue(self.apl.IsDirty())
+
+  def testCopyWhenDirty(self):
+    """Test copy() does not share contents which may be referenced."""
+    self.apl.LoadPlist('%s<dict/>%s' % (plist.PLIST_HEAD, plist.PLIST_FOOT))
+    self.apl.Parse()
+    contents = self.apl.GetContents()
+    copied = self.apl.copy()
+    contents['foo'] = 'bar'
+    self.assertTrue(copied.IsDirty())
+    self.assertEqual({}, copied.GetContents())
+
+  def testCopyContents(self):
+    """Test CopyContents()."""
+    d = {'foo': [{'bar': 1}], 'dt': datetime.datetime(2010, 1, 1)}
+    copied = plist.CopyContents(d)
+    self.assertEqual(d, copied)
+    self.assertFalse(copied['foo'] is d['foo'])
+    self.assertFalse(copied['foo'][0] is d['foo'][0])
+
   def testEqual(self):
     """Tests Equal()."""
     pl = plist.ApplePlist()
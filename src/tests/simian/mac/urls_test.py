@@ -22,12 +22,14 @@ import re
 import types
 
 import tests.appenginesdk
+import mock
 import mox
 import stubout
 
 from google.apputils import app
 from google.apputils import basetest
 from simian.mac import urls
+from simian.mac.common import rpc_stats
 
 
 class SimianMainModuleTest(mox.MoxTestBase):
@@ -55,6 +57,7 @@ class SimianMainModuleTest(mox.MoxTestBase):
       o.set_by_test_hook = 1
       o.args = args
       o.kwargs = kwargs
+      o.router = mock.Mock()
       return o
 
     self.stubs.Set(
@@ -71,11 +74,15 @@ class SimianMainModuleTest(mox.MoxTestBase):
 
     for (regex, cls) in app.args[0]:
       _ = re.compile(regex)
+      if isinstance(cls, basestring):
+        cls = urls.webapp2.import_string(cls)
       self.assertTrue(issubclass(cls, urls.webapp2.RequestHandler))
 
     if 'debug' in app.kwargs:
       self.assertTrue(type(app.kwargs['debug']) is types.BooleanType)
 
+    app.router.set_dispatcher.assert_called_once_with(rpc_stats._Dispatch)
+
     self.mox.VerifyAll()
 
 
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""fleet_simulator module tests."""
+
+import datetime
+import random
+
+import mock
+
+from google.appengine.api import datastore
+from google.appengine.ext import testbed
+
+from google.apputils import basetest
+
+from simian.mac import models
+from simian.mac.munki import plist
+from simian.util import fleet_simulator
+from tests.simian.mac.common import test
+
+
+MANIFEST_XML = '%s%s%s' % (
+    plist.PLIST_HEAD,
+    '<dict><key>catalogs</key><array><string>stable</string></array>'
+    '<key>managed_installs</key><array><string>testpackage</string></array>'
+    '</dict>',
+    plist.PLIST_FOOT)
+
+
+class FleetSimulatorModuleTest(basetest.TestCase):
+
+  def testGetArrivalTimes(self):
+    """Test GetArrivalTimes()."""
+    rand = random.Random(1)
+    self.assertEqual(
+        [0.0, 2.5, 5.0, 7.5],
+        fleet_simulator.GetArrivalTimes('uniform', 4, 10, rand))
+    self.assertEqual(
+        [0.0] * 3, fleet_simulator.GetArrivalTimes('burst', 3, 10, rand))
+    times = fleet_simulator.GetArrivalTimes('poisson', 1000, 100, rand)
+    self.assertEqual(sorted(times), times)
+    self.assertTrue(80 < times[-1] < 120)
+    self.assertRaises(
+        fleet_simulator.Error,
+        fleet_simulator.GetArrivalTimes, 'foo', 1, 1, rand)
+
+  def testFleetStats(self):
+    """Test FleetStats summaries."""
+    stats = fleet_simulator.FleetStats()
+    for ms in xrange(1, 101):
+      stats.Record('manifest', ms, 10, error=(ms == 100))
+    stats.RecordRun('completed')
+
+    summary = stats.Summary()
+    self.assertEqual(1, len(summary))
+    self.assertEqual(100, summary[0]['count'])
+    self.assertEqual(1, summary[0]['errors'])
+    self.assertEqual(50, summary[0]['p50_ms'])
+    self.assertEqual(99, summary[0]['p99_ms'])
+    self.assertEqual(10, summary[0]['avg_bytes'])
+    self.assertIn('manifest', stats.Format())
+
+
+@mock.patch.object(fleet_simulator.client.time, 'sleep')
+class FleetSimulatorTest(test.AppengineTest):
+
+  def setUp(self):
+    super(FleetSimulatorTest, self).setUp()
+    # preflight reports defer to queues defined in queue.yaml.
+    self.testbed.init_taskqueue_stub(root_path='src/simian/mac')
+    pkginfo = open(
+        'src/tests/simian/mac/common/testdata/testpackage.plist').read()
+    blob = self.testbed.get_stub(testbed.BLOBSTORE_SERVICE_NAME).CreateBlob(
+        'blobkey', 'package contents')
+    blob['creation'] = datetime.datetime(2017, 1, 1)
+    datastore.Put(blob)
+    models.PackageInfo(
+        key_name='testpackage.dmg', filename='testpackage.dmg',
+        _plist=pkginfo, catalogs=['stable'], manifests=['stable'],
+        blobstore_key='blobkey').put()
+    models.Catalog(
+        key_name='stable',
+        _plist='%s<array>%s</array>%s' % (
+            plist.PLIST_HEAD,
+            pkginfo[pkginfo.index('<dict>'):pkginfo.rindex('</dict>') + 7],
+            plist.PLIST_FOOT)).put()
+    models.Manifest(key_name='stable', _plist=MANIFEST_XML).put()
+
+  def _Run(self, **kwargs):
+    simulator = fleet_simulator.FleetSimulator(
+        'http://localhost', clients=10, concurrency=3, duration=0,
+        transport=fleet_simulator.TestbedTransport(), seed=1, **kwargs)
+    return simulator.Run()
+
+  def testRun(self, *_):
+    """Test Run() drives clients through all steps."""
+    stats = self._Run(install_report_items=3)
+
+    self.assertEqual(10, stats.completed)
+    summary = dict((row['step'], row) for row in stats.Summary())
+    self.assertEqual(fleet_simulator.STEPS, [
+        s for s in fleet_simulator.STEPS if s in summary])
+    for row in summary.itervalues():
+      self.assertEqual(10, row['count'])
+    self.assertEqual(10, models.Computer.all().count())
+    self.assertEqual(30, models.InstallLog.all().count())
+
+  def testRunWithFailures(self, *_):
+    """Test Run() with injected request failures and abandoned runs."""
+    stats = self._Run(failure_rate=0.5, abandon_rate=0.5)
+
+    self.assertEqual(10, stats.clients)
+    self.assertTrue(stats.failed)
+    self.assertEqual(
+        10, stats.completed + stats.failed + stats.abandoned + stats.exited)
+    self.assertTrue(sum(row['errors'] for row in stats.Summary()))
+
+
+if __name__ == '__main__':
+  basetest.main()